@@ -3,20 +3,40 @@ Integrated Flask + WebSocket Server
 รัน Flask Backend และ WebSocket Server พร้อมกัน
 """
 
-from flask import Flask, request, jsonify, send_from_directory
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, request, jsonify, send_from_directory
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 import logging
 import os
+import io
+import csv
+import json
+import atexit
 import threading
 import asyncio
 import time
 
 # Import modules
 from database import get_database
-from websocket_server import BLEWebSocketServer
+from websocket_server import BLEWebSocketServer, SECRET_KEY
 from trilateration_algorithm import TrilaterationCalculator
-from kalman_filter import KalmanFilter
+from trajectory_smoother import TrajectorySmoother
+from write_behind import WriteBehindWriter
+from async_database import AsyncDatabase
+from reading_archive import ReadingArchive
+from gateway_registry import GatewayRegistry
+from position_rollup import PositionRollup
+from geofence import ZoneIndex, GeofenceEngine
+from retention import RetentionWorker
+from tracking_engine import TrackingEngine
+from sharded_tracking import ShardedTrackingEngine
+from position_frames import FramePublisher
+from client_outbox import ClientOutbox
+from static_assets import StaticAssets
+from snapshot_cache import SnapshotCache
+from event_stream import EventStream, format_event
+from gateway_status import GatewayStatusMonitor
+from latency_trace import LatencyTracker
 from auth import AuthManager
 
 # Setup logging
@@ -32,11 +52,30 @@ app.config['SECRET_KEY'] = 'ble-trilateration-secret-key'
 CORS(app)
 
 # Initialize SocketIO (สำหรับ Frontend)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# threading (ค่าเริ่มต้น) หรือ eventlet เมื่อรันผ่าน eventlet_server.py
+ASYNC_MODE = os.environ.get('BLE_ASYNC_MODE', 'threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
 
 # Initialize Database
 db = get_database()
 
+# Initialize Gateway Registry (invalidate ตาม db.gateway_version)
+gateway_registry = GatewayRegistry(db)
+
+# Initialize Zone Index (spatial index ของโซน invalidate ตาม db.zone_version)
+zone_index = ZoneIndex(db)
+
+# Initialize Position Rollups (อัปเดตทุกครั้งที่บันทึกตำแหน่ง)
+position_rollup = PositionRollup(db, zone_index=zone_index)
+
+# Initialize Geofence Engine (ส่ง enter/exit events ไปยัง Frontend)
+geofence = GeofenceEngine(zone_index, on_event=lambda event: socketio.emit('zone_event', event))
+
+# Initialize Position Writer (batch insert ลง position_history)
+position_writer = WriteBehindWriter(db.add_positions, name="position-writer")
+position_writer.start()
+atexit.register(position_writer.stop)
+
 # Initialize Auth Manager
 auth_manager = AuthManager()
 
@@ -44,18 +83,68 @@ auth_manager = AuthManager()
 ws_server = BLEWebSocketServer(
     host="0.0.0.0",
     port=8012,
-    secret_key="ble-kku-secret-key-2025"
+    secret_key=SECRET_KEY
 )
 
+# Initialize Async Database (DB thread สำหรับ coroutine ของ WebSocket Server)
+async_db = AsyncDatabase(db)
+async_db.start()
+atexit.register(async_db.stop)
+
+# Initialize Raw Reading Archive (readings ใน loop tick เดียวกันถูก insert เป็น batch เดียว)
+reading_archive = ReadingArchive(db, partition="day")
+ws_server.persist_reading = lambda reading: async_db.write(reading_archive.insert_readings, reading)
+
+# Initialize Retention Worker (เริ่มทำงานตอนรัน server)
+retention_worker = RetentionWorker(db, days=7, archive=reading_archive, archive_days=30)
+
 # Initialize Trilateration Calculator
 trilateration = TrilaterationCalculator()
 
-# Initialize Kalman Filter
-kalman_filter = KalmanFilter()
+# Initialize Client Outbox (คิวขาออกต่อ client: เก็บเฉพาะ state ล่าสุดต่อ key, ตัด client ที่ช้าเกินไป)
+client_outbox = ClientOutbox(socketio)
+client_outbox.start()
+atexit.register(client_outbox.stop)
+
+# Initialize Tracking Engine (thread เดียวคำนวณทุก Tag ทุกชั้น เริ่มทำงานตอนรัน server)
+# BLE_TRACKING_WORKERS > 0: แบ่ง Tags ให้ positioning worker processes ตาม consistent hashing บน tag_mac
+TRACKING_WORKERS = int(os.environ.get('BLE_TRACKING_WORKERS', '0'))
+if TRACKING_WORKERS > 0:
+    tracking_engine = ShardedTrackingEngine(ws_server, gateway_registry, workers=TRACKING_WORKERS,
+                                            interval=2.0, calculator=trilateration)
+else:
+    tracking_engine = TrackingEngine(ws_server, gateway_registry, interval=2.0, calculator=trilateration)
+atexit.register(tracking_engine.stop)
+
+# Initialize Latency Tracker (latency ของแต่ละ stage ตั้งแต่ Gateway ถึงตำแหน่งที่ส่งออก แยกตามชั้น)
+latency_tracker = LatencyTracker(
+    floor_of=lambda gateway_mac: (gateway_registry.get_gateway(gateway_mac) or {}).get('floor'))
+ws_server.latency = latency_tracker
+tracking_engine.latency = latency_tracker
+
+# Initialize Frame Publisher (frame mode: หนึ่ง message ต่อชั้นต่อรอบ แบบ delta)
+frame_publisher = FramePublisher(
+    lambda event, data, sids: client_outbox.send(event, data, key=(event, data['f']), to=sids))
+
+# Initialize Trajectory Smoother (สำหรับรายงานย้อนหลัง)
+trajectory_smoother = TrajectorySmoother()
+
+# ID ของ process นี้ (ETag ที่อิง gateway_version และ ID ของ SSE events ต้องไม่ซ้ำกันหลัง restart)
+INSTANCE_ID = os.urandom(4).hex()
 
-# Global state
-tracking_active = False
-tracking_thread = None
+# Initialize Event Stream (SSE ของตำแหน่งและสถานะ Gateway พร้อม replay buffer)
+event_stream = EventStream(buffer_size=10000, instance=INSTANCE_ID)
+
+# Initialize Gateway Status Monitor (แจ้ง online/offline ผ่าน event stream, เริ่มทำงานตอนรัน server)
+gateway_monitor = GatewayStatusMonitor(ws_server, gateway_registry)
+gateway_monitor.on_change = lambda status: event_stream.publish('gateway_status', status, floor=status['floor'])
+
+# Initialize Static Assets (โหลดไฟล์ frontend และบีบอัดไว้ล่วงหน้าตอนเริ่ม server)
+FRONTEND_PATH = os.path.join(os.path.dirname(__file__), '..', 'frontend')
+static_assets = StaticAssets(FRONTEND_PATH)
+
+# Initialize Receiver Snapshot Cache (response ของ /api/receiver/* สร้างใหม่ไม่บ่อยกว่าทุก 250 ms)
+receiver_cache = SnapshotCache(ttl_ms=250)
 
 
 # ==================== Static Files ====================
@@ -63,15 +152,16 @@ tracking_thread = None
 @app.route('/')
 def index():
     """Serve frontend"""
-    frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend')
-    return send_from_directory(frontend_path, 'index.html')
+    return serve_static('index.html')
 
 
 @app.route('/<path:filename>')
 def serve_static(filename):
-    """Serve static files"""
-    frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend')
-    return send_from_directory(frontend_path, filename)
+    """Serve static files (จากหน่วยความจำพร้อม ETag, ไฟล์ที่เพิ่มหลังเริ่ม server อ่านจากดิสก์)"""
+    response = static_assets.response(filename, request)
+    if response is None:
+        response = send_from_directory(FRONTEND_PATH, filename)
+    return response
 
 
 # ==================== Authentication API ====================
@@ -151,20 +241,29 @@ def verify_token():
 
 @app.route('/api/gateways', methods=['GET'])
 def get_gateways():
-    """ดึงรายการ Gateways ทั้งหมด"""
+    """ดึงรายการ Gateways ทั้งหมด (ETag ตาม gateway_version: ตอบ 304 ถ้าไม่มีการเปลี่ยนแปลง)"""
     try:
         floor = request.args.get('floor', type=int)
         
+        etag = f"gw-{INSTANCE_ID}-{gateway_registry.version}-{'all' if floor is None else floor}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
         if floor is not None:
-            gateways = db.get_gateways_by_floor(floor)
+            gateways = gateway_registry.get_floor(floor).gateways
         else:
-            gateways = db.get_all_gateways()
+            gateways = gateway_registry.get_all_gateways()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'gateways': gateways,
             'count': len(gateways)
         })
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
         
     except Exception as e:
         logger.error(f"Error getting gateways: {e}", exc_info=True)
@@ -209,34 +308,116 @@ def add_gateway():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+GATEWAY_EXPORT_COLUMNS = ('mac_address', 'floor', 'x', 'y', 'name', 'description')
+
+
+@app.route('/api/gateways/export', methods=['GET'])
+def export_gateways():
+    """Export Gateways ทั้งหมดเป็น JSON หรือ CSV (query: format)"""
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'csv'):
+        return jsonify({'success': False, 'error': "format must be 'json' or 'csv'"}), 400
+
+    gateways = [{name: gw[name] for name in GATEWAY_EXPORT_COLUMNS}
+                for gw in gateway_registry.get_all_gateways()]
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=GATEWAY_EXPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(gateways)
+        body, mimetype = buffer.getvalue(), 'text/csv'
+    else:
+        body, mimetype = json.dumps({'gateways': gateways}, ensure_ascii=False, indent=2), 'application/json'
+
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=gateways.{export_format}'
+    })
+
+
+@app.route('/api/gateways/import', methods=['POST'])
+def import_gateways():
+    """
+    Import Gateways หลายรายการใน transaction เดียว
+    รับ JSON (list หรือ {"gateways": [...]}), CSV ใน body (text/csv) หรือไฟล์ในฟิลด์ 'file'
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            text = upload.read().decode('utf-8-sig')
+            if upload.filename.lower().endswith('.json'):
+                data = json.loads(text)
+            else:
+                data = list(csv.DictReader(io.StringIO(text)))
+        elif request.is_json:
+            data = request.get_json()
+        else:
+            data = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+
+        if isinstance(data, dict):
+            data = data.get('gateways', [])
+        if not isinstance(data, list):
+            return jsonify({'success': False, 'error': 'Expected a list of gateways'}), 400
+
+        result = db.upsert_gateways(data)
+
+        return jsonify({
+            'success': True,
+            'count': len(data),
+            **result
+        })
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error importing gateways: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ==================== BLE Data Receiver API ====================
 
+def receiver_snapshot(build_payload, params=()) -> Response:
+    """
+    ส่ง snapshot ของ endpoint ปัจจุบัน (key = path + query parameters ที่ endpoint ใช้) ที่ serialize ไว้แล้ว
+    สร้างใหม่เมื่อมี reading ใหม่หรือจำนวน Gateway ที่เชื่อมต่อเปลี่ยน แต่ไม่บ่อยกว่า ttl ของ cache
+
+    Query parameters อื่น (เช่น cache-buster ?_=<timestamp>) ไม่มีผลต่อ key
+    """
+    key = (request.path,) + tuple(request.args.get(name) for name in params)
+    generation = (ws_server.generation, len(ws_server.clients))
+    body = receiver_cache.get(key, generation, lambda: app.json.dumps(build_payload()).encode())
+    return Response(body, mimetype='application/json')
+
+
 @app.route('/api/receiver/test', methods=['GET'])
 def test_receiver():
     """ทดสอบ BLE Data Receiver"""
     try:
-        # ดึงข้อมูลจาก WebSocket Server
-        latest_data = ws_server.get_latest_data()
-        statistics = ws_server.get_statistics()
-        
-        # แปลงเป็น list
-        combined_data = [
-            {
-                'gateway_mac': data['gateway_mac'],
-                'rssi': data['rssi'],
-                'distance': data['distance'],
-                'count': 1
+        def build():
+            # ดึงข้อมูลจาก WebSocket Server
+            latest_data = ws_server.get_latest_data()
+            statistics = ws_server.get_statistics()
+            
+            # แปลงเป็น list
+            combined_data = [
+                {
+                    'gateway_mac': data['gateway_mac'],
+                    'rssi': data['rssi'],
+                    'distance': data['distance'],
+                    'count': 1
+                }
+                for data in list(latest_data.values())
+            ]
+            
+            return {
+                'success': True,
+                'gateway_count': len(combined_data),
+                'data': combined_data[:10],  # แสดงแค่ 10 ตัวแรก
+                'target_visible': len(combined_data) > 0,
+                'statistics': statistics
             }
-            for data in latest_data.values()
-        ]
         
-        return jsonify({
-            'success': True,
-            'gateway_count': len(combined_data),
-            'data': combined_data[:10],  # แสดงแค่ 10 ตัวแรก
-            'target_visible': len(combined_data) > 0,
-            'statistics': statistics
-        })
+        return receiver_snapshot(build)
         
     except Exception as e:
         logger.error(f"Error testing receiver: {e}", exc_info=True)
@@ -247,19 +428,22 @@ def test_receiver():
 def get_rssi_data():
     """ดึงข้อมูล RSSI จาก Receiver"""
     try:
-        latest_data = ws_server.get_latest_data()
-        
-        rssi_data = {
-            gw_mac: data['rssi']
-            for gw_mac, data in latest_data.items()
-        }
+        def build():
+            latest_data = ws_server.get_latest_data()
+            
+            rssi_data = {
+                gw_mac: data['rssi']
+                for gw_mac, data in list(latest_data.items())
+            }
+            
+            return {
+                'success': True,
+                'rssi_data': rssi_data,
+                'gateway_count': len(rssi_data),
+                'target_visible': len(rssi_data) > 0
+            }
         
-        return jsonify({
-            'success': True,
-            'rssi_data': rssi_data,
-            'gateway_count': len(rssi_data),
-            'target_visible': len(rssi_data) > 0
-        })
+        return receiver_snapshot(build)
         
     except Exception as e:
         logger.error(f"Error getting RSSI data: {e}", exc_info=True)
@@ -270,213 +454,484 @@ def get_rssi_data():
 
 @app.route('/api/position/calculate', methods=['POST'])
 def calculate_position():
-    """คำนวณตำแหน่งจากข้อมูล RSSI"""
+    """ดึงตำแหน่งล่าสุดที่ Tracking Engine คำนวณได้ (body: tag_mac optional, floor optional)"""
     try:
-        data = request.get_json()
-        floor = data.get('floor', 5)
+        data = request.get_json(silent=True) or {}
+        tag_mac = data.get('tag_mac')
+        floor = data.get('floor')
         
-        # ดึงข้อมูลจาก WebSocket Server
-        latest_data = ws_server.get_latest_data()
-        combined_data = list(latest_data.values())
+        if tag_mac:
+            position = tracking_engine.get_position(tag_mac)
+            positions = [position] if position and (floor is None or position['floor'] == floor) else []
+        else:
+            positions = tracking_engine.get_positions(floor)
         
-        if len(combined_data) < 3:
+        if not positions:
             return jsonify({
                 'success': False,
-                'error': f'Not enough gateways (found {len(combined_data)}, need at least 3)'
-            }), 400
+                'error': 'No position available (tag not seen by at least 3 registered gateways)'
+            }), 404
         
-        # ดึงข้อมูล Gateway จากฐานข้อมูล
-        registered_gateways = db.get_gateways_by_floor(floor)
+        results = [{
+            'tag_mac': pos['tag_mac'],
+            'position': {
+                'floor': pos['floor'],
+                'x': round(pos['x'], 2),
+                'y': round(pos['y'], 2),
+                'raw_x': round(pos['raw_x'], 2),
+                'raw_y': round(pos['raw_y'], 2)
+            },
+            'gateway_count': pos['gateway_count'],
+            'confidence': pos['confidence'],
+            'timestamp': pos['timestamp']
+        } for pos in positions]
         
-        if len(registered_gateways) < 3:
-            return jsonify({
-                'success': False,
-                'error': f'Not enough registered gateways on floor {floor} (found {len(registered_gateways)}, need at least 3)'
-            }), 400
+        if tag_mac:
+            return jsonify({'success': True, **results[0]})
+        return jsonify({'success': True, 'positions': results, 'count': len(results)})
         
-        # สร้าง dict สำหรับ lookup ตำแหน่ง Gateway
-        gateway_positions = {
-            gw['mac_address']: (gw['x'], gw['y'])
-            for gw in registered_gateways
-        }
+    except Exception as e:
+        logger.error(f"Error calculating position: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ==================== Position History API ====================
+
+@app.route('/api/positions/<tag_mac>/history', methods=['GET'])
+def get_position_history(tag_mac):
+    """ดึงประวัติตำแหน่งของ Tag ทีละหน้า (keyset pagination)"""
+    try:
+        start_time = request.args.get('from', type=float)
+        end_time = request.args.get('to', type=float)
+        cursor = request.args.get('cursor')
+        limit = max(1, min(request.args.get('limit', 1000, type=int), 10000))
+        include_rssi = request.args.get('include_rssi', '0') == '1'
         
-        # เตรียมข้อมูลสำหรับ Trilateration
-        anchors = []
-        distances = []
+        page = db.get_position_page(tag_mac, start_time, end_time, cursor, limit)
+        columns = page['columns']
         
-        for item in combined_data:
-            gateway_mac = item['gateway_mac']
-            distance = item['distance']
-            
-            if gateway_mac in gateway_positions:
-                x, y = gateway_positions[gateway_mac]
-                anchors.append((x, y))
-                distances.append(distance)
+        if include_rssi:
+            columns['rssi_data'] = list(columns['rssi_data'])
+        else:
+            del columns['rssi_data']
         
-        if len(anchors) < 3:
-            return jsonify({
-                'success': False,
-                'error': f'Not enough matching gateways (found {len(anchors)}, need at least 3)'
-            }), 400
+        return jsonify({
+            'success': True,
+            'tag_mac': tag_mac.replace(":", "").upper(),
+            'count': len(columns['id']),
+            'columns': columns,
+            'next_cursor': page['next_cursor']
+        })
         
-        # คำนวณตำแหน่งด้วย Trilateration
-        position = trilateration.calculate_position_2d(anchors, distances)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid cursor: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error getting position history: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/positions/<tag_mac>/rollup', methods=['GET'])
+def get_position_rollup(tag_mac):
+    """ดึงข้อมูลสรุปตำแหน่งของ Tag ตามช่วงเวลา (เลือก rollup ที่เหมาะสมอัตโนมัติ)"""
+    try:
+        end_time = request.args.get('to', time.time(), type=float)
+        start_time = request.args.get('from', end_time - 86400, type=float)
+        resolution = request.args.get('resolution', 3600, type=int)
         
-        if position is None:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to calculate position (trilateration failed)'
-            }), 500
+        result = position_rollup.query(tag_mac, start_time, end_time, resolution)
         
-        x, y = position
+        return jsonify({
+            'success': True,
+            'tag_mac': tag_mac.replace(":", "").upper(),
+            **result
+        })
         
-        # Apply Kalman Filter
-        filtered_x, filtered_y = kalman_filter.update(x, y)
+    except Exception as e:
+        logger.error(f"Error getting position rollup: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/positions/<tag_mac>/smoothed', methods=['GET'])
+def get_smoothed_track(tag_mac):
+    """ดึงเส้นทางย้อนหลังของ Tag ที่ผ่าน RTS smoothing"""
+    try:
+        start_time = request.args.get('from', type=float)
+        end_time = request.args.get('to', type=float)
+        floor = request.args.get('floor', type=int)
         
-        # บันทึกลงฐานข้อมูล
-        db.add_position(
-            floor=floor,
-            x=filtered_x,
-            y=filtered_y,
-            gateway_count=len(anchors)
-        )
+        result = trajectory_smoother.smooth_tag(db, tag_mac, start_time, end_time, floor)
         
         return jsonify({
             'success': True,
-            'position': {
-                'floor': floor,
-                'x': round(filtered_x, 2),
-                'y': round(filtered_y, 2),
-                'raw_x': round(x, 2),
-                'raw_y': round(y, 2)
-            },
-            'gateway_count': len(anchors),
-            'confidence': min(len(anchors) / 10.0, 1.0)
+            'tag_mac': tag_mac.replace(":", "").upper(),
+            'count': len(result['x']),
+            'track': {
+                'timestamp': result['timestamp'].tolist(),
+                'floor': result['floor'].tolist(),
+                'x': result['x'].round(2).tolist(),
+                'y': result['y'].round(2).tolist(),
+                'vx': result['vx'].round(3).tolist(),
+                'vy': result['vy'].round(3).tolist(),
+                'segment': result['segment'].tolist()
+            }
         })
         
     except Exception as e:
-        logger.error(f"Error calculating position: {e}", exc_info=True)
+        logger.error(f"Error smoothing track: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+EXPORT_COLUMNS = ('tag_mac', 'timestamp', 'floor', 'x', 'y', 'confidence', 'gateway_count')
+
+
+@app.route('/api/positions/export', methods=['GET'])
+def export_positions():
+    """
+    Export ตำแหน่งของหลาย Tag แบบ streaming (NDJSON หรือ CSV)
+    query: tags (คั่นด้วย ,), floor, from, to, interval (decimation วินาที), format (ndjson/csv)
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'success': False, 'error': "format must be 'ndjson' or 'csv'"}), 400
+
+    tags = [tag for tag in request.args.get('tags', '').split(',') if tag]
+    chunks = db.iter_positions(
+        tag_macs=tags or None,
+        floor=request.args.get('floor', type=int),
+        start_time=request.args.get('from', type=float),
+        end_time=request.args.get('to', type=float),
+        min_interval=request.args.get('interval', type=float)
+    )
+
+    def generate_ndjson():
+        for rows in chunks:
+            yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(',', ':')) + '\n'
+                          for row in rows)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    if export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=positions.{export_format}'
+    })
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events ของตำแหน่ง ('position') และสถานะ Gateway ('gateway_status')
+    query: floors (คั่นด้วย ,), tags (คั่นด้วย ,), types (position,gateway_status)
+    ต่อจากเดิมได้ด้วย header Last-Event-ID (หรือ query last_event_id)
+    ID ที่ไม่รู้จัก (เช่น ก่อน server restart) ได้รับ event 'gap' แล้วตามด้วยสถานะปัจจุบัน
+    """
+    try:
+        floors = [int(floor) for floor in request.args.get('floors', '').split(',') if floor]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'floors must be integers'}), 400
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or None
+    tags = [tag for tag in request.args.get('tags', '').split(',') if tag]
+    types = [t for t in request.args.get('types', '').split(',') if t]
+    
+    # สถานะปัจจุบันของ Gateways สำหรับ client ใหม่หรือ client ที่ resume ไม่ได้ครบ (ไม่มี ID จึงไม่กระทบการ resume)
+    initial = []
+    if not types or 'gateway_status' in types:
+        initial = [format_event('gateway_status', status) for status in gateway_monitor.get_status()
+                   if (not floors and not tags) or status['floor'] in floors]
+    
+    return Response(event_stream.subscribe(floors, tags, types, last_event_id, initial),
+                    mimetype='text/event-stream', headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+# ==================== Metrics API ====================
+
+@app.route('/api/metrics/writers', methods=['GET'])
+def get_writer_metrics():
+    """ดึง metrics ของ write-behind writers และ async DB thread"""
+    return jsonify({
+        'success': True,
+        'writers': {
+            position_writer.name: position_writer.get_metrics(),
+            async_db.name: async_db.get_metrics()
+        }
+    })
+
+
+@app.route('/api/metrics/retention', methods=['GET'])
+def get_retention_metrics():
+    """ดึงสถานะของ retention worker"""
+    return jsonify({
+        'success': True,
+        'retention': retention_worker.get_statistics()
+    })
+
+
+@app.route('/api/metrics/tracking', methods=['GET'])
+def get_tracking_metrics():
+    """ดึงสถิติของ tracking engine"""
+    return jsonify({
+        'success': True,
+        'tracking': tracking_engine.get_statistics(),
+        'frames': frame_publisher.get_statistics()
+    })
+
+
+@app.route('/api/tracking/workers', methods=['POST'])
+def resize_tracking_workers():
+    """ปรับจำนวน positioning workers (เฉพาะเมื่อรันด้วย BLE_TRACKING_WORKERS)"""
+    if not isinstance(tracking_engine, ShardedTrackingEngine):
+        return jsonify({
+            'success': False,
+            'error': 'Tracking engine is not sharded (set BLE_TRACKING_WORKERS)'
+        }), 400
+
+    data = request.get_json() or {}
+    try:
+        count = int(data['workers'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Missing or invalid field: workers'
+        }), 400
+
+    if not 1 <= count <= tracking_engine.max_workers:
+        return jsonify({
+            'success': False,
+            'error': f'workers must be between 1 and {tracking_engine.max_workers}'
+        }), 400
+
+    try:
+        workers = tracking_engine.resize(count)
+        return jsonify({
+            'success': True,
+            'workers': workers,
+            'tracking': tracking_engine.get_statistics()
+        })
+
+    except Exception as e:
+        logger.error(f"Error resizing tracking workers: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/metrics/clients', methods=['GET'])
+def get_client_metrics():
+    """ดึงความลึกของคิวขาออกและตัวนับ coalesce/drop ของแต่ละ frontend client"""
+    return jsonify({
+        'success': True,
+        'clients': client_outbox.get_metrics()
+    })
+
+
+@app.route('/api/metrics/receiver', methods=['GET'])
+def get_receiver_metrics():
+    """ดึงสถิติของ snapshot cache ของ /api/receiver/*"""
+    return jsonify({
+        'success': True,
+        'cache': receiver_cache.get_statistics()
+    })
+
+
+@app.route('/api/metrics/stream', methods=['GET'])
+def get_stream_metrics():
+    """ดึงสถิติของ SSE event stream"""
+    return jsonify({
+        'success': True,
+        'stream': event_stream.get_statistics()
+    })
+
+
+@app.route('/api/metrics/latency', methods=['GET'])
+def get_latency_metrics():
+    """ดึง latency ของแต่ละ stage (รวมและแยกตามชั้น) และ Gateways ที่นาฬิกาคลาดเคลื่อน"""
+    return jsonify({
+        'success': True,
+        'latency': latency_tracker.get_statistics()
+    })
+
+
+@app.route('/api/zones/state', methods=['GET'])
+def get_zone_state():
+    """ดึงรายการโซนที่แต่ละ Tag อยู่ข้างใน (query: tag_mac optional)"""
+    return jsonify({
+        'success': True,
+        'state': geofence.get_state(request.args.get('tag_mac')),
+        'statistics': geofence.get_statistics()
+    })
+
+
 # ==================== WebSocket Events (Frontend) ====================
 
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
+    client_outbox.register(request.sid)
     logger.info(f"Frontend client connected: {request.sid}")
     emit('connected', {'message': 'Connected to server'})
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    """Handle client disconnection"""
+    """Handle client disconnection (Socket.IO ลบ client ออกจาก rooms ให้เอง)"""
+    tracking_engine.unsubscribe(request.sid)
+    frame_publisher.unsubscribe(request.sid)
+    client_outbox.unregister(request.sid)
     logger.info(f"Frontend client disconnected: {request.sid}")
 
 
+def floor_room(floor) -> str:
+    """ชื่อ room ของชั้น"""
+    return f"floor:{floor}"
+
+
+def tag_room(tag_mac: str) -> str:
+    """ชื่อ room ของ Tag"""
+    return f"tag:{tag_mac}"
+
+
+def leave_rooms(subscription):
+    """ออกจาก rooms ของ subscription เดิม"""
+    floors, tag_macs = subscription
+    for floor in floors:
+        leave_room(floor_room(floor))
+    for tag_mac in tag_macs:
+        leave_room(tag_room(tag_mac))
+
+
 @socketio.on('start_tracking')
 def handle_start_tracking(data):
-    """เริ่มติดตามตำแหน่ง"""
-    global tracking_active, tracking_thread
-    
-    floor = data.get('floor', 5)
-    interval = data.get('interval', 2)  # วินาที
-    
-    if tracking_active:
-        emit('tracking_status', {'status': 'already_running'})
-        return
+    """
+    สมัครรับตำแหน่ง (การคำนวณทำโดย Tracking Engine)
+    data: floor (ชั้นเดียว), floors (list) และ/หรือ tags (list ของ tag_mac)
+          mode: 'frame' เพื่อรับชั้นเป็น position_frame (ต้องตอบ frame_ack) แทน position_update
+          gateways: true เพื่อรับ gateway_detail ของชั้น (เฉพาะ frame mode)
+    """
+    data = data or {}
+    floors = data.get('floors')
+    if floors is None:
+        floors = [data.get('floor', 5)] if not data.get('tags') else []
+    tag_macs = data.get('tags') or []
+    frame_mode = data.get('mode') == 'frame'
     
-    tracking_active = True
+    # frame mode: ชั้นส่งผ่าน frame publisher ส่วน tags ยังใช้ position_update
+    if frame_mode:
+        frame_publisher.subscribe(request.sid, floors, detail=bool(data.get('gateways')))
+    else:
+        frame_publisher.unsubscribe(request.sid)
     
-    def tracking_loop():
-        """Loop สำหรับติดตามตำแหน่ง"""
-        global tracking_active
-        
-        logger.info(f"Started tracking on floor {floor}")
-        
-        while tracking_active:
-            try:
-                # ดึงข้อมูลจาก WebSocket Server
-                latest_data = ws_server.get_latest_data()
-                combined_data = list(latest_data.values())
-                
-                if len(combined_data) < 3:
-                    socketio.emit('tracking_error', {
-                        'error': f'Not enough gateways (found {len(combined_data)})'
-                    })
-                    time.sleep(interval)
-                    continue
-                
-                # ดึงข้อมูล Gateway
-                registered_gateways = db.get_gateways_by_floor(floor)
-                gateway_positions = {
-                    gw['mac_address']: (gw['x'], gw['y'])
-                    for gw in registered_gateways
-                }
-                
-                # เตรียมข้อมูล
-                anchors = []
-                distances = []
-                
-                for item in combined_data:
-                    gateway_mac = item['gateway_mac']
-                    distance = item['distance']
-                    
-                    if gateway_mac in gateway_positions:
-                        x, y = gateway_positions[gateway_mac]
-                        anchors.append((x, y))
-                        distances.append(distance)
-                
-                if len(anchors) < 3:
-                    socketio.emit('tracking_error', {
-                        'error': f'Not enough matching gateways (found {len(anchors)})'
-                    })
-                    time.sleep(interval)
-                    continue
-                
-                # คำนวณตำแหน่ง
-                position = trilateration.calculate_position_2d(anchors, distances)
-                
-                if position:
-                    x, y = position
-                    filtered_x, filtered_y = kalman_filter.update(x, y)
-                    
-                    # บันทึกลงฐานข้อมูล
-                    db.add_position(floor=floor, x=filtered_x, y=filtered_y, gateway_count=len(anchors))
-                    
-                    # ส่งข้อมูลไปยัง Frontend
-                    socketio.emit('position_update', {
-                        'floor': floor,
-                        'x': round(filtered_x, 2),
-                        'y': round(filtered_y, 2),
-                        'gateway_count': len(anchors),
-                        'gateways': combined_data
-                    })
-                
-                time.sleep(interval)
-                
-            except Exception as e:
-                logger.error(f"Error in tracking loop: {e}", exc_info=True)
-                socketio.emit('tracking_error', {'error': str(e)})
-                time.sleep(interval)
-        
-        logger.info("Tracking stopped")
+    previous = tracking_engine.subscribe(request.sid, [] if frame_mode else floors, tag_macs)
+    leave_rooms(previous)
     
-    tracking_thread = threading.Thread(target=tracking_loop, daemon=True)
-    tracking_thread.start()
+    subscribed_floors, tag_macs = tracking_engine.get_subscription(request.sid)
+    for floor in subscribed_floors:
+        join_room(floor_room(floor))
+    for tag_mac in tag_macs:
+        join_room(tag_room(tag_mac))
     
-    emit('tracking_status', {'status': 'started'})
+    emit('tracking_status', {
+        'status': 'started',
+        'mode': 'frame' if frame_mode else 'update',
+        'floors': sorted(set(floors) if frame_mode else subscribed_floors),
+        'tags': sorted(tag_macs)
+    })
+
+
+@socketio.on('frame_ack')
+def handle_frame_ack(data):
+    """Client ยืนยันว่านำ position_frame ไปใช้แล้ว (data: f = ชั้น, s = ลำดับ frame)"""
+    try:
+        frame_publisher.ack(request.sid, int(data['f']), int(data['s']))
+    except (TypeError, KeyError, ValueError):
+        pass
 
 
 @socketio.on('stop_tracking')
 def handle_stop_tracking():
-    """หยุดติดตามตำแหน่ง"""
-    global tracking_active
-    
-    tracking_active = False
+    """ยกเลิกการรับตำแหน่ง"""
+    leave_rooms(tracking_engine.unsubscribe(request.sid))
+    frame_publisher.unsubscribe(request.sid)
     emit('tracking_status', {'status': 'stopped'})
 
 
+def publish_positions(positions):
+    """
+    รับตำแหน่งจาก Tracking Engine แต่ละรอบ: บันทึก, ตรวจ geofence และส่งให้ rooms ที่มี subscriber
+    (เรียกจาก engine thread)
+    """
+    for pos in positions:
+        position_writer.submit({
+            'tag_mac': pos['tag_mac'],
+            'floor': pos['floor'],
+            'x': pos['x'],
+            'y': pos['y'],
+            'confidence': pos['confidence'],
+            'gateway_count': pos['gateway_count'],
+            'rssi_data': {r['gateway_mac']: r['rssi'] for r in pos['gateways']},
+            'timestamp': pos['timestamp']
+        })
+    
+    # ตรวจสอบการเข้า/ออกโซน (emit zone_event)
+    geofence.process([(pos['tag_mac'], pos['floor'], pos['x'], pos['y'], pos['timestamp'])
+                      for pos in positions])
+    
+    # SSE: serialize ครั้งเดียวต่อ fix ลง replay buffer
+    for pos in positions:
+        event_stream.publish('position', {
+            'tag_mac': pos['tag_mac'],
+            'floor': pos['floor'],
+            'x': round(pos['x'], 2),
+            'y': round(pos['y'], 2),
+            'gateway_count': pos['gateway_count'],
+            'confidence': pos['confidence'],
+            'timestamp': pos['timestamp']
+        }, floor=pos['floor'], tag_mac=pos['tag_mac'])
+    
+    # frame mode: หนึ่ง frame ต่อชั้น (state ล่าสุดของทุก Tag ในชั้น เทียบกับฐานที่ client ack)
+    for floor in frame_publisher.floors():
+        frame_publisher.publish(floor, tracking_engine.get_positions(floor),
+                                [pos for pos in positions if pos['floor'] == floor])
+    
+    floors, tag_macs = tracking_engine.get_subscribed()
+    if not floors and not tag_macs:
+        return
+    
+    for pos in positions:
+        rooms = []
+        if pos['floor'] in floors:
+            rooms.append(floor_room(pos['floor']))
+        if pos['tag_mac'] in tag_macs:
+            rooms.append(tag_room(pos['tag_mac']))
+        if not rooms:
+            continue
+        
+        # ผ่าน outbox ของแต่ละ client: update ที่ยังไม่ได้ส่งของ Tag เดียวกันถูกแทนที่ด้วยอันล่าสุด
+        client_outbox.send('position_update', {
+            'tag_mac': pos['tag_mac'],
+            'floor': pos['floor'],
+            'x': round(pos['x'], 2),
+            'y': round(pos['y'], 2),
+            'gateway_count': pos['gateway_count'],
+            'confidence': pos['confidence']
+        }, key=('position_update', pos['tag_mac']), to=rooms)
+
+
+tracking_engine.on_positions = publish_positions
+
+
 # ==================== WebSocket Server Thread ====================
 
 def run_websocket_server():
@@ -492,6 +947,22 @@ def run_websocket_server():
         logger.error(f"WebSocket server error: {e}", exc_info=True)
 
 
+# ==================== Background Workers ====================
+
+def start_background():
+    """
+    เริ่ม background workers ที่ใช้ร่วมกันทุก serving mode
+    """
+    # Start Retention Worker (ลบข้อมูลเก่าทีละ chunk ใน background)
+    retention_worker.start()
+    
+    # Start Tracking Engine (คำนวณตำแหน่งของทุก Tag ทุกรอบ)
+    tracking_engine.start()
+    
+    # Start Gateway Status Monitor (gateway_status events ของ SSE)
+    gateway_monitor.start()
+
+
 # ==================== Main ====================
 
 if __name__ == '__main__':
@@ -513,6 +984,8 @@ if __name__ == '__main__':
     ws_thread.start()
     logger.info("WebSocket Server started on port 8012")
     
+    start_background()
+    
     # Start Flask Server
     logger.info("Starting Flask Server on port 5000")
     socketio.run(app, host='0.0.0.0', port=5000, debug=False, allow_unsafe_werkzeug=True)
@@ -0,0 +1,241 @@
+"""
+Async Database Facade
+ให้ coroutine บน asyncio event loop เรียก Database (sqlite3 แบบ synchronous) ได้โดยไม่ block loop
+งานทั้งหมดถูกส่งไปทำใน DB thread เฉพาะ และคืนผลเป็น awaitable
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Sentinel สำหรับบอก DB thread ให้หยุด
+_STOP = object()
+
+
+class _Request:
+    """งานหนึ่งรายการที่รอทำใน DB thread"""
+
+    __slots__ = ('loop', 'future', 'func', 'args', 'kwargs', 'batched')
+
+    def __init__(self, loop, future, func, args, kwargs, batched):
+        self.loop = loop
+        self.future = future
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.batched = batched
+
+
+def _resolve(future: asyncio.Future, result=None, error: BaseException = None):
+    """ตั้งผลของ future (เรียกบน event loop, ข้าม future ที่ถูก cancel แล้ว)"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncDatabase:
+    """
+    Facade แบบ async ของ Database
+
+    - execute(func, ...): เรียกฟังก์ชันหนึ่งครั้งใน DB thread
+    - write(batch_func, item): item ที่ส่งมาใน loop tick เดียวกันด้วย batch_func เดียวกัน
+      จะถูกรวมเป็น batch_func(items) ครั้งเดียว (หนึ่ง transaction)
+    """
+
+    def __init__(self, db, max_batch: int = 1000, name: str = "async-db"):
+        """
+        เริ่มต้น AsyncDatabase
+
+        Args:
+            db: Database instance
+            max_batch: จำนวน items สูงสุดต่อการเรียก batch_func หนึ่งครั้ง
+            name: ชื่อ thread (ใช้ใน log)
+        """
+        self.db = db
+        self.max_batch = max_batch
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pending: List[_Request] = []
+        self._pending_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+
+        # Metrics
+        self.requests = 0
+        self.failed = 0
+        self.ticks = 0
+        self.calls = 0
+        self.last_tick_size = 0
+        self.max_tick_size = 0
+        self.last_call_ms = 0.0
+        self.max_call_ms = 0.0
+        self.total_call_ms = 0.0
+
+    def start(self):
+        """
+        เริ่ม DB thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"{self.name} started (max_batch={self.max_batch})")
+
+    def stop(self, timeout: float = 10.0):
+        """
+        ทำงานที่ค้างอยู่ให้เสร็จแล้วหยุด DB thread
+
+        Args:
+            timeout: เวลาสูงสุด (วินาที) ที่รอ
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        logger.info(f"{self.name} stopped ({self.requests} requests, {self.failed} failed)")
+
+    def _enqueue(self, func: Callable, args: tuple, kwargs: dict, batched: bool) -> asyncio.Future:
+        """สร้าง future และเก็บงานไว้รอส่งตอนจบ loop tick ปัจจุบัน"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        with self._pending_lock:
+            first = not self._pending
+            self._pending.append(_Request(loop, future, func, args, kwargs, batched))
+
+        if first:
+            loop.call_soon(self._flush_tick)
+        return future
+
+    def _flush_tick(self):
+        """ส่งงานทั้งหมดที่สะสมใน tick นี้ไปยัง DB thread เป็นก้อนเดียว"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            self._queue.put(pending)
+
+    async def execute(self, func: Callable, *args, **kwargs):
+        """
+        เรียก func(*args, **kwargs) ใน DB thread
+
+        Args:
+            func: ฟังก์ชัน (เช่น method ของ Database)
+
+        Returns:
+            ผลลัพธ์ของ func (exception ถูกส่งต่อให้ผู้เรียก)
+        """
+        return await self._enqueue(func, args, kwargs, batched=False)
+
+    async def write(self, batch_func: Callable[[List], object], item):
+        """
+        เขียน item ผ่าน batch_func โดยรวมกับ items อื่นที่มาใน loop tick เดียวกัน
+
+        Args:
+            batch_func: ฟังก์ชันที่รับ list ของ items แล้วเขียนใน transaction เดียว
+            item: ข้อมูลที่จะเขียน
+
+        Returns:
+            None เมื่อ batch ที่มี item นี้ถูก commit แล้ว (exception ถ้า batch ล้มเหลว)
+        """
+        await self._enqueue(batch_func, (item,), None, batched=True)
+
+    def _run(self):
+        """
+        Loop ของ DB thread
+        """
+        while True:
+            tick = self._queue.get()
+            if tick is _STOP:
+                break
+            self._process(tick)
+
+    def _process(self, tick: List[_Request]):
+        """
+        ทำงานของหนึ่ง loop tick: งาน batched ถูกจัดกลุ่มตาม batch_func
+
+        Args:
+            tick: รายการงาน
+        """
+        groups: Dict[Callable, List[_Request]] = {}
+        for request in tick:
+            if request.batched:
+                groups.setdefault(request.func, []).append(request)
+            else:
+                self._call(request.func, request.args, request.kwargs or {}, [request])
+
+        for batch_func, requests in groups.items():
+            for start in range(0, len(requests), self.max_batch):
+                chunk = requests[start:start + self.max_batch]
+                self._call(batch_func, ([r.args[0] for r in chunk],), {}, chunk, batched=True)
+
+        with self._metrics_lock:
+            self.ticks += 1
+            self.requests += len(tick)
+            self.last_tick_size = len(tick)
+            self.max_tick_size = max(self.max_tick_size, len(tick))
+
+    def _call(self, func: Callable, args: tuple, kwargs: dict,
+              requests: List[_Request], batched: bool = False):
+        """เรียกฟังก์ชันหนึ่งครั้งแล้วส่งผลกลับไปยัง event loop ของผู้เรียกแต่ละคน"""
+        started = time.perf_counter()
+        result = error = None
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"{self.name} call {getattr(func, '__name__', func)} failed: {e}")
+            error = e
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+        with self._metrics_lock:
+            self.calls += 1
+            if error is not None:
+                self.failed += len(requests)
+            self.last_call_ms = elapsed_ms
+            self.max_call_ms = max(self.max_call_ms, elapsed_ms)
+            self.total_call_ms += elapsed_ms
+
+        if batched:
+            result = None
+
+        for request in requests:
+            try:
+                request.loop.call_soon_threadsafe(_resolve, request.future, result, error)
+            except RuntimeError:
+                # event loop ของผู้เรียกปิดไปแล้ว
+                pass
+
+    def get_metrics(self) -> Dict:
+        """
+        ดึง metrics ของ DB thread
+
+        Returns:
+            Dictionary ของ metrics
+        """
+        with self._metrics_lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'queued_ticks': self._queue.qsize(),
+                'requests': self.requests,
+                'failed': self.failed,
+                'ticks': self.ticks,
+                'calls': self.calls,
+                'last_tick_size': self.last_tick_size,
+                'max_tick_size': self.max_tick_size,
+                'avg_tick_size': self.requests / self.ticks if self.ticks else 0.0,
+                'last_call_ms': round(self.last_call_ms, 3),
+                'max_call_ms': round(self.max_call_ms, 3),
+                'avg_call_ms': round(self.total_call_ms / self.calls, 3) if self.calls else 0.0
+            }
@@ -0,0 +1,259 @@
+"""
+Client Outbox
+คิวขาออกแบบจำกัดขนาดต่อ frontend client ที่เก็บเฉพาะ state ล่าสุดต่อ key (เช่น ต่อ Tag)
+background thread ส่งให้ client เฉพาะเมื่อคิวของ transport (engineio) ยังไม่ค้าง
+client ที่ตามไม่ทันนานเกิน max_lag วินาทีจะถูก disconnect
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Outbox:
+    """ข้อมูลที่รอส่งของ client หนึ่งราย"""
+
+    __slots__ = ('items', 'sent', 'coalesced', 'dropped', 'behind_since', 'transport_depth')
+
+    def __init__(self):
+        self.items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.behind_since: Optional[float] = None
+        self.transport_depth = 0
+
+
+class ClientOutbox:
+    """
+    Outbox ต่อ client สำหรับ Socket.IO server (threading mode)
+
+    - send(event, data, key, to): ข้อความใหม่ที่ key ซ้ำกับที่ยังไม่ได้ส่งจะแทนที่ของเดิม (coalesce)
+    - ข้อความเดียวกันที่ส่งให้หลาย client ถูก emit ครั้งเดียว (serialize ครั้งเดียว)
+    """
+
+    def __init__(self, socketio, namespace: str = '/', max_items: int = 1000,
+                 max_transport_queue: int = 16, max_lag: float = 10.0,
+                 poll_interval: float = 0.1, name: str = "client-outbox"):
+        """
+        เริ่มต้น ClientOutbox
+
+        Args:
+            socketio: flask_socketio.SocketIO instance
+            namespace: Socket.IO namespace
+            max_items: จำนวน keys สูงสุดที่รอส่งต่อ client (เกินนี้ drop ของที่เก่าที่สุด)
+            max_transport_queue: จำนวน packets ที่ค้างในคิวของ engineio ที่ถือว่า client ยังตามทัน
+            max_lag: เวลาสูงสุด (วินาที) ที่ client ตามไม่ทันก่อนถูก disconnect
+            poll_interval: ระยะเวลา (วินาที) ที่ตรวจ client ที่ค้างอยู่ซ้ำ
+            name: ชื่อ thread (ใช้ใน log)
+        """
+        self.socketio = socketio
+        self.namespace = namespace
+        self.max_items = max_items
+        self.max_transport_queue = max_transport_queue
+        self.max_lag = max_lag
+        self.poll_interval = poll_interval
+        self.name = name
+
+        self._outboxes: Dict[str, _Outbox] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+
+        # Metrics
+        self.emits = 0
+        self.disconnected = 0
+
+    def start(self):
+        """
+        เริ่ม sender thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"{self.name} started (max_items={self.max_items}, "
+                    f"max_transport_queue={self.max_transport_queue}, max_lag={self.max_lag}s)")
+
+    def stop(self, timeout: float = 5.0):
+        """
+        หยุด sender thread
+
+        Args:
+            timeout: เวลาสูงสุด (วินาที) ที่รอ
+        """
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def register(self, sid: str):
+        """
+        สร้าง outbox ให้ client ที่เพิ่งเชื่อมต่อ
+
+        Args:
+            sid: Socket.IO sid
+        """
+        with self._lock:
+            self._outboxes.setdefault(sid, _Outbox())
+
+    def unregister(self, sid: str):
+        """
+        ลบ outbox ของ client ที่ตัดการเชื่อมต่อ (ทิ้งข้อความที่ยังไม่ได้ส่ง)
+
+        Args:
+            sid: Socket.IO sid
+        """
+        with self._lock:
+            self._outboxes.pop(sid, None)
+
+    def _expand(self, to: Iterable[str]) -> set:
+        """แปลงรายการ rooms/sids เป็นชุดของ sids (client ที่อยู่หลาย room ได้รับครั้งเดียว)"""
+        manager = self.socketio.server.manager
+        sids = set()
+        for room in to:
+            for sid, _ in manager.get_participants(self.namespace, room):
+                sids.add(sid)
+        return sids
+
+    def send(self, event: str, data, key: Hashable, to: Iterable[str]):
+        """
+        ส่งข้อความเข้า outbox ของทุก client ใน rooms/sids ที่ระบุ (ไม่ block)
+
+        Args:
+            event: ชื่อ event
+            data: ข้อมูล (object เดียวกันใช้ร่วมกันทุก client)
+            key: key ของ state (ข้อความที่ key ซ้ำและยังไม่ได้ส่งจะถูกแทนที่)
+            to: รายการ rooms หรือ sids
+        """
+        sids = self._expand(to)
+        if not sids:
+            return
+
+        with self._lock:
+            for sid in sids:
+                outbox = self._outboxes.get(sid)
+                if outbox is None:
+                    continue
+                if key in outbox.items:
+                    outbox.coalesced += 1
+                elif len(outbox.items) >= self.max_items:
+                    outbox.items.popitem(last=False)
+                    outbox.dropped += 1
+                outbox.items[key] = (event, data)
+
+        self._wakeup.set()
+
+    def _transport_depth(self, sid: str) -> int:
+        """จำนวน packets ที่ค้างอยู่ในคิวของ engineio socket ของ client"""
+        server = self.socketio.server
+        try:
+            eio_sid = server.manager.eio_sid_from_sid(sid, self.namespace)
+            socket = server.eio.sockets.get(eio_sid)
+        except (KeyError, AttributeError):
+            return 0
+        if socket is None:
+            return 0
+        return socket.queue.qsize()
+
+    def _run(self):
+        """
+        Loop ของ sender thread
+        """
+        while self._running:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"{self.name} flush error: {e}", exc_info=True)
+
+    def flush(self):
+        """
+        ส่งข้อความที่รออยู่ให้ client ที่ตามทัน และ disconnect client ที่ค้างนานเกิน max_lag
+        """
+        now = time.time()
+        groups: Dict[tuple, tuple] = {}
+        lagging = []
+
+        with self._lock:
+            sids = [sid for sid, outbox in self._outboxes.items() if outbox.items]
+
+        # อ่านความลึกของคิว transport นอก lock
+        depths = {sid: self._transport_depth(sid) for sid in sids}
+
+        with self._lock:
+            for sid in sids:
+                outbox = self._outboxes.get(sid)
+                if outbox is None:
+                    continue
+                outbox.transport_depth = depths[sid]
+
+                if depths[sid] > self.max_transport_queue:
+                    if outbox.behind_since is None:
+                        outbox.behind_since = now
+                    elif now - outbox.behind_since > self.max_lag:
+                        lagging.append(sid)
+                    continue
+
+                outbox.behind_since = None
+                for event, data in outbox.items.values():
+                    group = groups.get((event, id(data)))
+                    if group is None:
+                        group = groups[(event, id(data))] = (event, data, [])
+                    group[2].append(sid)
+                outbox.sent += len(outbox.items)
+                outbox.items.clear()
+
+        for event, data, sids in groups.values():
+            self.socketio.emit(event, data, to=sids, namespace=self.namespace)
+        with self._lock:
+            self.emits += len(groups)
+
+        for sid in lagging:
+            logger.warning(f"{self.name}: disconnecting slow client {sid}")
+            self.unregister(sid)
+            with self._lock:
+                self.disconnected += 1
+            try:
+                self.socketio.server.disconnect(sid, namespace=self.namespace)
+            except Exception as e:
+                logger.error(f"{self.name}: disconnect {sid} failed: {e}")
+
+    def get_metrics(self) -> Dict:
+        """
+        ดึง metrics รวมและราย client
+
+        Returns:
+            Dictionary ของ metrics
+        """
+        now = time.time()
+        with self._lock:
+            clients = {
+                sid: {
+                    'depth': len(outbox.items),
+                    'transport_depth': outbox.transport_depth,
+                    'sent': outbox.sent,
+                    'coalesced': outbox.coalesced,
+                    'dropped': outbox.dropped,
+                    'behind_seconds': round(now - outbox.behind_since, 1) if outbox.behind_since else 0.0
+                }
+                for sid, outbox in self._outboxes.items()
+            }
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'clients': len(clients),
+                'emits': self.emits,
+                'disconnected': self.disconnected,
+                'coalesced': sum(c['coalesced'] for c in clients.values()),
+                'dropped': sum(c['dropped'] for c in clients.values()),
+                'per_client': clients
+            }
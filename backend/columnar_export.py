@@ -0,0 +1,247 @@
+"""
+Columnar Export
+Export position_history เป็นไฟล์คอลัมน์ขนาดคงที่ (NumPy) พร้อม manifest
+เปิดอ่านแบบ zero-copy ด้วย np.memmap และ export เพิ่มเฉพาะแถวใหม่ได้
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from database import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+# ชื่อคอลัมน์ -> dtype (little-endian, ขนาดคงที่)
+COLUMNS = {
+    'id': '<i8',
+    'timestamp': '<f8',
+    'tag': '<i4',
+    'floor': '<i2',
+    'x': '<f4',
+    'y': '<f4',
+    'confidence': '<f4',
+    'gateway_count': '<i2'
+}
+
+
+def read_manifest(out_dir: str) -> Dict:
+    """
+    อ่าน manifest ของ export (สร้างค่าเริ่มต้นถ้ายังไม่มี)
+
+    Args:
+        out_dir: โฟลเดอร์ของ export
+
+    Returns:
+        manifest dict
+    """
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {
+            'version': FORMAT_VERSION,
+            'rows': 0,
+            'last_id': 0,
+            'columns': {name: {'dtype': dtype, 'file': f"{name}.bin"} for name, dtype in COLUMNS.items()},
+            'tags': []
+        }
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def open_columns(out_dir: str) -> Dict:
+    """
+    เปิด export แบบ read-only memory map (ไม่ copy ข้อมูล)
+
+    Args:
+        out_dir: โฟลเดอร์ของ export
+
+    Returns:
+        dict ของ np.memmap ต่อคอลัมน์ และ 'tags' (รายการ MAC ตาม index ในคอลัมน์ tag)
+    """
+    manifest = read_manifest(out_dir)
+    rows = manifest['rows']
+
+    columns = {}
+    for name, spec in manifest['columns'].items():
+        if rows == 0:
+            columns[name] = np.empty(0, dtype=spec['dtype'])
+        else:
+            columns[name] = np.memmap(os.path.join(out_dir, spec['file']),
+                                      dtype=spec['dtype'], mode='r', shape=(rows,))
+
+    columns['tags'] = manifest['tags']
+    return columns
+
+
+class ColumnarExporter:
+    """
+    Export position_history แบบ incremental (append เฉพาะ id ที่มากกว่า last_id)
+
+    เขียนข้อมูลต่อท้ายไฟล์คอลัมน์ก่อน แล้วจึงอัปเดต manifest แบบ atomic
+    ถ้าโปรแกรมหยุดกลางทาง ข้อมูลส่วนเกินท้ายไฟล์จะถูกตัดทิ้งในรอบถัดไป
+    """
+
+    def __init__(self, db, out_dir: str, chunk_rows: int = 50000):
+        """
+        เริ่มต้น ColumnarExporter
+
+        Args:
+            db: Database instance
+            out_dir: โฟลเดอร์ปลายทาง
+            chunk_rows: จำนวนแถวที่อ่านจาก SQLite ต่อครั้ง
+        """
+        self.db = db
+        self.out_dir = out_dir
+        self.chunk_rows = chunk_rows
+
+    def _write_manifest(self, manifest: Dict):
+        """เขียน manifest แบบ atomic (tmp + rename)"""
+        path = os.path.join(self.out_dir, MANIFEST_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _truncate_to_manifest(self, manifest: Dict):
+        """ตัดข้อมูลที่เขียนเกิน manifest (จากรอบที่ค้างกลางทาง)"""
+        for spec in manifest['columns'].values():
+            path = os.path.join(self.out_dir, spec['file'])
+            expected = manifest['rows'] * np.dtype(spec['dtype']).itemsize
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            elif os.path.getsize(path) != expected:
+                with open(path, 'r+b') as f:
+                    f.truncate(expected)
+
+    def export(self, start_time: float = None, end_time: float = None) -> int:
+        """
+        Export แถวใหม่ตั้งแต่ครั้งก่อน
+
+        Args:
+            start_time: เวลาเริ่มต้น (Unix epoch, optional) ใช้กับแถวใหม่เท่านั้น
+            end_time: เวลาสิ้นสุด (Unix epoch, optional) แถวที่ใหม่กว่านี้จะรอรอบถัดไป
+                (export หยุดที่แถวแรกตามลำดับ id ที่ใหม่กว่า end_time เพื่อไม่ให้ last_id ข้ามแถวนั้น)
+
+        Returns:
+            จำนวนแถวที่เพิ่ม
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        manifest = read_manifest(self.out_dir)
+        self._truncate_to_manifest(manifest)
+
+        tag_index = {mac: i for i, mac in enumerate(manifest['tags'])}
+        files = {name: open(os.path.join(self.out_dir, spec['file']), 'ab')
+                 for name, spec in manifest['columns'].items()}
+
+        conditions = ["id > ?"]
+        time_params = []
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            time_params.append(format_timestamp(start_time))
+
+        # end_time ไม่ใช่เงื่อนไขของ WHERE: ถ้ากรองออก last_id จะข้ามแถวที่ id น้อยกว่าแต่ timestamp ใหม่กว่า
+        # (บันทึกตำแหน่งด้วย timestamp ของตัวเองไม่เรียงตาม id) แถวนั้นจะไม่ถูก export อีกเลย
+        before_end = "timestamp < ?" if end_time is not None else "1"
+        end_params = [format_timestamp(end_time)] if end_time is not None else []
+
+        added = 0
+        try:
+            while True:
+                with self.db.connection() as conn:
+                    rows = conn.execute(f'''
+                        SELECT {before_end}, id, (julianday(timestamp) - 2440587.5) * 86400.0, tag_mac,
+                               floor, x, y, confidence, gateway_count
+                        FROM position_history
+                        WHERE {' AND '.join(conditions)}
+                        ORDER BY id
+                        LIMIT ?
+                    ''', end_params + [manifest['last_id']] + time_params + [self.chunk_rows]).fetchall()
+
+                reached_end = next((i for i, row in enumerate(rows) if not row[0]), None)
+                if reached_end is not None:
+                    rows = rows[:reached_end]
+                if not rows:
+                    break
+
+                _, ids, timestamps, tags, floors, xs, ys, confidences, gateway_counts = zip(*rows)
+
+                for mac in tags:
+                    if mac not in tag_index:
+                        tag_index[mac] = len(manifest['tags'])
+                        manifest['tags'].append(mac)
+
+                chunk = {
+                    'id': np.array(ids, dtype=COLUMNS['id']),
+                    'timestamp': np.array(timestamps, dtype=COLUMNS['timestamp']),
+                    'tag': np.array([tag_index[mac] for mac in tags], dtype=COLUMNS['tag']),
+                    'floor': np.array(floors, dtype=COLUMNS['floor']),
+                    'x': np.array(xs, dtype=COLUMNS['x']),
+                    'y': np.array(ys, dtype=COLUMNS['y']),
+                    'confidence': np.array([np.nan if c is None else c for c in confidences],
+                                           dtype=COLUMNS['confidence']),
+                    'gateway_count': np.array([-1 if g is None else g for g in gateway_counts],
+                                              dtype=COLUMNS['gateway_count'])
+                }
+
+                for name, f in files.items():
+                    f.write(chunk[name].tobytes())
+
+                manifest['rows'] += len(rows)
+                manifest['last_id'] = int(ids[-1])
+                added += len(rows)
+
+                if reached_end is not None:
+                    break
+
+            for f in files.values():
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            for f in files.values():
+                f.close()
+
+        if added:
+            self._write_manifest(manifest)
+
+        logger.info(f"Exported {added} rows to {self.out_dir} (total {manifest['rows']})")
+        return added
+
+
+def main(argv: Optional[list] = None):
+    """
+    CLI สำหรับ export position_history แบบคอลัมน์
+    """
+    from database import get_database
+
+    parser = argparse.ArgumentParser(description="Export position_history เป็นไฟล์คอลัมน์ NumPy")
+    parser.add_argument('out_dir', help="โฟลเดอร์ปลายทาง")
+    parser.add_argument('--db', default="ble_trilateration.db", help="path ของฐานข้อมูล")
+    parser.add_argument('--from', dest='start_time', type=float, help="เวลาเริ่มต้น (Unix epoch)")
+    parser.add_argument('--to', dest='end_time', type=float, help="เวลาสิ้นสุด (Unix epoch)")
+    parser.add_argument('--info', action='store_true', help="แสดงข้อมูลของ export ที่มีอยู่แล้วจบ")
+    args = parser.parse_args(argv)
+
+    if not args.info:
+        exporter = ColumnarExporter(get_database(args.db), args.out_dir)
+        exporter.export(args.start_time, args.end_time)
+
+    columns = open_columns(args.out_dir)
+    timestamps = columns['timestamp']
+    print(f"Rows: {len(timestamps)}, Tags: {len(columns['tags'])}")
+    if len(timestamps):
+        print(f"Time range: {timestamps.min():.3f} - {timestamps.max():.3f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -4,100 +4,282 @@ Database management สำหรับ BLE Trilateration System
 
 import sqlite3
 import json
+import base64
 import logging
-from typing import List, Dict, Optional, Tuple
-from datetime import datetime
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Optional, Tuple, Sequence
+from datetime import datetime, timezone
 import os
 
+import numpy as np
+
+from rssi_codec import encode_rssi, decode_rssi, decode_rssi_matrix
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def format_timestamp(epoch: float) -> str:
+    """
+    แปลง Unix epoch เป็นรูปแบบเดียวกับ CURRENT_TIMESTAMP ของ SQLite (UTC, ระดับ millisecond)
+
+    Args:
+        epoch: เวลาแบบ Unix epoch
+
+    Returns:
+        string 'YYYY-MM-DD HH:MM:SS.SSS'
+    """
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+class LazyDecodedColumn(Sequence):
+    """
+    คอลัมน์ของค่าดิบที่ decode เมื่อถูกเข้าถึงเท่านั้น (cache ผลที่ decode แล้ว)
+    """
+    
+    def __init__(self, raw_values: List, decode: Callable):
+        """
+        เริ่มต้น LazyDecodedColumn
+        
+        Args:
+            raw_values: รายการค่าดิบ (หรือ None)
+            decode: ฟังก์ชันแปลงค่าดิบหนึ่งค่า
+        """
+        self.raw_values = raw_values
+        self.decode = decode
+        self._decoded = {}
+    
+    def __len__(self) -> int:
+        return len(self.raw_values)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        
+        if index < 0:
+            index += len(self.raw_values)
+        
+        if index not in self._decoded:
+            raw = self.raw_values[index]
+            self._decoded[index] = self.decode(raw) if raw else None
+        return self._decoded[index]
+
+
+def encode_cursor(timestamp: str, position_id: int) -> str:
+    """
+    สร้าง cursor สำหรับ keyset pagination จากแถวสุดท้ายของหน้า
+    
+    Args:
+        timestamp: timestamp ของแถว (ตามที่เก็บในฐานข้อมูล)
+        position_id: id ของแถว
+        
+    Returns:
+        cursor string (URL-safe)
+    """
+    raw = json.dumps([timestamp, position_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    ถอด cursor กลับเป็น (timestamp, id)
+    
+    Args:
+        cursor: cursor string จาก encode_cursor
+        
+    Returns:
+        (timestamp, id)
+    """
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    timestamp, position_id = json.loads(raw)
+    return str(timestamp), int(position_id)
+
+
 class Database:
     """
     จัดการฐานข้อมูล SQLite สำหรับระบบ BLE Trilateration
     """
     
-    def __init__(self, db_path: str = "ble_trilateration.db"):
+    def __init__(self, db_path: str = "ble_trilateration.db", pool_size: int = 8):
         """
         เริ่มต้น Database
         
         Args:
             db_path: path ของไฟล์ฐานข้อมูล
+            pool_size: จำนวน connection สูงสุดที่เก็บไว้ใช้ซ้ำใน pool
         """
         self.db_path = db_path
+        self.pool_size = pool_size
+        
+        # Connection pool (LIFO เพื่อใช้ connection ที่ cache อุ่นอยู่ก่อน)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        
+        # Version ของตาราง gateways และ zones (เพิ่มทุกครั้งที่มีการแก้ไข ใช้ invalidate cache)
+        self.gateway_version = 0
+        self.zone_version = 0
+        self._version_lock = threading.Lock()
+        
+        # Hooks ที่ถูกเรียกทุกครั้งที่บันทึกตำแหน่ง
+        self.position_hooks = []
+        
+        # Cache ของ MAC <-> gateways.id สำหรับ rssi_data แบบ binary: (version, mac->id, id->mac)
+        self._gateway_id_maps = (None, {}, {})
+        
         self.init_database()
         logger.info(f"Database initialized at {db_path}")
     
     def get_connection(self):
-        """สร้าง connection ไปยังฐานข้อมูล"""
-        conn = sqlite3.connect(self.db_path)
+        """สร้าง connection ใหม่ไปยังฐานข้อมูล (ตั้งค่า WAL และ PRAGMA แล้ว)"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,
+            check_same_thread=False,  # ใช้ข้าม thread ได้ แต่ครั้งละ thread เดียวผ่าน pool
+            cached_statements=256
+        )
         conn.row_factory = sqlite3.Row  # ให้ return เป็น dict
+        
+        # WAL: reader ไม่ต้องรอ writer และ writer ไม่ต้องรอ reader
+        conn.execute('PRAGMA journal_mode=WAL')
+        # NORMAL ปลอดภัยใน WAL mode (fsync ตอน checkpoint แทนทุก commit)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-16000')  # ~16 MB ต่อ connection
+        
         return conn
     
+    @contextmanager
+    def connection(self):
+        """
+        ยืม connection จาก pool (สร้างใหม่ถ้า pool ว่าง) แล้วคืนเมื่อใช้เสร็จ
+        
+        Yields:
+            sqlite3.Connection ที่ใช้ได้เฉพาะ thread ปัจจุบันจนกว่าจะคืน
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self.get_connection()
+        
+        try:
+            yield conn
+        finally:
+            # ยกเลิก transaction ที่ค้างอยู่ (เช่นเกิด exception ก่อน commit)
+            if conn.in_transaction:
+                conn.rollback()
+            
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def close(self):
+        """ปิด connection ทั้งหมดใน pool"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+    
     def init_database(self):
         """สร้างตารางในฐานข้อมูล"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # ตาราง Gateways
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS gateways (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                mac_address TEXT UNIQUE NOT NULL,
-                floor INTEGER NOT NULL,
-                x REAL NOT NULL,
-                y REAL NOT NULL,
-                name TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # ตาราง Position History
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS position_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tag_mac TEXT NOT NULL,
-                floor INTEGER NOT NULL,
-                x REAL NOT NULL,
-                y REAL NOT NULL,
-                confidence REAL,
-                gateway_count INTEGER,
-                rssi_data TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # ตาราง Zones (สำหรับการแจ้งเตือน)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS zones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                floor INTEGER NOT NULL,
-                x REAL NOT NULL,
-                y REAL NOT NULL,
-                radius REAL NOT NULL,
-                color TEXT DEFAULT '#3498db',
-                enable_exit_alert INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Index สำหรับ performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gateway_mac ON gateways(mac_address)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gateway_floor ON gateways(floor)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_position_tag ON position_history(tag_mac)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_position_timestamp ON position_history(timestamp)')
-        
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # ตาราง Gateways
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gateways (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    mac_address TEXT UNIQUE NOT NULL,
+                    floor INTEGER NOT NULL,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL,
+                    name TEXT,
+                    description TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # ตาราง Position History
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS position_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tag_mac TEXT NOT NULL,
+                    floor INTEGER NOT NULL,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL,
+                    confidence REAL,
+                    gateway_count INTEGER,
+                    rssi_data TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # ตาราง Zones (สำหรับการแจ้งเตือน)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS zones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    floor INTEGER NOT NULL,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL,
+                    radius REAL NOT NULL,
+                    color TEXT DEFAULT '#3498db',
+                    enable_exit_alert INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Index สำหรับ performance
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_gateway_mac ON gateways(mac_address)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_gateway_floor ON gateways(floor)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_position_timestamp ON position_history(timestamp)')
+            
+            # Composite index สำหรับ range query ต่อ Tag (ครอบคลุม idx_position_tag เดิม)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_position_tag_time ON position_history(tag_mac, timestamp)')
+            cursor.execute('DROP INDEX IF EXISTS idx_position_tag')
+            
+            conn.commit()
         
         logger.info("Database tables initialized")
     
     # ==================== Gateway Management ====================
     
+    def bump_gateway_version(self) -> int:
+        """
+        เพิ่ม version ของตาราง gateways (เรียกหลังแก้ไขข้อมูล Gateway ทุกครั้ง)
+        
+        Returns:
+            version ใหม่
+        """
+        with self._version_lock:
+            self.gateway_version += 1
+            return self.gateway_version
+    
+    def get_gateway_id_maps(self) -> Tuple[Dict[str, int], Dict[int, str]]:
+        """
+        ดึง mapping ระหว่าง MAC Address และ gateways.id (cache ตาม gateway_version)
+        
+        Returns:
+            (dict ของ MAC -> id, dict ของ id -> MAC)
+        """
+        version, mac_to_id, id_to_mac = self._gateway_id_maps
+        if version == self.gateway_version:
+            return mac_to_id, id_to_mac
+        
+        version = self.gateway_version
+        with self.connection() as conn:
+            rows = conn.execute('SELECT id, mac_address FROM gateways').fetchall()
+        
+        mac_to_id = {mac: gateway_id for gateway_id, mac in rows}
+        id_to_mac = {gateway_id: mac for gateway_id, mac in rows}
+        self._gateway_id_maps = (version, mac_to_id, id_to_mac)
+        return mac_to_id, id_to_mac
+    
     def add_gateway(self, mac_address: str, floor: int, x: float, y: float, 
                    name: str = None, description: str = None) -> int:
         """
@@ -114,41 +296,106 @@ class Database:
         Returns:
             ID ของ Gateway ที่เพิ่ม
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # ทำความสะอาด MAC Address
-            mac_address = mac_address.replace(":", "").upper()
+        with self.connection() as conn:
+            cursor = conn.cursor()
             
-            cursor.execute('''
+            try:
+                # ทำความสะอาด MAC Address
+                mac_address = mac_address.replace(":", "").upper()
+                
+                cursor.execute('''
+                    INSERT INTO gateways (mac_address, floor, x, y, name, description)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (mac_address, floor, x, y, name, description))
+                
+                gateway_id = cursor.lastrowid
+                conn.commit()
+                self.bump_gateway_version()
+                
+                logger.info(f"Added gateway {mac_address} at ({x}, {y}) on floor {floor}")
+                return gateway_id
+            
+            except sqlite3.IntegrityError:
+                logger.warning(f"Gateway {mac_address} already exists, updating instead")
+                # ถ้า MAC Address ซ้ำ ให้ update แทน
+                cursor.execute('''
+                    UPDATE gateways 
+                    SET floor = ?, x = ?, y = ?, name = ?, description = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE mac_address = ?
+                ''', (floor, x, y, name, description, mac_address))
+                conn.commit()
+                self.bump_gateway_version()
+                
+                cursor.execute('SELECT id FROM gateways WHERE mac_address = ?', (mac_address,))
+                gateway_id = cursor.fetchone()[0]
+                return gateway_id
+
+    def upsert_gateways(self, gateways: List[Dict]) -> Dict[str, int]:
+        """
+        เพิ่ม/อัปเดต Gateways หลายรายการใน transaction เดียว (INSERT ... ON CONFLICT)
+        version ของตาราง gateways ถูกเพิ่มครั้งเดียวหลัง commit
+
+        Args:
+            gateways: รายการ dict ที่มี mac_address, floor, x, y และ name, description (optional)
+                      ถ้า MAC ซ้ำกันในรายการ รายการหลังสุดมีผล
+
+        Returns:
+            dict ของ inserted, updated
+
+        Raises:
+            ValueError: ถ้ามีรายการที่ข้อมูลไม่ครบหรือไม่ถูกต้อง (ไม่มีการเขียนข้อมูลใดๆ)
+        """
+        rows = {}
+        for i, gw in enumerate(gateways):
+            try:
+                mac_address = str(gw['mac_address']).replace(":", "").upper()
+                if not mac_address:
+                    raise ValueError("empty mac_address")
+                rows[mac_address] = (
+                    mac_address,
+                    int(gw['floor']),
+                    float(gw['x']),
+                    float(gw['y']),
+                    gw.get('name') or None,
+                    gw.get('description') or None
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid gateway at row {i + 1}: {e}") from e
+
+        if not rows:
+            return {'inserted': 0, 'updated': 0}
+
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+
+            existing = set()
+            macs = list(rows)
+            for start in range(0, len(macs), 500):
+                chunk = macs[start:start + 500]
+                existing.update(mac for (mac,) in conn.execute(
+                    f"SELECT mac_address FROM gateways WHERE mac_address IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ))
+
+            conn.executemany('''
                 INSERT INTO gateways (mac_address, floor, x, y, name, description)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', (mac_address, floor, x, y, name, description))
-            
-            gateway_id = cursor.lastrowid
+                ON CONFLICT (mac_address) DO UPDATE SET
+                    floor = excluded.floor,
+                    x = excluded.x,
+                    y = excluded.y,
+                    name = COALESCE(excluded.name, name),
+                    description = COALESCE(excluded.description, description),
+                    updated_at = CURRENT_TIMESTAMP
+            ''', list(rows.values()))
             conn.commit()
-            
-            logger.info(f"Added gateway {mac_address} at ({x}, {y}) on floor {floor}")
-            return gateway_id
-            
-        except sqlite3.IntegrityError:
-            logger.warning(f"Gateway {mac_address} already exists, updating instead")
-            # ถ้า MAC Address ซ้ำ ให้ update แทน
-            cursor.execute('''
-                UPDATE gateways 
-                SET floor = ?, x = ?, y = ?, name = ?, description = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE mac_address = ?
-            ''', (floor, x, y, name, description, mac_address))
-            conn.commit()
-            
-            cursor.execute('SELECT id FROM gateways WHERE mac_address = ?', (mac_address,))
-            gateway_id = cursor.fetchone()[0]
-            return gateway_id
-            
-        finally:
-            conn.close()
-    
+
+        self.bump_gateway_version()
+
+        result = {'inserted': len(rows) - len(existing), 'updated': len(existing)}
+        logger.info(f"Upserted {len(rows)} gateways ({result['inserted']} inserted, {result['updated']} updated)")
+        return result
+
     def get_gateway(self, mac_address: str) -> Optional[Dict]:
         """
         ดึงข้อมูล Gateway จาก MAC Address
@@ -159,15 +406,13 @@ class Database:
         Returns:
             ข้อมูล Gateway หรือ None
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        mac_address = mac_address.replace(":", "").upper()
-        
-        cursor.execute('SELECT * FROM gateways WHERE mac_address = ?', (mac_address,))
-        row = cursor.fetchone()
-        
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            mac_address = mac_address.replace(":", "").upper()
+            
+            cursor.execute('SELECT * FROM gateways WHERE mac_address = ?', (mac_address,))
+            row = cursor.fetchone()
         
         if row:
             return dict(row)
@@ -183,13 +428,11 @@ class Database:
         Returns:
             รายการ Gateways
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM gateways WHERE floor = ? ORDER BY mac_address', (floor,))
-        rows = cursor.fetchall()
-        
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM gateways WHERE floor = ? ORDER BY mac_address', (floor,))
+            rows = cursor.fetchall()
         
         return [dict(row) for row in rows]
     
@@ -200,13 +443,11 @@ class Database:
         Returns:
             รายการ Gateways ทั้งหมด
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM gateways ORDER BY floor, mac_address')
-        rows = cursor.fetchall()
-        
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM gateways ORDER BY floor, mac_address')
+            rows = cursor.fetchall()
         
         return [dict(row) for row in rows]
     
@@ -226,46 +467,45 @@ class Database:
         Returns:
             True หากอัปเดตสำเร็จ
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        mac_address = mac_address.replace(":", "").upper()
-        
-        # สร้าง SQL query แบบ dynamic
-        updates = []
-        params = []
-        
-        if floor is not None:
-            updates.append("floor = ?")
-            params.append(floor)
-        if x is not None:
-            updates.append("x = ?")
-            params.append(x)
-        if y is not None:
-            updates.append("y = ?")
-            params.append(y)
-        if name is not None:
-            updates.append("name = ?")
-            params.append(name)
-        if description is not None:
-            updates.append("description = ?")
-            params.append(description)
-        
-        if not updates:
-            conn.close()
-            return False
-        
-        updates.append("updated_at = CURRENT_TIMESTAMP")
-        params.append(mac_address)
-        
-        query = f"UPDATE gateways SET {', '.join(updates)} WHERE mac_address = ?"
-        cursor.execute(query, params)
-        
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            mac_address = mac_address.replace(":", "").upper()
+            
+            # สร้าง SQL query แบบ dynamic
+            updates = []
+            params = []
+            
+            if floor is not None:
+                updates.append("floor = ?")
+                params.append(floor)
+            if x is not None:
+                updates.append("x = ?")
+                params.append(x)
+            if y is not None:
+                updates.append("y = ?")
+                params.append(y)
+            if name is not None:
+                updates.append("name = ?")
+                params.append(name)
+            if description is not None:
+                updates.append("description = ?")
+                params.append(description)
+            
+            if not updates:
+                return False
+            
+            updates.append("updated_at = CURRENT_TIMESTAMP")
+            params.append(mac_address)
+            
+            query = f"UPDATE gateways SET {', '.join(updates)} WHERE mac_address = ?"
+            cursor.execute(query, params)
+            
+            success = cursor.rowcount > 0
+            conn.commit()
         
         if success:
+            self.bump_gateway_version()
             logger.info(f"Updated gateway {mac_address}")
         
         return success
@@ -280,18 +520,18 @@ class Database:
         Returns:
             True หากลบสำเร็จ
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        mac_address = mac_address.replace(":", "").upper()
-        
-        cursor.execute('DELETE FROM gateways WHERE mac_address = ?', (mac_address,))
-        
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            mac_address = mac_address.replace(":", "").upper()
+            
+            cursor.execute('DELETE FROM gateways WHERE mac_address = ?', (mac_address,))
+            
+            success = cursor.rowcount > 0
+            conn.commit()
         
         if success:
+            self.bump_gateway_version()
             logger.info(f"Deleted gateway {mac_address}")
         
         return success
@@ -303,13 +543,11 @@ class Database:
         Returns:
             จำนวน Gateways
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM gateways')
-        count = cursor.fetchone()[0]
-        
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT COUNT(*) FROM gateways')
+            count = cursor.fetchone()[0]
         
         return count
     
@@ -328,29 +566,88 @@ class Database:
             y: พิกัด Y
             confidence: ความมั่นใจในการคำนวณ (0-1)
             gateway_count: จำนวน Gateways ที่ใช้คำนวณ
-            rssi_data: ข้อมูล RSSI (dict)
+            rssi_data: ข้อมูล RSSI (dict ของ MAC Address ของ Gateway -> RSSI)
             
         Returns:
             ID ของ position record
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        tag_mac = tag_mac.replace(":", "").upper()
-        rssi_json = json.dumps(rssi_data) if rssi_data else None
-        
-        cursor.execute('''
-            INSERT INTO position_history 
-            (tag_mac, floor, x, y, confidence, gateway_count, rssi_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (tag_mac, floor, x, y, confidence, gateway_count, rssi_json))
-        
-        position_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        gateway_ids, _ = self.get_gateway_id_maps()
         
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            tag_mac = tag_mac.replace(":", "").upper()
+            rssi_encoded = encode_rssi(rssi_data, gateway_ids)
+            
+            cursor.execute('''
+                INSERT INTO position_history 
+                (tag_mac, floor, x, y, confidence, gateway_count, rssi_data)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (tag_mac, floor, x, y, confidence, gateway_count, rssi_encoded))
+            
+            position_id = cursor.lastrowid
+            self._run_position_hooks(conn, [(tag_mac, floor, x, y, time.time())])
+            conn.commit()
+
         return position_id
+
+    def add_position_hook(self, hook):
+        """
+        ลงทะเบียน hook ที่ถูกเรียกใน transaction เดียวกับการบันทึกตำแหน่ง
+        (เช่น อัปเดต rollup tables แบบ incremental)
+        
+        Args:
+            hook: callable(conn, records) โดย records เป็น list ของ
+                  (tag_mac, floor, x, y, timestamp epoch)
+        """
+        self.position_hooks.append(hook)
+    
+    def _run_position_hooks(self, conn, records: List[Tuple]):
+        """เรียก position hooks ทั้งหมด (exception จะทำให้ทั้ง transaction ถูก rollback)"""
+        for hook in self.position_hooks:
+            hook(conn, records)
     
+    def add_positions(self, positions: List[Dict]) -> int:
+        """
+        บันทึกตำแหน่งหลายรายการใน transaction เดียว (ใช้โดย write-behind writer)
+
+        Args:
+            positions: รายการ dict ที่มี key เหมือนพารามิเตอร์ของ add_position
+                       และ 'timestamp' (Unix epoch, optional) เป็นเวลาที่คำนวณได้
+
+        Returns:
+            จำนวน records ที่บันทึก
+        """
+        rows = []
+        records = []
+        now = time.time()
+        gateway_ids, _ = self.get_gateway_id_maps()
+        for pos in positions:
+            timestamp = pos.get('timestamp') or now
+            tag_mac = pos['tag_mac'].replace(":", "").upper()
+            rows.append((
+                tag_mac,
+                pos['floor'],
+                pos['x'],
+                pos['y'],
+                pos.get('confidence'),
+                pos.get('gateway_count'),
+                encode_rssi(pos.get('rssi_data'), gateway_ids),
+                format_timestamp(timestamp)
+            ))
+            records.append((tag_mac, pos['floor'], pos['x'], pos['y'], timestamp))
+
+        with self.connection() as conn:
+            conn.executemany('''
+                INSERT INTO position_history
+                (tag_mac, floor, x, y, confidence, gateway_count, rssi_data, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self._run_position_hooks(conn, records)
+            conn.commit()
+
+        return len(rows)
+
     def get_recent_positions(self, tag_mac: str, limit: int = 100) -> List[Dict]:
         """
         ดึงตำแหน่งล่าสุดของ Tag
@@ -362,30 +659,250 @@ class Database:
         Returns:
             รายการตำแหน่ง
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        tag_mac = tag_mac.replace(":", "").upper()
-        
-        cursor.execute('''
-            SELECT * FROM position_history 
-            WHERE tag_mac = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (tag_mac, limit))
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            tag_mac = tag_mac.replace(":", "").upper()
+            
+            cursor.execute('''
+                SELECT * FROM position_history 
+                WHERE tag_mac = ? 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            ''', (tag_mac, limit))
+            
+            rows = cursor.fetchall()
         
-        rows = cursor.fetchall()
-        conn.close()
+        _, gateway_macs = self.get_gateway_id_maps()
         
         positions = []
         for row in rows:
             pos = dict(row)
-            if pos['rssi_data']:
-                pos['rssi_data'] = json.loads(pos['rssi_data'])
+            pos['rssi_data'] = decode_rssi(pos['rssi_data'], gateway_macs)
             positions.append(pos)
         
         return positions
+
+    def get_position_page(self, tag_mac: str, start_time: float = None, end_time: float = None,
+                          cursor: str = None, limit: int = 1000) -> Dict:
+        """
+        ดึงประวัติตำแหน่งของ Tag ทีละหน้าแบบ keyset pagination (ไม่ใช้ OFFSET)
+        
+        Args:
+            tag_mac: MAC Address ของ Tag
+            start_time: เวลาเริ่มต้น (Unix epoch, optional)
+            end_time: เวลาสิ้นสุด (Unix epoch, optional)
+            cursor: next_cursor จากหน้าก่อนหน้า (optional)
+            limit: จำนวน records สูงสุดต่อหน้า
+            
+        Returns:
+            dict ที่มี 'columns' (dict ของคอลัมน์, rssi_data เป็น LazyDecodedColumn)
+            และ 'next_cursor' (None ถ้าเป็นหน้าสุดท้าย)
+        """
+        tag_mac = tag_mac.replace(":", "").upper()
+        
+        conditions = ["tag_mac = ?"]
+        params = [tag_mac]
+        
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(format_timestamp(start_time))
+        if end_time is not None:
+            conditions.append("timestamp <= ?")
+            params.append(format_timestamp(end_time))
+        if cursor:
+            conditions.append("(timestamp, id) > (?, ?)")
+            params.extend(decode_cursor(cursor))
+        
+        # ดึงเกิน 1 แถวเพื่อรู้ว่ามีหน้าถัดไปหรือไม่
+        params.append(limit + 1)
+        
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, timestamp, (julianday(timestamp) - 2440587.5) * 86400.0,
+                       floor, x, y, confidence, gateway_count, rssi_data
+                FROM position_history
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp, id
+                LIMIT ?
+            ''', params).fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        
+        names = ('id', 'raw_timestamp', 'timestamp', 'floor', 'x', 'y',
+                 'confidence', 'gateway_count', 'rssi_data')
+        values = list(zip(*rows)) if rows else [()] * len(names)
+        columns = {name: list(column) for name, column in zip(names, values)}
+        
+        del columns['raw_timestamp']
+        _, gateway_macs = self.get_gateway_id_maps()
+        columns['rssi_data'] = LazyDecodedColumn(columns['rssi_data'],
+                                                 lambda raw: decode_rssi(raw, gateway_macs))
+        
+        return {'columns': columns, 'next_cursor': next_cursor}
     
+    def get_position_track(self, tag_mac: str, start_time: float = None,
+                           end_time: float = None, floor: int = None) -> Dict[str, list]:
+        """
+        ดึงเส้นทางของ Tag ตามช่วงเวลา เรียงตามเวลา (สำหรับ batch processing)
+
+        Args:
+            tag_mac: MAC Address ของ Tag
+            start_time: เวลาเริ่มต้น (Unix epoch, optional)
+            end_time: เวลาสิ้นสุด (Unix epoch, optional)
+            floor: ชั้น (optional)
+
+        Returns:
+            dict ของคอลัมน์ id, timestamp (epoch seconds), floor, x, y, confidence
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            tag_mac = tag_mac.replace(":", "").upper()
+
+            conditions = ["tag_mac = ?"]
+            params = [tag_mac]
+
+            if start_time is not None:
+                conditions.append("timestamp >= ?")
+                params.append(format_timestamp(start_time))
+            if end_time is not None:
+                conditions.append("timestamp <= ?")
+                params.append(format_timestamp(end_time))
+            if floor is not None:
+                conditions.append("floor = ?")
+                params.append(floor)
+
+            cursor.execute(f'''
+                SELECT id, (julianday(timestamp) - 2440587.5) * 86400.0, floor, x, y, confidence
+                FROM position_history
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp, id
+            ''', params)
+
+            rows = cursor.fetchall()
+
+        columns = ('id', 'timestamp', 'floor', 'x', 'y', 'confidence')
+        if not rows:
+            return {name: [] for name in columns}
+
+        return {name: list(values) for name, values in zip(columns, zip(*rows))}
+
+    def iter_positions(self, tag_macs: List[str] = None, floor: int = None,
+                       start_time: float = None, end_time: float = None,
+                       min_interval: float = None, fetch_size: int = 1000):
+        """
+        อ่านตำแหน่งของหลาย Tag แบบ streaming (เรียงตาม tag_mac, timestamp)
+        ใช้ cursor เดียวตลอดการอ่าน จึงใช้หน่วยความจำคงที่ไม่ว่าผลลัพธ์จะใหญ่แค่ไหน
+
+        Args:
+            tag_macs: รายการ MAC Address ของ Tags (optional, ไม่ระบุ = ทุก Tag)
+            floor: ชั้น (optional)
+            start_time: เวลาเริ่มต้น (Unix epoch, optional)
+            end_time: เวลาสิ้นสุด (Unix epoch, optional)
+            min_interval: decimation - ข้ามแถวที่ห่างจากแถวก่อนหน้าของ Tag เดียวกันน้อยกว่านี้ (วินาที)
+            fetch_size: จำนวนแถวที่ดึงจาก cursor ต่อครั้ง
+
+        Yields:
+            list ของ tuple (tag_mac, timestamp epoch, floor, x, y, confidence, gateway_count)
+            ไม่เกิน fetch_size แถวต่อครั้ง
+        """
+        conditions = []
+        params = []
+
+        if tag_macs:
+            tag_macs = [mac.replace(":", "").upper() for mac in tag_macs]
+            conditions.append(f"tag_mac IN ({','.join('?' * len(tag_macs))})")
+            params.extend(tag_macs)
+        if floor is not None:
+            conditions.append("floor = ?")
+            params.append(floor)
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(format_timestamp(start_time))
+        if end_time is not None:
+            conditions.append("timestamp <= ?")
+            params.append(format_timestamp(end_time))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT tag_mac, (julianday(timestamp) - 2440587.5) * 86400.0,
+                       floor, x, y, confidence, gateway_count
+                FROM position_history
+                {where}
+                ORDER BY tag_mac, timestamp, id
+            ''', params)
+
+            last_tag = None
+            last_kept = None
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+
+                if min_interval:
+                    kept = []
+                    for row in rows:
+                        if row[0] != last_tag or row[1] - last_kept >= min_interval:
+                            kept.append(row)
+                            last_tag = row[0]
+                            last_kept = row[1]
+                    rows = kept
+
+                if rows:
+                    yield rows
+
+    def get_rssi_matrix(self, tag_mac: str, start_time: float = None,
+                        end_time: float = None) -> Dict:
+        """
+        ดึง rssi_data ของ Tag ตามช่วงเวลาเป็น matrix (decode ทุกแถวพร้อมกัน)
+
+        Args:
+            tag_mac: MAC Address ของ Tag
+            start_time: เวลาเริ่มต้น (Unix epoch, optional)
+            end_time: เวลาสิ้นสุด (Unix epoch, optional)
+
+        Returns:
+            dict ที่มี id, timestamp (np.ndarray), gateway_ids, gateway_macs
+            และ rssi (float32 shape (rows, gateways), NaN ถ้าไม่มีข้อมูล)
+        """
+        tag_mac = tag_mac.replace(":", "").upper()
+
+        conditions = ["tag_mac = ?"]
+        params = [tag_mac]
+
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(format_timestamp(start_time))
+        if end_time is not None:
+            conditions.append("timestamp <= ?")
+            params.append(format_timestamp(end_time))
+
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, (julianday(timestamp) - 2440587.5) * 86400.0, rssi_data
+                FROM position_history
+                WHERE {' AND '.join(conditions)}
+                ORDER BY timestamp, id
+            ''', params).fetchall()
+
+        ids, timestamps, raw_values = zip(*rows) if rows else ((), (), ())
+        gateway_ids, gateway_macs = self.get_gateway_id_maps()
+        columns, matrix = decode_rssi_matrix(list(raw_values), gateway_ids)
+
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'timestamp': np.array(timestamps, dtype=np.float64),
+            'gateway_ids': columns,
+            'gateway_macs': [gateway_macs.get(i, str(i)) for i in columns.tolist()],
+            'rssi': matrix
+        }
+
     def clear_old_positions(self, days: int = 7) -> int:
         """
         ลบตำแหน่งเก่าที่เกินกำหนด
@@ -396,17 +913,16 @@ class Database:
         Returns:
             จำนวน records ที่ลบ
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM position_history 
-            WHERE timestamp < datetime('now', '-' || ? || ' days')
-        ''', (days,))
-        
-        deleted_count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                DELETE FROM position_history 
+                WHERE timestamp < datetime('now', '-' || ? || ' days')
+            ''', (days,))
+            
+            deleted_count = cursor.rowcount
+            conn.commit()
         
         logger.info(f"Deleted {deleted_count} old position records")
         
@@ -414,6 +930,17 @@ class Database:
     
     # ==================== Zone Management ====================
     
+    def bump_zone_version(self) -> int:
+        """
+        เพิ่ม version ของตาราง zones (เรียกหลังแก้ไขข้อมูลโซนทุกครั้ง)
+        
+        Returns:
+            version ใหม่
+        """
+        with self._version_lock:
+            self.zone_version += 1
+            return self.zone_version
+    
     def add_zone(self, name: str, floor: int, x: float, y: float, radius: float,
                 color: str = '#3498db', enable_exit_alert: bool = False) -> int:
         """
@@ -431,17 +958,18 @@ class Database:
         Returns:
             ID ของโซน
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO zones (name, floor, x, y, radius, color, enable_exit_alert)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (name, floor, x, y, radius, color, 1 if enable_exit_alert else 0))
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO zones (name, floor, x, y, radius, color, enable_exit_alert)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (name, floor, x, y, radius, color, 1 if enable_exit_alert else 0))
+            
+            zone_id = cursor.lastrowid
+            conn.commit()
         
-        zone_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        self.bump_zone_version()
         
         logger.info(f"Added zone '{name}' at ({x}, {y}) on floor {floor}")
         
@@ -457,16 +985,26 @@ class Database:
         Returns:
             รายการโซน
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM zones WHERE floor = ? ORDER BY name', (floor,))
-        rows = cursor.fetchall()
-        
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM zones WHERE floor = ? ORDER BY name', (floor,))
+            rows = cursor.fetchall()
         
         return [dict(row) for row in rows]
-    
+
+    def get_all_zones(self) -> List[Dict]:
+        """
+        ดึงโซนทั้งหมด
+
+        Returns:
+            รายการโซนทั้งหมด
+        """
+        with self.connection() as conn:
+            rows = conn.execute('SELECT * FROM zones ORDER BY floor, id').fetchall()
+
+        return [dict(row) for row in rows]
+
     def delete_zone(self, zone_id: int) -> bool:
         """
         ลบโซน
@@ -477,33 +1015,37 @@ class Database:
         Returns:
             True หากลบสำเร็จ
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM zones WHERE id = ?', (zone_id,))
-        
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM zones WHERE id = ?', (zone_id,))
+            
+            success = cursor.rowcount > 0
+            conn.commit()
         
         if success:
+            self.bump_zone_version()
             logger.info(f"Deleted zone {zone_id}")
         
         return success
 
 
+# path ของฐานข้อมูลเมื่อไม่ระบุ (ตั้งผ่าน BLE_DB_PATH ได้ เช่น split_server.py --db)
+DEFAULT_DB_PATH = "ble_trilateration.db"
+
+
 # สร้าง instance สำหรับใช้งาน
-def get_database(db_path: str = "ble_trilateration.db") -> Database:
+def get_database(db_path: Optional[str] = None) -> Database:
     """
     สร้าง Database instance
     
     Args:
-        db_path: path ของไฟล์ฐานข้อมูล
+        db_path: path ของไฟล์ฐานข้อมูล (None = BLE_DB_PATH หรือ DEFAULT_DB_PATH)
         
     Returns:
         Database instance
     """
-    return Database(db_path)
+    return Database(db_path or os.environ.get('BLE_DB_PATH', DEFAULT_DB_PATH))
 
 
 # For testing
@@ -543,6 +1085,7 @@ if __name__ == "__main__":
     print("\nTest complete!")
     
     # ลบไฟล์ทดสอบ
+    db.close()
     import os
     os.remove("test.db")
 
@@ -0,0 +1,244 @@
+"""
+Event Stream
+Server-Sent Events สำหรับ consumers ที่ไม่ใช่ browser (ตำแหน่งและสถานะ Gateway)
+แต่ละ event ถูก serialize ครั้งเดียวและเก็บใน replay buffer แบบจำกัดขนาด
+เพื่อให้ client ที่เชื่อมต่อใหม่ด้วย Last-Event-ID รับ events ที่พลาดไปได้
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Event:
+    """event หนึ่งรายการใน replay buffer"""
+
+    __slots__ = ('id', 'type', 'floor', 'tag_mac', 'payload')
+
+    def __init__(self, event_id: int, event_type: str, floor, tag_mac, payload: bytes):
+        self.id = event_id
+        self.type = event_type
+        self.floor = floor
+        self.tag_mac = tag_mac
+        self.payload = payload
+
+
+def format_event(event_type: str, data: Dict, event_id: Optional[str] = None) -> bytes:
+    """
+    แปลง event เป็นรูปแบบ text/event-stream
+
+    Args:
+        event_type: ชื่อ event
+        data: ข้อมูล (serialize เป็น JSON บรรทัดเดียว)
+        event_id: ID ของ event (None = ไม่ระบุ, ไม่เปลี่ยน Last-Event-ID ของ client)
+
+    Returns:
+        bytes ของ event
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+class EventStream:
+    """
+    Replay buffer แบบวงแหวน + การรอ event ใหม่ของ subscribers
+
+    ลำดับของ event เพิ่มทีละหนึ่ง: event ลำดับ n อยู่ที่ช่อง n % buffer_size
+    ID ที่ส่งให้ client คือ "<instance>-<n>" เพื่อให้ ID จาก process ก่อน restart ไม่ถูกตีความเป็นลำดับของ process นี้
+    """
+
+    def __init__(self, buffer_size: int = 10000, heartbeat: float = 15.0, retry_ms: int = 3000,
+                 instance: Optional[str] = None):
+        """
+        เริ่มต้น EventStream
+
+        Args:
+            buffer_size: จำนวน events ล่าสุดที่เก็บไว้ให้ replay
+            heartbeat: ส่ง comment ทุกกี่วินาทีเมื่อไม่มี event (กัน proxy ตัด connection)
+            retry_ms: เวลาที่ client รอก่อนเชื่อมต่อใหม่ (field retry ของ SSE)
+            instance: prefix ของ event ID (None = สุ่มใหม่ทุกครั้งที่เริ่ม process)
+        """
+        self.instance = instance or os.urandom(4).hex()
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+
+        self._ring: List[Optional[_Event]] = [None] * buffer_size
+        self._next_id = 1
+        self._condition = threading.Condition()
+
+        # Statistics
+        self.published = 0
+        self.subscribers = 0
+        self.replayed = 0
+        self.gaps = 0
+
+    def publish(self, event_type: str, data: Dict, floor=None, tag_mac: Optional[str] = None) -> str:
+        """
+        เพิ่ม event และปลุก subscribers
+
+        Args:
+            event_type: ชื่อ event (เช่น 'position', 'gateway_status')
+            data: ข้อมูลของ event
+            floor: ชั้น (ใช้กับ filter floors)
+            tag_mac: Tag (ใช้กับ filter tags)
+
+        Returns:
+            ID ของ event
+        """
+        with self._condition:
+            event_id = self._next_id
+            self._next_id += 1
+            self._ring[event_id % self.buffer_size] = _Event(
+                event_id, event_type, floor, tag_mac, format_event(event_type, data, self.format_id(event_id)))
+            self.published += 1
+            self._condition.notify_all()
+        return self.format_id(event_id)
+
+    def format_id(self, seq: int) -> str:
+        """
+        แปลงลำดับของ event เป็น event ID ที่ส่งให้ client
+
+        Args:
+            seq: ลำดับของ event ใน process นี้
+
+        Returns:
+            "<instance>-<seq>"
+        """
+        return f"{self.instance}-{seq}"
+
+    def parse_id(self, event_id: str) -> Optional[int]:
+        """
+        แปลง event ID เป็นลำดับของ event
+
+        Args:
+            event_id: ID ที่ client ส่งมา (Last-Event-ID)
+
+        Returns:
+            ลำดับของ event หรือ None ถ้าไม่ใช่ ID ของ instance นี้
+        """
+        instance, _, seq = event_id.rpartition('-')
+        if instance != self.instance or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _oldest_id(self) -> int:
+        """ID ของ event ที่เก่าที่สุดที่ยังอยู่ใน buffer (ต้องถือ lock)"""
+        return max(1, self._next_id - self.buffer_size)
+
+    def subscribe(self, floors: Iterable = (), tag_macs: Iterable[str] = (), types: Iterable[str] = (),
+                  last_event_id: Optional[str] = None, initial: Iterable[bytes] = ()) -> Iterator[bytes]:
+        """
+        Generator ของ events สำหรับ SSE response
+
+        Args:
+            floors: ชั้นที่ต้องการ (ว่าง = ไม่ filter)
+            tag_macs: Tags ที่ต้องการ (ว่าง = ไม่ filter)
+            types: ชนิดของ event ที่ต้องการ (ว่าง = ทุกชนิด)
+            last_event_id: ID ล่าสุดที่ client ได้รับ (ค่าดิบจาก Last-Event-ID หรือ query, replay ตั้งแต่ event ถัดไป)
+            initial: events (ไม่มี ID) ที่แสดงสถานะปัจจุบัน ส่งให้ client ใหม่ และ client ที่ resume ไม่ได้ครบ
+
+        Yields:
+            bytes ของ text/event-stream
+        """
+        floors = set(floors)
+        tag_macs = {mac.replace(":", "").upper() for mac in tag_macs}
+        types = set(types)
+
+        def wanted(event: _Event) -> bool:
+            if types and event.type not in types:
+                return False
+            if not floors and not tag_macs:
+                return True
+            return event.floor in floors or event.tag_mac in tag_macs
+
+        with self._condition:
+            self.subscribers += 1
+            oldest = self._oldest_id()
+            gap = None
+            if last_event_id is None:
+                cursor = self._next_id
+            else:
+                seq = self.parse_id(last_event_id)
+                if seq is None or seq >= self._next_id:
+                    # ID จาก instance อื่น (เช่น ก่อน restart) หรือจากอนาคต: ไม่รู้ว่าพลาดอะไรไป
+                    # replay ทุก event ที่ยังอยู่ใน buffer
+                    cursor = oldest
+                    gap = {'from_id': None, 'to_id': self.format_id(oldest - 1) if oldest > 1 else None,
+                           'last_event_id': last_event_id}
+                elif seq + 1 < oldest:
+                    cursor = oldest
+                    gap = {'from_id': self.format_id(seq + 1), 'to_id': self.format_id(oldest - 1),
+                           'last_event_id': last_event_id}
+                else:
+                    cursor = seq + 1
+                if gap is not None:
+                    self.gaps += 1
+                self.replayed += self._next_id - cursor
+
+        try:
+            yield f"retry: {self.retry_ms}\n\n".encode()
+            if gap is not None:
+                yield format_event('gap', gap)
+            if last_event_id is None or gap is not None:
+                for payload in initial:
+                    yield payload
+            last_write = time.monotonic()
+
+            while True:
+                with self._condition:
+                    if cursor >= self._next_id:
+                        self._condition.wait(self.heartbeat)
+                    oldest = self._oldest_id()
+                    if cursor < oldest:
+                        # events ที่ client ยังไม่ได้รับถูกเขียนทับแล้ว
+                        missed = (cursor, oldest - 1)
+                        cursor = oldest
+                        self.gaps += 1
+                    else:
+                        missed = None
+                    end = self._next_id
+                    events = [self._ring[i % self.buffer_size] for i in range(cursor, end)]
+                    cursor = end
+
+                if missed is not None:
+                    yield format_event('gap', {'from_id': self.format_id(missed[0]),
+                                               'to_id': self.format_id(missed[1])})
+
+                chunk = b"".join(event.payload for event in events if wanted(event))
+                now = time.monotonic()
+                if chunk:
+                    yield chunk
+                    last_write = now
+                elif now - last_write >= self.heartbeat:
+                    yield b": keepalive\n\n"
+                    last_write = now
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ stream
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        with self._condition:
+            return {
+                'subscribers': self.subscribers,
+                'published': self.published,
+                'last_event_id': self.format_id(self._next_id - 1),
+                'buffered': min(self._next_id - 1, self.buffer_size),
+                'replayed': self.replayed,
+                'gaps': self.gaps
+            }
@@ -0,0 +1,209 @@
+"""
+Eventlet Server
+Serving mode สำหรับ production: Flask-SocketIO, WebSocket ingest จาก Gateway, Tracking Engine
+และการส่งตำแหน่งไปยัง Frontend ทำงานเป็น greenthreads บน eventlet hub เดียว
+การแก้ตำแหน่ง (solve_batch) และการเขียน SQLite ถูกส่งไปทำใน tpool (OS threads) เพื่อไม่ให้ block hub
+
+Usage:
+    python eventlet_server.py [--host 0.0.0.0] [--port 5000] [--ingest-port 8012]
+"""
+
+import eventlet
+
+# ต้อง patch ก่อน import โมดูลอื่น (threading, socket, time, queue กลายเป็น green)
+eventlet.monkey_patch()
+
+import argparse
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from eventlet import tpool, websocket, wsgi
+from eventlet.event import Event
+
+os.environ.setdefault('BLE_ASYNC_MODE', 'eventlet')
+
+logger = logging.getLogger(__name__)
+
+
+class ReadingBatcher:
+    """
+    รวม readings ที่มาในรอบเดียวกันของ hub แล้วเขียนด้วย batch_func ครั้งเดียว
+    (เทียบเท่า AsyncDatabase.write สำหรับ greenthreads)
+    """
+
+    def __init__(self, batch_func: Callable[[List], object], max_batch: int = 1000):
+        """
+        เริ่มต้น ReadingBatcher
+
+        Args:
+            batch_func: ฟังก์ชันที่รับ list ของ items แล้วเขียนใน transaction เดียว
+            max_batch: จำนวน items สูงสุดต่อการเรียก batch_func หนึ่งครั้ง
+        """
+        self.batch_func = batch_func
+        self.max_batch = max_batch
+
+        self._pending: List = []
+        self._event: Optional[Event] = None
+
+        # Metrics
+        self.items = 0
+        self.batches = 0
+        self.failed = 0
+        self.max_batch_size = 0
+
+    def write(self, item):
+        """
+        เขียน item และรอจน batch ที่มี item นี้ถูก commit (block เฉพาะ greenthread ที่เรียก)
+
+        Args:
+            item: ข้อมูลที่จะเขียน
+
+        Raises:
+            Exception: ถ้า batch ล้มเหลว
+        """
+        if self._event is None:
+            self._event = Event()
+            eventlet.spawn(self._flush)
+        event = self._event
+        self._pending.append(item)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        event.wait()
+
+    def _flush(self):
+        """เขียน items ที่สะสมไว้และปลุก greenthreads ที่รออยู่"""
+        items, event = self._pending, self._event
+        if event is None:
+            return
+        self._pending, self._event = [], None
+
+        self.batches += 1
+        self.items += len(items)
+        self.max_batch_size = max(self.max_batch_size, len(items))
+        try:
+            # sqlite3 ไม่ถูก monkey_patch: insert/commit (และการรอ database lock) ต้องไม่ block hub
+            tpool.execute(self.batch_func, items)
+        except Exception as e:
+            logger.error(f"Reading batch failed: {e}")
+            self.failed += len(items)
+            event.send_exception(e)
+            return
+        event.send(None)
+
+    def get_metrics(self) -> Dict:
+        """
+        ดึง metrics ของ batcher
+
+        Returns:
+            Dictionary ของ metrics
+        """
+        return {
+            'items': self.items,
+            'batches': self.batches,
+            'failed': self.failed,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0
+        }
+
+
+class EventletIngestServer:
+    """
+    WebSocket server สำหรับ Gateway บน eventlet (ใช้ logic เดียวกับ BLEWebSocketServer.handle_message)
+    """
+
+    def __init__(self, ws_server, persist: Optional[Callable] = None,
+                 host: str = "0.0.0.0", port: int = 8012):
+        """
+        เริ่มต้น EventletIngestServer
+
+        Args:
+            ws_server: BLEWebSocketServer (ประมวลผลข้อความและเก็บ readings)
+            persist: ฟังก์ชันที่บันทึก reading ก่อนตอบ ack (block เฉพาะ greenthread)
+            host: IP address to bind
+            port: Port number
+        """
+        self.ws_server = ws_server
+        self.persist = persist
+        self.host = host
+        self.port = port
+        self.app = websocket.WebSocketWSGI(self.handle_client)
+
+    def handle_client(self, ws):
+        """
+        จัดการ connection ของ Gateway หนึ่งตัว (หนึ่ง greenthread ต่อ connection)
+
+        Args:
+            ws: eventlet WebSocket
+        """
+        client_id = "%s:%s" % ws.socket.getpeername()[:2]
+        logger.info(f"New connection from {client_id}")
+        self.ws_server.clients.add(ws)
+
+        try:
+            while True:
+                message = ws.wait()
+                if message is None:
+                    break
+
+                response, reading = self.ws_server.handle_message(message, client_id)
+
+                if reading and self.persist:
+                    try:
+                        self.persist(reading)
+                        if self.ws_server.latency is not None:
+                            self.ws_server.latency.on_persist(reading)
+                    except Exception as e:
+                        response = {'status': 'error', 'message': str(e)}
+
+                ws.send(json.dumps(response))
+
+        except OSError:
+            logger.info(f"Connection closed: {client_id}")
+
+        finally:
+            self.ws_server.clients.discard(ws)
+            logger.info(f"Client disconnected: {client_id}")
+
+    def start(self):
+        """
+        เริ่มรับ connection (greenthread)
+        """
+        listener = eventlet.listen((self.host, self.port), backlog=1024)
+        eventlet.spawn(wsgi.server, listener, self.app, log_output=False, max_size=10000)
+        logger.info(f"Eventlet ingest server listening on ws://{self.host}:{self.port}/ws")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="รัน integrated server บน eventlet")
+    parser.add_argument("--host", default="0.0.0.0", help="IP address to bind")
+    parser.add_argument("--port", type=int, default=5000, help="Port ของ Flask/Socket.IO")
+    parser.add_argument("--ingest-port", type=int, default=8012, help="Port ของ WebSocket ingest")
+    parser.add_argument("--max-clients", type=int, default=20000,
+                        help="จำนวน connections พร้อมกันสูงสุดของ Flask/Socket.IO")
+    args = parser.parse_args()
+
+    import app_integrated as server
+
+    # solve_batch (NumPy) ทำงานใน tpool: ปล่อย hub ให้รับ ingest และส่งข้อความต่อระหว่างคำนวณ
+    server.tracking_engine.offload = tpool.execute
+
+    # sqlite3 ไม่ถูก monkey_patch: การเขียน position_history และ retention ทำใน tpool เช่นกัน
+    server.position_writer.offload = tpool.execute
+    server.retention_worker.offload = tpool.execute
+
+    batcher = ReadingBatcher(server.reading_archive.insert_readings)
+    ingest = EventletIngestServer(server.ws_server, persist=batcher.write,
+                                  host=args.host, port=args.ingest_port)
+    ingest.start()
+
+    server.start_background()
+
+    logger.info(f"Starting Flask Server (eventlet) on port {args.port}")
+    server.socketio.run(server.app, host=args.host, port=args.port, debug=False,
+                        max_size=args.max_clients)
+
+
+if __name__ == "__main__":
+    main()
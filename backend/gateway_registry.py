@@ -0,0 +1,165 @@
+"""
+Gateway Registry
+Cache ข้อมูล Gateway ในหน่วยความจำ แยกตามชั้น พร้อมพิกัดแบบ NumPy array
+Invalidate อัตโนมัติเมื่อ Database.gateway_version เปลี่ยน
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FloorLayout:
+    """
+    Snapshot ของ Gateways ในชั้นเดียว (ห้ามแก้ไขหลังสร้าง)
+    """
+
+    __slots__ = ('floor', 'version', 'gateways', 'macs', 'ids', 'coords', 'index')
+
+    def __init__(self, floor: int, version: int, gateways: List[Dict]):
+        """
+        เริ่มต้น FloorLayout
+
+        Args:
+            floor: ชั้น
+            version: gateway_version ตอนที่โหลด
+            gateways: รายการ Gateways ของชั้นนี้ (เรียงตาม mac_address)
+        """
+        self.floor = floor
+        self.version = version
+        self.gateways = gateways
+        self.macs = tuple(gw['mac_address'] for gw in gateways)
+        self.ids = np.array([gw['id'] for gw in gateways], dtype=np.int64)
+        self.coords = np.array([(gw['x'], gw['y']) for gw in gateways], dtype=np.float64).reshape(-1, 2)
+        self.coords.flags.writeable = False
+        self.index = {mac: i for i, mac in enumerate(self.macs)}
+
+    def __len__(self) -> int:
+        return len(self.macs)
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        """
+        Key สำหรับ cache ของ solver (เปลี่ยนเมื่อ layout ของชั้นนี้อาจเปลี่ยน)
+        """
+        return (self.floor, self.version)
+
+    def lookup(self, macs) -> np.ndarray:
+        """
+        แปลงรายการ MAC เป็น index ใน coords
+
+        Args:
+            macs: รายการ MAC Address ของ Gateway
+
+        Returns:
+            array ของ index (-1 ถ้าไม่ได้ลงทะเบียนในชั้นนี้)
+        """
+        get = self.index.get
+        return np.fromiter((get(mac, -1) for mac in macs), dtype=np.int64, count=len(macs))
+
+
+class GatewayRegistry:
+    """
+    Registry ของ Gateways ทั้งหมด โหลดจากฐานข้อมูลครั้งเดียวแล้วใช้ซ้ำ
+    จนกว่า Database.gateway_version จะเปลี่ยน
+    """
+
+    def __init__(self, db):
+        """
+        เริ่มต้น GatewayRegistry
+
+        Args:
+            db: Database instance
+        """
+        self.db = db
+        self._lock = threading.Lock()
+        self._version = None
+        self._gateways: List[Dict] = []
+        self._by_mac: Dict[str, Dict] = {}
+        self._floors: Dict[int, FloorLayout] = {}
+
+    @property
+    def version(self) -> int:
+        """version ปัจจุบันของตาราง gateways"""
+        return self.db.gateway_version
+
+    def _ensure_loaded(self):
+        """โหลดข้อมูลใหม่ถ้า version เปลี่ยน"""
+        if self._version == self.db.gateway_version:
+            return
+
+        with self._lock:
+            # อ่าน version ก่อนโหลด: ถ้ามีการแก้ไขระหว่างโหลด รอบหน้าจะโหลดใหม่อีกครั้ง
+            version = self.db.gateway_version
+            if self._version == version:
+                return
+
+            gateways = self.db.get_all_gateways()
+
+            by_floor: Dict[int, List[Dict]] = {}
+            for gw in gateways:
+                by_floor.setdefault(gw['floor'], []).append(gw)
+
+            self._gateways = gateways
+            self._by_mac = {gw['mac_address']: gw for gw in gateways}
+            self._floors = {
+                floor: FloorLayout(floor, version, sorted(items, key=lambda gw: gw['mac_address']))
+                for floor, items in by_floor.items()
+            }
+            self._version = version
+
+        logger.info(f"Gateway registry loaded {len(gateways)} gateways "
+                    f"on {len(self._floors)} floors (version {version})")
+
+    def get_floor(self, floor: int) -> FloorLayout:
+        """
+        ดึง layout ของ Gateways ในชั้นที่ระบุ
+
+        Args:
+            floor: ชั้น
+
+        Returns:
+            FloorLayout (ว่างถ้าไม่มี Gateway ในชั้นนี้)
+        """
+        self._ensure_loaded()
+        layout = self._floors.get(floor)
+        if layout is None:
+            return FloorLayout(floor, self._version, [])
+        return layout
+
+    def get_floors(self) -> List[int]:
+        """
+        รายการชั้นที่มี Gateway
+
+        Returns:
+            รายการชั้น
+        """
+        self._ensure_loaded()
+        return sorted(self._floors)
+
+    def get_gateway(self, mac_address: str) -> Optional[Dict]:
+        """
+        ดึงข้อมูล Gateway จาก MAC Address
+
+        Args:
+            mac_address: MAC Address ของ Gateway
+
+        Returns:
+            ข้อมูล Gateway หรือ None
+        """
+        self._ensure_loaded()
+        return self._by_mac.get(mac_address.replace(":", "").upper())
+
+    def get_all_gateways(self) -> List[Dict]:
+        """
+        ดึงข้อมูล Gateways ทั้งหมด (เรียงตาม floor, mac_address)
+
+        Returns:
+            รายการ Gateways
+        """
+        self._ensure_loaded()
+        return self._gateways
@@ -0,0 +1,124 @@
+"""
+Gateway Status Monitor
+ตรวจว่า Gateway แต่ละตัวยังส่ง readings อยู่หรือไม่ (online/offline) จาก latest_data ของ WebSocket Server
+และแจ้งเฉพาะเมื่อสถานะเปลี่ยน
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayStatusMonitor:
+    """
+    Background thread ที่ตรวจสถานะของ Gateways ทุก interval วินาที
+    Gateway ที่ไม่มี reading ใหม่นานกว่า timeout วินาทีถือว่า offline
+    """
+
+    def __init__(self, ws_server, gateway_registry, timeout: float = 30.0, interval: float = 5.0):
+        """
+        เริ่มต้น GatewayStatusMonitor
+
+        Args:
+            ws_server: BLEWebSocketServer (แหล่ง latest_data)
+            gateway_registry: GatewayRegistry (ชั้นและชื่อของ Gateway)
+            timeout: เวลาที่ไม่มี reading (วินาที) ก่อนถือว่า offline
+            interval: ระยะห่างระหว่างการตรวจ (วินาที)
+        """
+        self.ws_server = ws_server
+        self.gateway_registry = gateway_registry
+        self.timeout = timeout
+        self.interval = interval
+
+        # Callback ที่รับ status dict ทุกครั้งที่สถานะของ Gateway เปลี่ยน
+        self.on_change: Optional[Callable[[Dict], None]] = None
+
+        self._status: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.changes = 0
+
+    def start(self):
+        """
+        เริ่ม background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="gateway-status", daemon=True)
+        self._thread.start()
+        logger.info(f"Gateway status monitor started (timeout={self.timeout}s, interval={self.interval}s)")
+
+    def stop(self, timeout: float = 5.0):
+        """
+        หยุด background thread
+
+        Args:
+            timeout: เวลาสูงสุดที่รอ thread หยุด
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Loop ของ monitor thread"""
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Gateway status check failed: {e}", exc_info=True)
+
+    def check(self) -> List[Dict]:
+        """
+        ตรวจสถานะของทุก Gateway หนึ่งครั้ง
+
+        Returns:
+            รายการสถานะที่เปลี่ยนไปในรอบนี้
+        """
+        now = time.time()
+        latest = dict(self.ws_server.get_latest_data())
+        changed = []
+
+        with self._lock:
+            for gateway_mac in set(latest) | set(self._status):
+                reading = latest.get(gateway_mac)
+                last_seen = reading['received_at'] if reading else self._status[gateway_mac]['last_seen']
+                online = now - last_seen <= self.timeout
+
+                previous = self._status.get(gateway_mac)
+                gateway = self.gateway_registry.get_gateway(gateway_mac)
+                status = {
+                    'gateway_mac': gateway_mac,
+                    'name': gateway['name'] if gateway else None,
+                    'floor': gateway['floor'] if gateway else None,
+                    'online': online,
+                    'last_seen': last_seen,
+                    'rssi': reading['rssi'] if reading else None
+                }
+                self._status[gateway_mac] = status
+
+                if previous is None or previous['online'] != online:
+                    changed.append(status)
+            self.changes += len(changed)
+
+        if self.on_change is not None:
+            for status in changed:
+                self.on_change(status)
+        return changed
+
+    def get_status(self) -> List[Dict]:
+        """
+        ดึงสถานะล่าสุดของทุก Gateway ที่เคยส่ง reading
+
+        Returns:
+            รายการสถานะ
+        """
+        with self._lock:
+            return [dict(status) for status in self._status.values()]
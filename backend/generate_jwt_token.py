@@ -7,8 +7,7 @@ import jwt
 from datetime import datetime, timedelta
 import sys
 
-# Secret key (ต้องตรงกับใน websocket_server.py)
-SECRET_KEY = "ble-kku-secret-key-2025"
+from websocket_server import SECRET_KEY
 
 def generate_jwt_token(client_id: str = "eazytrax", expires_hours: int = 8760) -> str:
     """
@@ -0,0 +1,391 @@
+"""
+Geofence Engine
+ตรวจสอบตำแหน่งของ Tag กับโซนวงกลมในตาราง zones แบบ real-time
+ใช้ uniform grid ต่อชั้นเป็น spatial index จึงทดสอบเฉพาะโซนที่อยู่ใน cell เดียวกับ fix
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ZoneGrid:
+    """
+    Uniform grid ของโซนในชั้นเดียว (ห้ามแก้ไขหลังสร้าง)
+
+    แต่ละโซนถูกลงทะเบียนในทุก cell ที่ bounding box ของวงกลมทับ
+    เก็บแบบ CSR: cell_keys (เรียง) -> members[starts[i]:starts[i + 1]]
+    """
+
+    def __init__(self, floor: int, zones: List[Dict], cell_size: Optional[float] = None):
+        """
+        เริ่มต้น ZoneGrid
+
+        Args:
+            floor: ชั้น
+            zones: รายการโซนของชั้นนี้
+            cell_size: ขนาด cell (เมตร) ถ้าไม่ระบุใช้เส้นผ่านศูนย์กลางมัธยฐานของโซน
+        """
+        self.floor = floor
+        self.zones = zones
+        self.ids = np.array([z['id'] for z in zones], dtype=np.int64)
+        self.centers = np.array([(z['x'], z['y']) for z in zones], dtype=np.float64).reshape(-1, 2)
+        self.radius = np.array([z['radius'] for z in zones], dtype=np.float64)
+
+        if cell_size is None:
+            cell_size = float(np.median(self.radius) * 2.0) if len(zones) else 1.0
+        self.cell_size = max(cell_size, 0.1)
+
+        if len(zones) == 0:
+            self.origin = np.zeros(2)
+            self.shape = (0, 0)
+            self.cell_keys = np.empty(0, dtype=np.int64)
+            self.starts = np.zeros(1, dtype=np.int64)
+            self.members = np.empty(0, dtype=np.int64)
+            return
+
+        lo = self.centers - self.radius[:, None]
+        hi = self.centers + self.radius[:, None]
+        self.origin = lo.min(axis=0)
+        cell_lo = np.floor((lo - self.origin) / self.cell_size).astype(np.int64)
+        cell_hi = np.floor((hi - self.origin) / self.cell_size).astype(np.int64)
+        self.shape = tuple(int(v) + 1 for v in cell_hi.max(axis=0))
+
+        keys = []
+        members = []
+        for i in range(len(zones)):
+            cx = np.arange(cell_lo[i, 0], cell_hi[i, 0] + 1)
+            cy = np.arange(cell_lo[i, 1], cell_hi[i, 1] + 1)
+            cell = (cx[:, None] * self.shape[1] + cy[None, :]).ravel()
+            keys.append(cell)
+            members.append(np.full(len(cell), i, dtype=np.int64))
+
+        keys = np.concatenate(keys)
+        members = np.concatenate(members)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+
+        self.cell_keys, first = np.unique(keys, return_index=True)
+        self.starts = np.append(first, len(keys)).astype(np.int64)
+        self.members = members[order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def candidates(self, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        หาโซนที่อาจมีจุดอยู่ข้างใน (โซนใน cell เดียวกับจุด)
+
+        Args:
+            xy: พิกัด shape (n, 2)
+
+        Returns:
+            (index ของจุด, index ของโซน) ที่เป็น candidate
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if len(self.cell_keys) == 0 or len(xy) == 0:
+            return empty, empty
+
+        cell = np.floor((xy - self.origin) / self.cell_size).astype(np.int64)
+        inside = ((cell >= 0) & (cell < np.array(self.shape))).all(axis=1)
+        keys = cell[:, 0] * self.shape[1] + cell[:, 1]
+
+        pos = np.searchsorted(self.cell_keys, keys)
+        pos = np.minimum(pos, len(self.cell_keys) - 1)
+        found = inside & (self.cell_keys[pos] == keys)
+
+        start = np.where(found, self.starts[pos], 0)
+        counts = np.where(found, self.starts[pos + 1] - start, 0)
+        total = int(counts.sum())
+        if total == 0:
+            return empty, empty
+
+        point_idx = np.repeat(np.arange(len(xy)), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+        return point_idx, self.members[offsets]
+
+    def query(self, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        หาโซนที่แต่ละจุดอยู่ข้างใน (ระยะถึงจุดศูนย์กลาง <= radius)
+
+        Args:
+            xy: พิกัด shape (n, 2)
+
+        Returns:
+            (index ของจุด, index ของโซน)
+        """
+        point_idx, zone_idx = self.candidates(xy)
+        if len(point_idx) == 0:
+            return point_idx, zone_idx
+
+        d2 = ((xy[point_idx] - self.centers[zone_idx]) ** 2).sum(axis=1)
+        hit = d2 <= self.radius[zone_idx] ** 2
+        return point_idx[hit], zone_idx[hit]
+
+
+class ZoneIndex:
+    """
+    Spatial index ของโซนทั้งหมด แยกตามชั้น
+    โหลดใหม่อัตโนมัติเมื่อ Database.zone_version เปลี่ยน
+    """
+
+    def __init__(self, db, cell_size: Optional[float] = None):
+        """
+        เริ่มต้น ZoneIndex
+
+        Args:
+            db: Database instance
+            cell_size: ขนาด cell ของ grid (เมตร, optional)
+        """
+        self.db = db
+        self.cell_size = cell_size
+        self._lock = threading.Lock()
+        self._version = None
+        self._grids: Dict[int, ZoneGrid] = {}
+        self._zones: Dict[int, Dict] = {}
+
+    @property
+    def version(self) -> Optional[int]:
+        """zone_version ของข้อมูลที่โหลดอยู่"""
+        return self._version
+
+    def _ensure_loaded(self):
+        """โหลดโซนใหม่ถ้า version เปลี่ยน"""
+        if self._version == self.db.zone_version:
+            return
+
+        with self._lock:
+            version = self.db.zone_version
+            if self._version == version:
+                return
+
+            zones = self.db.get_all_zones()
+
+            by_floor: Dict[int, List[Dict]] = {}
+            for zone in zones:
+                by_floor.setdefault(zone['floor'], []).append(zone)
+
+            self._zones = {zone['id']: zone for zone in zones}
+            self._grids = {
+                floor: ZoneGrid(floor, items, self.cell_size)
+                for floor, items in by_floor.items()
+            }
+            self._version = version
+
+        logger.info(f"Zone index loaded {len(zones)} zones on {len(self._grids)} floors (version {version})")
+
+    def get_floor(self, floor: int) -> ZoneGrid:
+        """
+        ดึง grid ของโซนในชั้นที่ระบุ
+
+        Args:
+            floor: ชั้น
+
+        Returns:
+            ZoneGrid (ว่างถ้าไม่มีโซนในชั้นนี้)
+        """
+        self._ensure_loaded()
+        grid = self._grids.get(floor)
+        if grid is None:
+            return ZoneGrid(floor, [])
+        return grid
+
+    def get_zone(self, zone_id: int) -> Optional[Dict]:
+        """
+        ดึงข้อมูลโซนจาก id
+
+        Args:
+            zone_id: ID ของโซน
+
+        Returns:
+            ข้อมูลโซน หรือ None
+        """
+        self._ensure_loaded()
+        return self._zones.get(zone_id)
+
+    def hits(self, floors: np.ndarray, xy: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        หาโซนที่แต่ละ fix อยู่ข้างใน
+
+        Args:
+            floors: ชั้นของแต่ละ fix shape (n,)
+            xy: พิกัดของแต่ละ fix shape (n, 2)
+
+        Returns:
+            รายการ (index ของ fix, zone_id)
+        """
+        self._ensure_loaded()
+        grids = self._grids
+
+        result = []
+        for floor in np.unique(floors).tolist():
+            grid = grids.get(floor)
+            if grid is None:
+                continue
+            rows = np.nonzero(floors == floor)[0]
+            point_idx, zone_idx = grid.query(xy[rows])
+            result.extend(zip(rows[point_idx].tolist(), grid.ids[zone_idx].tolist()))
+        return result
+
+
+class GeofenceEngine:
+    """
+    เก็บสถานะ inside/outside ของแต่ละ Tag และสร้าง event เมื่อเข้า/ออกโซน
+
+    ใช้ hysteresis ตอนออกจากโซน: Tag ที่อยู่ในโซนแล้วจะถือว่ายังอยู่จนกว่า
+    ระยะจากจุดศูนย์กลางจะเกิน radius + hysteresis (กัน event กระพริบที่ขอบโซน)
+    """
+
+    def __init__(self, zone_index: ZoneIndex, hysteresis: float = 0.5,
+                 on_event: Optional[Callable[[Dict], None]] = None):
+        """
+        เริ่มต้น GeofenceEngine
+
+        Args:
+            zone_index: ZoneIndex
+            hysteresis: ระยะเผื่อตอนออกจากโซน (เมตร)
+            on_event: callback ที่ถูกเรียกกับทุก event (เช่น socketio.emit)
+        """
+        self.zone_index = zone_index
+        self.hysteresis = hysteresis
+        self.on_event = on_event
+
+        self._lock = threading.Lock()
+        self._inside: Dict[str, set] = {}
+        self._version = None
+
+        # Statistics
+        self.fixes = 0
+        self.events = 0
+
+    def _prune_removed_zones(self):
+        """ลบสถานะของโซนที่ถูกลบออกจากฐานข้อมูลแล้ว (ไม่สร้าง exit event)"""
+        if self._version == self.zone_index.version:
+            return
+        for zones in self._inside.values():
+            zones.difference_update([z for z in zones if self.zone_index.get_zone(z) is None])
+        self._version = self.zone_index.version
+
+    def process(self, records: List[Tuple]) -> List[Dict]:
+        """
+        ประมวลผล fixes ใหม่ (เรียงตามเวลา) และสร้าง enter/exit events
+
+        Args:
+            records: list ของ (tag_mac, floor, x, y, timestamp epoch)
+
+        Returns:
+            รายการ events
+        """
+        if not records:
+            return []
+
+        floors = np.array([r[1] for r in records], dtype=np.int64)
+        xy = np.array([(r[2], r[3]) for r in records], dtype=np.float64)
+
+        hits: Dict[int, set] = {}
+        for i, zone_id in self.zone_index.hits(floors, xy):
+            hits.setdefault(i, set()).add(zone_id)
+
+        events = []
+        with self._lock:
+            self._prune_removed_zones()
+
+            for i, (tag_mac, floor, x, y, ts) in enumerate(records):
+                inside = self._inside.setdefault(tag_mac, set())
+                now_inside = hits.get(i, set())
+
+                for zone_id in inside - now_inside:
+                    zone = self.zone_index.get_zone(zone_id)
+                    if zone is not None and zone['floor'] == floor:
+                        limit = zone['radius'] + self.hysteresis
+                        if (x - zone['x']) ** 2 + (y - zone['y']) ** 2 <= limit * limit:
+                            now_inside.add(zone_id)
+                            continue
+                    events.append(self._event('exit', tag_mac, zone_id, zone, floor, x, y, ts))
+
+                for zone_id in now_inside - inside:
+                    events.append(self._event('enter', tag_mac, zone_id,
+                                              self.zone_index.get_zone(zone_id), floor, x, y, ts))
+
+                self._inside[tag_mac] = now_inside
+
+            self.fixes += len(records)
+            self.events += len(events)
+
+        if self.on_event is not None:
+            for event in events:
+                try:
+                    self.on_event(event)
+                except Exception as e:
+                    logger.error(f"Geofence event callback failed: {e}")
+
+        return events
+
+    def update(self, tag_mac: str, floor: int, x: float, y: float,
+               timestamp: Optional[float] = None) -> List[Dict]:
+        """
+        ประมวลผล fix เดียว
+
+        Args:
+            tag_mac: MAC Address ของ Tag
+            floor: ชั้น
+            x: พิกัด X
+            y: พิกัด Y
+            timestamp: เวลา (Unix epoch, default เวลาปัจจุบัน)
+
+        Returns:
+            รายการ events
+        """
+        return self.process([(tag_mac, floor, x, y, timestamp or time.time())])
+
+    @staticmethod
+    def _event(kind: str, tag_mac: str, zone_id: int, zone: Optional[Dict],
+               floor: int, x: float, y: float, ts: float) -> Dict:
+        """สร้าง event dict"""
+        return {
+            'event': kind,
+            'tag_mac': tag_mac,
+            'zone_id': zone_id,
+            'zone_name': zone['name'] if zone else None,
+            'floor': floor,
+            'x': round(x, 2),
+            'y': round(y, 2),
+            'timestamp': ts,
+            'alert': kind == 'exit' and bool(zone and zone.get('enable_exit_alert'))
+        }
+
+    def get_state(self, tag_mac: Optional[str] = None) -> Dict[str, List[int]]:
+        """
+        ดึงรายการโซนที่แต่ละ Tag อยู่ข้างใน
+
+        Args:
+            tag_mac: MAC Address ของ Tag (optional, ไม่ระบุ = ทุก Tag)
+
+        Returns:
+            dict ของ tag_mac -> รายการ zone_id
+        """
+        with self._lock:
+            if tag_mac is not None:
+                return {tag_mac: sorted(self._inside.get(tag_mac, ()))}
+            return {tag: sorted(zones) for tag, zones in self._inside.items() if zones}
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ geofence engine
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        with self._lock:
+            return {
+                'zone_version': self.zone_index.version,
+                'tags': len(self._inside),
+                'tags_inside': sum(1 for zones in self._inside.values() if zones),
+                'fixes': self.fixes,
+                'events': self.events
+            }
@@ -0,0 +1,343 @@
+"""
+Latency Trace
+วัดเวลาของแต่ละช่วงตั้งแต่ reading ออกจาก Gateway จนถึงตำแหน่งที่ส่งออกจาก server
+เก็บเป็น histogram แบบ HDR (log-linear, ความละเอียดคงที่ ~1%) แยกตาม stage และชั้น
+และตรวจ Gateway ที่นาฬิกาของตัวเองต่างจากเวลาที่ server ได้รับมากเกินไป
+
+Stages (ทุกค่าเป็นวินาทีแบบ wall clock เพื่อให้เทียบข้าม process ได้):
+    receive     received_at - timestamp ของ Gateway (network + clock offset ของ Gateway)
+    queue       เวลาเริ่มรอบของ tracking engine - received_at ของ reading ล่าสุดที่ใช้คำนวณ
+    solve       เวลาที่คำนวณตำแหน่งเสร็จ - เวลาเริ่มรอบ
+    persist     เวลาที่บันทึก reading ลง archive เสร็จ - received_at
+    emit        เวลาที่ส่งตำแหน่งให้ subscribers เสร็จ (outbox, frames, SSE) - received_at ของ reading ล่าสุด
+    end_to_end  เวลาที่ส่งตำแหน่งเสร็จ - timestamp ของ Gateway ของ reading ล่าสุด
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('receive', 'queue', 'solve', 'persist', 'emit', 'end_to_end')
+
+# Histogram: ค่าเป็นไมโครวินาที, 128 sub-buckets ต่อช่วงกำลังสอง (ความคลาดเคลื่อน < 1%)
+SUB_BUCKET_BITS = 7
+HALF_SUB_BUCKETS = 1 << (SUB_BUCKET_BITS - 1)
+MAX_EXPONENT = 30
+BUCKET_COUNT = (MAX_EXPONENT + 2) * HALF_SUB_BUCKETS
+
+
+def bucket_index(value_us: int) -> int:
+    """
+    หา index ของ bucket สำหรับค่า (ไมโครวินาที)
+
+    Args:
+        value_us: ค่า (ไม่ติดลบ)
+
+    Returns:
+        index ใน counts
+    """
+    exponent = max(0, value_us.bit_length() - SUB_BUCKET_BITS)
+    return min(exponent * HALF_SUB_BUCKETS + (value_us >> exponent), BUCKET_COUNT - 1)
+
+
+def bucket_value(index: int) -> int:
+    """
+    ค่ากลางของ bucket (ไมโครวินาที)
+
+    Args:
+        index: index ใน counts
+
+    Returns:
+        ค่ากลางของช่วงที่ bucket นี้ครอบคลุม
+    """
+    exponent = max(0, index // HALF_SUB_BUCKETS - 1)
+    low = (index - exponent * HALF_SUB_BUCKETS) << exponent
+    return low + ((1 << exponent) >> 1)
+
+
+class _Shard:
+    """counts ของ thread เดียว (มีผู้เขียนคนเดียวจึงไม่ต้องใช้ lock)"""
+
+    __slots__ = ('counts', 'count', 'total_us', 'max_us', 'negative')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.negative = 0
+
+
+class LatencyHistogram:
+    """
+    Histogram ของ latency ที่บันทึกได้โดยไม่ใช้ lock
+
+    แต่ละ OS thread เขียนลง shard ของตัวเอง การอ่านรวมทุก shard
+    (อาจขาดค่าที่กำลังบันทึกอยู่ในขณะนั้นเล็กน้อย ซึ่งยอมรับได้สำหรับ metrics)
+    """
+
+    def __init__(self):
+        self._shards: Dict[int, _Shard] = {}
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        """shard ของ thread ปัจจุบัน (สร้างครั้งแรกภายใต้ lock)"""
+        ident = threading.get_native_id()
+        shard = self._shards.get(ident)
+        if shard is None:
+            with self._shards_lock:
+                shard = self._shards.setdefault(ident, _Shard())
+        return shard
+
+    def record(self, seconds: float, count: int = 1):
+        """
+        บันทึกค่า
+
+        Args:
+            seconds: latency (วินาที) ค่าติดลบถูกนับแยกและบันทึกเป็น 0
+            count: จำนวนครั้งของค่านี้
+        """
+        shard = self._shard()
+        value_us = int(seconds * 1e6)
+        if value_us < 0:
+            shard.negative += count
+            value_us = 0
+        shard.counts[bucket_index(value_us)] += count
+        shard.count += count
+        shard.total_us += value_us * count
+        if value_us > shard.max_us:
+            shard.max_us = value_us
+
+    def snapshot(self, percentiles=(50, 90, 99, 99.9)) -> Dict:
+        """
+        สรุป histogram
+
+        Args:
+            percentiles: percentiles ที่ต้องการ
+
+        Returns:
+            Dictionary ของ count, mean, percentiles และ max (มิลลิวินาที)
+        """
+        shards = list(self._shards.values())
+        counts = [0] * BUCKET_COUNT
+        for shard in shards:
+            for i, n in enumerate(shard.counts):
+                if n:
+                    counts[i] += n
+        total = sum(counts)
+        result = {
+            'count': total,
+            'mean_ms': round(sum(s.total_us for s in shards) / total / 1000.0, 3) if total else 0.0,
+            'max_ms': round(max((s.max_us for s in shards), default=0) / 1000.0, 3),
+            'negative': sum(s.negative for s in shards)
+        }
+
+        targets = sorted(percentiles)
+        values = {}
+        seen = 0
+        t = 0
+        for i, n in enumerate(counts):
+            if not n:
+                continue
+            seen += n
+            while t < len(targets) and seen >= total * targets[t] / 100.0:
+                values[targets[t]] = bucket_value(i)
+                t += 1
+            if t == len(targets):
+                break
+        for p in percentiles:
+            result[f"p{p:g}_ms"] = round(values.get(p, 0) / 1000.0, 3)
+        return result
+
+
+class _GatewayClock:
+    """ค่า offset (EWMA) ระหว่างเวลาที่ server ได้รับกับ timestamp ของ Gateway หนึ่งตัว"""
+
+    __slots__ = ('offset', 'samples', 'last_seen', 'flagged')
+
+    def __init__(self, offset: float):
+        self.offset = offset
+        self.samples = 0
+        self.last_seen = 0.0
+        self.flagged = False
+
+
+class LatencyTracker:
+    """
+    รวม histograms ของทุก stage (รวมทุกชั้นและแยกตามชั้น) และ offset ของนาฬิกาแต่ละ Gateway
+
+    ถูกเรียกจาก WebSocket Server (receive, persist) และ Tracking Engine (queue, solve, emit, end_to_end)
+    """
+
+    def __init__(self, floor_of: Optional[Callable[[str], Optional[int]]] = None,
+                 drift_threshold: float = 2.0, drift_alpha: float = 0.05, min_samples: int = 20):
+        """
+        เริ่มต้น LatencyTracker
+
+        Args:
+            floor_of: ฟังก์ชันที่หาชั้นจาก MAC Address ของ Gateway (ใช้กับ stage ระดับ reading)
+            drift_threshold: offset (วินาที) ที่ถือว่านาฬิกาของ Gateway คลาดเคลื่อน
+            drift_alpha: น้ำหนักของ sample ใหม่ใน EWMA ของ offset
+            min_samples: จำนวน samples ขั้นต่ำก่อนตัดสินว่าคลาดเคลื่อน
+        """
+        self.floor_of = floor_of
+        self.drift_threshold = drift_threshold
+        self.drift_alpha = drift_alpha
+        self.min_samples = min_samples
+
+        self._histograms: Dict[tuple, LatencyHistogram] = {}
+        self._histograms_lock = threading.Lock()
+        self._clocks: Dict[str, _GatewayClock] = {}
+
+    def _histogram(self, stage: str, floor) -> LatencyHistogram:
+        """histogram ของ (stage, floor) (floor None = ทุกชั้น)"""
+        key = (stage, floor)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._histograms_lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        return histogram
+
+    def record(self, stage: str, seconds: float, floor=None, count: int = 1):
+        """
+        บันทึก latency ของ stage
+
+        Args:
+            stage: ชื่อ stage (ดู STAGES)
+            seconds: latency (วินาที)
+            floor: ชั้น (None = ไม่ทราบ, บันทึกเฉพาะรวมทุกชั้น)
+            count: จำนวนครั้งของค่านี้
+        """
+        self._histogram(stage, None).record(seconds, count)
+        if floor is not None:
+            self._histogram(stage, floor).record(seconds, count)
+
+    def _floor(self, gateway_mac: str):
+        """ชั้นของ Gateway (None ถ้าไม่ทราบ)"""
+        return self.floor_of(gateway_mac) if self.floor_of is not None else None
+
+    # ==================== Hooks ====================
+
+    def on_receive(self, reading: Dict):
+        """
+        บันทึก stage receive และ offset ของนาฬิกา Gateway (เรียกจาก ingest เมื่อได้รับ reading)
+
+        Args:
+            reading: reading ที่มี timestamp (ของ Gateway) และ received_at
+        """
+        try:
+            sent_at = float(reading['timestamp'])
+        except (TypeError, ValueError):
+            return
+        offset = reading['received_at'] - sent_at
+        gateway_mac = reading['gateway_mac']
+        self.record('receive', offset, self._floor(gateway_mac))
+
+        clock = self._clocks.get(gateway_mac)
+        if clock is None:
+            clock = self._clocks[gateway_mac] = _GatewayClock(offset)
+        else:
+            clock.offset += self.drift_alpha * (offset - clock.offset)
+        clock.samples += 1
+        clock.last_seen = reading['received_at']
+
+        flagged = clock.samples >= self.min_samples and abs(clock.offset) > self.drift_threshold
+        if flagged != clock.flagged:
+            clock.flagged = flagged
+            if flagged:
+                logger.warning(f"Gateway {gateway_mac} clock drifts {clock.offset:+.3f}s from server receive time")
+            else:
+                logger.info(f"Gateway {gateway_mac} clock back within {self.drift_threshold}s of server time")
+
+    def on_persist(self, reading: Dict):
+        """
+        บันทึก stage persist (เรียกหลังบันทึก reading ลง archive เสร็จ)
+
+        Args:
+            reading: reading ที่บันทึกแล้ว
+        """
+        self.record('persist', time.time() - reading['received_at'], self._floor(reading['gateway_mac']))
+
+    def on_solved(self, positions: List[Dict]):
+        """
+        บันทึก stage queue และ solve ของรอบหนึ่ง (เรียกจาก Tracking Engine)
+
+        Args:
+            positions: ตำแหน่งของรอบ (timestamp = เวลาเริ่มรอบ, gateways = readings ที่ใช้)
+        """
+        solved_at = time.time()
+        per_floor: Dict = {}
+        for pos in positions:
+            newest = max(r['received_at'] for r in pos['gateways'])
+            self.record('queue', pos['timestamp'] - newest, pos['floor'])
+            per_floor.setdefault(pos['floor'], pos['timestamp'])
+        for floor, started in per_floor.items():
+            count = sum(1 for pos in positions if pos['floor'] == floor)
+            self.record('solve', solved_at - started, floor, count)
+
+    def on_emit(self, positions: List[Dict]):
+        """
+        บันทึก stage emit และ end_to_end (เรียกหลังส่งตำแหน่งให้ subscribers เสร็จ)
+
+        Args:
+            positions: ตำแหน่งที่ส่งแล้ว
+        """
+        emitted_at = time.time()
+        for pos in positions:
+            newest = max(pos['gateways'], key=lambda r: r['received_at'])
+            self.record('emit', emitted_at - newest['received_at'], pos['floor'])
+            try:
+                self.record('end_to_end', emitted_at - float(newest['timestamp']), pos['floor'])
+            except (TypeError, ValueError):
+                pass
+
+    # ==================== Queries ====================
+
+    def get_gateway_clocks(self, drifting_only: bool = False) -> List[Dict]:
+        """
+        ดึง offset ของนาฬิกาแต่ละ Gateway
+
+        Args:
+            drifting_only: เฉพาะ Gateways ที่ถูก flag ว่าคลาดเคลื่อน
+
+        Returns:
+            รายการ offset เรียงจากคลาดเคลื่อนมากที่สุด
+        """
+        clocks = [
+            {
+                'gateway_mac': gateway_mac,
+                'offset_ms': round(clock.offset * 1000.0, 1),
+                'samples': clock.samples,
+                'last_seen': clock.last_seen,
+                'drifting': clock.flagged
+            }
+            for gateway_mac, clock in list(self._clocks.items())
+            if clock.flagged or not drifting_only
+        ]
+        return sorted(clocks, key=lambda c: -abs(c['offset_ms']))
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสรุป latency ของทุก stage (รวมและแยกตามชั้น) และ Gateways ที่นาฬิกาคลาดเคลื่อน
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        stages = {}
+        floors: Dict = {}
+        for (stage, floor), histogram in sorted(self._histograms.items(), key=lambda item: str(item[0])):
+            if floor is None:
+                stages[stage] = histogram.snapshot()
+            else:
+                floors.setdefault(str(floor), {})[stage] = histogram.snapshot()
+
+        return {
+            'stages': {stage: stages[stage] for stage in STAGES if stage in stages},
+            'floors': floors,
+            'gateways': len(self._clocks),
+            'drift_threshold_ms': self.drift_threshold * 1000.0,
+            'drifting_gateways': self.get_gateway_clocks(drifting_only=True)
+        }
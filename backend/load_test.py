@@ -0,0 +1,275 @@
+"""
+Load Test
+เปรียบเทียบ serving mode แบบ threading (app_integrated.py) กับ eventlet (eventlet_server.py)
+ด้วย Socket.IO clients จำนวนมาก (websocket transport) และ Gateways ที่ส่ง readings เข้ามาพร้อมกัน
+
+วัด:
+    - เวลาและจำนวน clients ที่เชื่อมต่อ/subscribe สำเร็จ
+    - จำนวน position updates ที่ clients ได้รับต่อวินาที
+    - fan-out spread: เวลาที่ client ได้รับ update หลัง client แรกที่ได้รับ update เดียวกัน
+    - ack latency ของ ingest (ส่ง reading -> ได้รับ ack)
+
+Usage:
+    python load_test.py --modes threading eventlet --clients 1000 10000
+    python load_test.py --url http://host:5000 --ingest-url ws://host:8012/ws --clients 1000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+
+import numpy as np
+import websockets
+
+from websocket_server import BLEWebSocketServer, SECRET_KEY
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVERS = {
+    'threading': 'app_integrated.py',
+    'eventlet': 'eventlet_server.py'
+}
+FLOOR = 5
+
+
+def percentile(values: List[float], q: float) -> float:
+    """percentile ของ list (ms) หรือ NaN ถ้าว่าง"""
+    return float(np.percentile(values, q)) if values else math.nan
+
+
+class Stats:
+    """ผลรวมของหนึ่งรอบการทดสอบ"""
+
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.connect_seconds = 0.0
+        self.updates = 0
+        self.bytes = 0
+        self.first_seen: Dict[tuple, float] = {}
+        self.arrivals: List[tuple] = []
+        self.acks: List[float] = []
+        self.ack_errors = 0
+        self.measuring = False
+
+
+async def run_client(url: str, stats: Stats, ready: asyncio.Event, stop: asyncio.Event):
+    """Socket.IO client หนึ่งราย (Engine.IO v4 ผ่าน websocket โดยตรง)"""
+    try:
+        async with websockets.connect(url, max_queue=None, open_timeout=60, ping_interval=None) as ws:
+            await ws.recv()                      # 0{sid, pingInterval, ...}
+            await ws.send('40')
+            while not (await ws.recv()).startswith('40'):
+                pass
+            await ws.send('42' + json.dumps(['start_tracking', {'floor': FLOOR}]))
+            stats.connected += 1
+            ready.set()
+
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                if message == '2':
+                    await ws.send('3')
+                    continue
+                if not stats.measuring or not message.startswith('42["position_update"'):
+                    continue
+
+                now = time.perf_counter()
+                data = json.loads(message[2:])[1]
+                key = (data['tag_mac'], data['x'], data['y'])
+                stats.first_seen.setdefault(key, now)
+                stats.arrivals.append((key, now))
+                stats.updates += 1
+                stats.bytes += len(message)
+    except Exception:
+        stats.failed += 1
+        ready.set()
+
+
+async def run_gateway(url: str, gateway: Dict, tags: np.ndarray, rate: float,
+                      stats: Stats, stop: asyncio.Event):
+    """Gateway หนึ่งตัวที่ส่ง reading ของทุก Tag วนไปด้วยอัตรา rate ข้อความ/วินาที"""
+    token = BLEWebSocketServer(secret_key=SECRET_KEY).generate_jwt_token(client_id="load-test")
+    position = np.array([gateway['x'], gateway['y']])
+    rng = random.Random(gateway['mac_address'])
+
+    async with websockets.connect(url, max_queue=None, ping_interval=None) as ws:
+        while not stop.is_set():
+            for t, tag in enumerate(tags):
+                if stop.is_set():
+                    break
+                drift = 0.5 * math.sin(time.time() / 3.0 + t)
+                distance = float(np.hypot(*(tag + drift - position))) * rng.uniform(0.97, 1.03)
+                sent = time.perf_counter()
+                await ws.send(json.dumps({
+                    'token': token,
+                    'gateway_mac': gateway['mac_address'],
+                    'tag_mac': f"AA00000{t:05X}",
+                    'rssi': -59 - 20 * math.log10(max(distance, 0.1)),
+                    'distance': distance,
+                    'timestamp': time.time()
+                }))
+                reply = json.loads(await ws.recv())
+                if stats.measuring:
+                    stats.acks.append((time.perf_counter() - sent) * 1000.0)
+                    if reply.get('status') != 'success':
+                        stats.ack_errors += 1
+                await asyncio.sleep(1.0 / rate)
+
+
+def seed_gateways(base_url: str, count: int) -> List[Dict]:
+    """ลงทะเบียน Gateways เป็นวงรอบพื้นที่ 80 x 60 เมตร ผ่าน /api/gateways/import"""
+    gateways = []
+    for i in range(count):
+        angle = 2 * math.pi * i / count
+        gateways.append({
+            'mac_address': f"BB00000000{i:02X}",
+            'name': f"LT-{i}",
+            'floor': FLOOR,
+            'x': round(40 + 35 * math.cos(angle), 2),
+            'y': round(30 + 25 * math.sin(angle), 2)
+        })
+    body = json.dumps(gateways).encode()
+    request = urllib.request.Request(f"{base_url}/api/gateways/import", data=body,
+                                     headers={'Content-Type': 'application/json'})
+    urllib.request.urlopen(request, timeout=30).read()
+    return gateways
+
+
+async def run_scenario(base_url: str, ingest_url: str, clients: int, tags: int, gateways: int,
+                       rate: float, warmup: float, duration: float, connect_batch: int) -> Stats:
+    """เชื่อมต่อ clients ทั้งหมด ส่ง readings แล้ววัดผลเป็นเวลา duration วินาที"""
+    stats = Stats()
+    stop = asyncio.Event()
+    layout = seed_gateways(base_url, gateways)
+
+    rng = np.random.default_rng(0)
+    tag_positions = np.column_stack([rng.uniform(10, 70, tags), rng.uniform(10, 50, tags)])
+
+    socket_url = base_url.replace('http', 'ws', 1) + '/socket.io/?EIO=4&transport=websocket'
+    started = time.perf_counter()
+    tasks = []
+    for start in range(0, clients, connect_batch):
+        batch = []
+        for _ in range(min(connect_batch, clients - start)):
+            ready = asyncio.Event()
+            tasks.append(asyncio.create_task(run_client(socket_url, stats, ready, stop)))
+            batch.append(ready.wait())
+        await asyncio.gather(*batch)
+    stats.connect_seconds = time.perf_counter() - started
+
+    tasks += [asyncio.create_task(run_gateway(ingest_url, gw, tag_positions, rate, stats, stop))
+              for gw in layout]
+
+    await asyncio.sleep(warmup)
+    stats.measuring = True
+    await asyncio.sleep(duration)
+    stats.measuring = False
+
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def wait_for_port(base_url: str, server: subprocess.Popen = None, timeout: float = 60.0):
+    """รอจน server ตอบ HTTP (ล้มเหลวทันทีถ้า server ที่ spawn ออกไปแล้ว เช่น port ถูกใช้อยู่)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            urllib.request.urlopen(f"{base_url}/api/gateways", timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+
+def start_server(mode: str, workdir: str) -> subprocess.Popen:
+    """รัน server ของ mode ที่ระบุใน workdir (ฐานข้อมูลใหม่)"""
+    log = open(os.path.join(workdir, f"{mode}.log"), 'w')
+    return subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, SERVERS[mode])],
+                            cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+
+
+def report(mode: str, clients: int, stats: Stats, duration: float) -> Dict:
+    """สรุปผลของหนึ่งรอบ"""
+    spread = [(now - stats.first_seen[key]) * 1000.0 for key, now in stats.arrivals]
+    return {
+        'mode': mode,
+        'clients': clients,
+        'connected': stats.connected,
+        'failed': stats.failed,
+        'connect_s': round(stats.connect_seconds, 1),
+        'updates_per_s': round(stats.updates / duration, 1),
+        'kb_per_s': round(stats.bytes / duration / 1024, 1),
+        'spread_p50_ms': round(percentile(spread, 50), 1),
+        'spread_p99_ms': round(percentile(spread, 99), 1),
+        'ack_p50_ms': round(percentile(stats.acks, 50), 2),
+        'ack_p99_ms': round(percentile(stats.acks, 99), 2),
+        'ack_errors': stats.ack_errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test ของ serving modes")
+    parser.add_argument("--modes", nargs="+", default=["threading", "eventlet"], choices=sorted(SERVERS))
+    parser.add_argument("--clients", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--url", help="ทดสอบ server ที่รันอยู่แล้ว (ไม่ spawn)")
+    parser.add_argument("--ingest-url", default="ws://127.0.0.1:8012/ws")
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--gateways", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=50.0, help="readings/วินาที ต่อ Gateway")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--connect-batch", type=int, default=200)
+    args = parser.parse_args()
+
+    # แต่ละ client ใช้หนึ่ง file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    results = []
+    targets = [(args.url, None)] if args.url else [(None, mode) for mode in args.modes]
+    for url, mode in targets:
+        for clients in args.clients:
+            server = None
+            with tempfile.TemporaryDirectory() as workdir:
+                if url is None:
+                    server = start_server(mode, workdir)
+                    base_url = "http://127.0.0.1:5000"
+                else:
+                    base_url = url
+                try:
+                    wait_for_port(base_url, server)
+                    stats = asyncio.run(run_scenario(
+                        base_url, args.ingest_url, clients, args.tags, args.gateways, args.rate,
+                        args.warmup, args.duration, args.connect_batch))
+                    results.append(report(mode or base_url, clients, stats, args.duration))
+                    print(json.dumps(results[-1]), flush=True)
+                finally:
+                    if server is not None:
+                        server.terminate()
+                        server.wait(10)
+
+    if results:
+        columns = list(results[0])
+        print()
+        print(" | ".join(f"{c:>14}" for c in columns))
+        for row in results:
+            print(" | ".join(f"{str(row[c]):>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Position Frames
+รวมตำแหน่งของทุก Tag ในหนึ่งรอบเป็น frame เดียวต่อชั้น และส่งเฉพาะส่วนที่เปลี่ยน
+เทียบกับ state ที่ client ยืนยัน (ack) ล่าสุด พร้อม keyframe เป็นระยะ
+
+รูปแบบ frame ('position_frame'):
+    f: ชั้น
+    s: ลำดับ frame
+    b: ลำดับ frame ที่ใช้เป็นฐานของ delta (None = keyframe)
+    q: ขนาดของหนึ่งหน่วย (เมตร) พิกัดทั้งหมดเป็นจำนวนเต็มในหน่วยนี้
+    a: [[tag, x, y, gateway_count], ...] ค่าเต็มของ Tag ที่ไม่มีในฐาน (ทุก Tag ถ้าเป็น keyframe)
+    d: [[tag, dx, dy], ...] หรือ [[tag, dx, dy, gateway_count], ...] ถ้า gateway_count เปลี่ยน
+    r: [tag, ...] Tags ที่หายไปจากชั้นนี้
+
+Client นำ frame ไปใช้กับ state ของ frame b แล้วส่ง 'frame_ack' {f, s} กลับมา
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# state ของหนึ่งชั้น: tag_mac -> (x, y, gateway_count) แบบ quantized
+FloorState = Dict[str, Tuple[int, int, int]]
+
+
+class FloorStream:
+    """
+    ลำดับ frame ของหนึ่งชั้น และ state ที่ client แต่ละรายยืนยันแล้ว
+    """
+
+    def __init__(self, floor: int, history: int):
+        """
+        เริ่มต้น FloorStream
+
+        Args:
+            floor: ชั้น
+            history: จำนวน state ย้อนหลังที่เก็บไว้ใช้เป็นฐานของ delta
+        """
+        self.floor = floor
+        self.history_size = history
+        self.seq = 0
+        self.history: "OrderedDict[int, FloorState]" = OrderedDict()
+        self.acked: Dict[str, Optional[int]] = {}
+
+    def push(self, state: FloorState) -> int:
+        """เพิ่ม state ใหม่และคืนลำดับของมัน"""
+        self.seq += 1
+        self.history[self.seq] = state
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+        return self.seq
+
+    def baseline(self, sid: str) -> Optional[int]:
+        """ลำดับ frame ที่ใช้เป็นฐานให้ client (None ถ้าต้องส่ง keyframe)"""
+        acked = self.acked.get(sid)
+        return acked if acked in self.history else None
+
+
+def encode_frame(floor: int, seq: int, quantum: float, state: FloorState,
+                 base_seq: Optional[int], base: Optional[FloorState]) -> Optional[Dict]:
+    """
+    สร้าง frame ของ state เทียบกับฐาน
+
+    Args:
+        floor: ชั้น
+        seq: ลำดับของ frame นี้
+        quantum: ขนาดของหนึ่งหน่วยพิกัด (เมตร)
+        state: state ปัจจุบัน
+        base_seq: ลำดับของฐาน (None = keyframe)
+        base: state ของฐาน
+
+    Returns:
+        frame dict หรือ None ถ้าไม่มีอะไรเปลี่ยน
+    """
+    if base is None:
+        return {
+            'f': floor, 's': seq, 'b': None, 'q': quantum,
+            'a': [[tag, x, y, gc] for tag, (x, y, gc) in state.items()],
+            'd': [], 'r': []
+        }
+
+    added = []
+    deltas = []
+    for tag, (x, y, gc) in state.items():
+        old = base.get(tag)
+        if old is None:
+            added.append([tag, x, y, gc])
+        elif old != (x, y, gc):
+            entry = [tag, x - old[0], y - old[1]]
+            if gc != old[2]:
+                entry.append(gc)
+            deltas.append(entry)
+
+    removed = [tag for tag in base if tag not in state]
+
+    if not added and not deltas and not removed:
+        return None
+
+    return {'f': floor, 's': seq, 'b': base_seq, 'q': quantum, 'a': added, 'd': deltas, 'r': removed}
+
+
+class FramePublisher:
+    """
+    ส่ง position frames ให้ client ที่เลือก frame mode
+
+    Client ที่มีฐาน (acked frame) เดียวกันได้รับ frame ที่ serialize ครั้งเดียวร่วมกัน
+    ทุก keyframe_interval frames ทุก client ได้รับ keyframe (ใช้ร่วมกันทั้งชั้น)
+    """
+
+    def __init__(self, emit: Callable[[str, Dict, List[str]], None], quantum: float = 0.05,
+                 keyframe_interval: int = 30, history: int = 16):
+        """
+        เริ่มต้น FramePublisher
+
+        Args:
+            emit: ฟังก์ชัน emit(event, data, sids) ที่ส่งข้อมูลชุดเดียวให้หลาย client
+            quantum: ขนาดของหนึ่งหน่วยพิกัด (เมตร)
+            keyframe_interval: ส่ง keyframe ทุกกี่ frame
+            history: จำนวน frame ย้อนหลังที่ยอมให้ client ack ช้าได้ก่อนต้องใช้ keyframe
+        """
+        self.emit = emit
+        self.quantum = quantum
+        self.keyframe_interval = keyframe_interval
+        self.history = history
+
+        self._streams: Dict[int, FloorStream] = {}
+        self._detail: Dict[int, set] = {}
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.frames = 0
+        self.keyframes = 0
+        self.skipped = 0
+
+    def subscribe(self, sid: str, floors: Iterable[int], detail: bool = False):
+        """
+        ลงทะเบียน client ให้รับ frames ของชั้นที่ระบุ (แทนที่ของเดิม)
+
+        Args:
+            sid: Socket.IO sid
+            floors: รายการชั้น
+            detail: True ถ้าต้องการรายละเอียด RSSI ของ Gateway ('gateway_detail')
+        """
+        with self._lock:
+            self._remove(sid)
+            for floor in floors:
+                stream = self._streams.get(floor)
+                if stream is None:
+                    stream = self._streams[floor] = FloorStream(floor, self.history)
+                stream.acked[sid] = None
+                if detail:
+                    self._detail.setdefault(floor, set()).add(sid)
+
+    def unsubscribe(self, sid: str):
+        """
+        ยกเลิก frames ทั้งหมดของ client
+
+        Args:
+            sid: Socket.IO sid
+        """
+        with self._lock:
+            self._remove(sid)
+
+    def _remove(self, sid: str):
+        """ลบ client ออกจากทุกชั้น (ต้องถือ lock)"""
+        for floor in list(self._streams):
+            stream = self._streams[floor]
+            stream.acked.pop(sid, None)
+            if not stream.acked:
+                del self._streams[floor]
+        for floor in list(self._detail):
+            self._detail[floor].discard(sid)
+            if not self._detail[floor]:
+                del self._detail[floor]
+
+    def ack(self, sid: str, floor: int, seq: int):
+        """
+        บันทึกว่า client นำ frame seq ของชั้นนี้ไปใช้แล้ว
+
+        Args:
+            sid: Socket.IO sid
+            floor: ชั้น
+            seq: ลำดับ frame
+        """
+        with self._lock:
+            stream = self._streams.get(floor)
+            if stream is None or sid not in stream.acked or seq not in stream.history:
+                return
+            current = stream.acked[sid]
+            if current is None or seq > current:
+                stream.acked[sid] = seq
+
+    def floors(self) -> List[int]:
+        """
+        ชั้นที่มี client ใน frame mode
+
+        Returns:
+            รายการชั้น
+        """
+        with self._lock:
+            return list(self._streams)
+
+    def publish(self, floor: int, positions: List[Dict], updated: List[Dict] = ()):
+        """
+        ส่ง frame ของหนึ่งรอบให้ทุก client ของชั้นนี้
+
+        Args:
+            floor: ชั้น
+            positions: ตำแหน่งล่าสุดของทุก Tag ที่อยู่ในชั้นนี้
+            updated: ตำแหน่งที่คำนวณได้ในรอบนี้ (ใช้กับ gateway detail)
+        """
+        q = self.quantum
+        state = {pos['tag_mac']: (int(round(pos['x'] / q)), int(round(pos['y'] / q)), pos['gateway_count'])
+                 for pos in positions}
+
+        with self._lock:
+            stream = self._streams.get(floor)
+            if stream is None:
+                return
+            seq = stream.push(state)
+            keyframe_due = seq % self.keyframe_interval == 1 or self.keyframe_interval == 1
+
+            groups: Dict[Optional[int], List[str]] = {}
+            for sid in stream.acked:
+                base_seq = None if keyframe_due else stream.baseline(sid)
+                groups.setdefault(base_seq, []).append(sid)
+
+            frames = []
+            for base_seq, sids in groups.items():
+                base = stream.history.get(base_seq) if base_seq is not None else None
+                frame = encode_frame(floor, seq, q, state, base_seq, base)
+                if frame is None:
+                    self.skipped += len(sids)
+                    continue
+                frames.append((frame, sids))
+                if base_seq is None:
+                    self.keyframes += 1
+                self.frames += 1
+
+            detail_sids = list(self._detail.get(floor, ()))
+
+        for frame, sids in frames:
+            self.emit('position_frame', frame, sids)
+
+        if detail_sids and updated:
+            self.emit('gateway_detail', {
+                'f': floor,
+                'tags': {pos['tag_mac']: [[r['gateway_mac'], r['rssi']] for r in pos['gateways']]
+                         for pos in updated}
+            }, detail_sids)
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ frame publisher
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        with self._lock:
+            return {
+                'floors': len(self._streams),
+                'clients': len({sid for stream in self._streams.values() for sid in stream.acked}),
+                'frames': self.frames,
+                'keyframes': self.keyframes,
+                'skipped': self.skipped
+            }
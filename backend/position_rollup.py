@@ -0,0 +1,324 @@
+"""
+Position Rollups
+ตารางสรุปตำแหน่งรายนาที/รายชั่วโมง ต่อ Tag ต่อชั้น
+อัปเดตแบบ incremental ใน transaction เดียวกับการบันทึก position_history
+"""
+
+import argparse
+import logging
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import format_timestamp
+from geofence import ZoneIndex
+
+logger = logging.getLogger(__name__)
+
+# (ชื่อ, ขนาด bucket เป็นวินาที) เรียงจากละเอียดไปหยาบ
+RESOLUTIONS = (('minute', 60), ('hour', 3600))
+
+
+class PositionRollup:
+    """
+    Rollup tables ของ position_history
+
+    position_rollup_<res>: count, ผลรวม/ขอบเขตของพิกัด, เวลาแรก/สุดท้าย ต่อ (tag, bucket, floor)
+    zone_rollup_<res>: เวลาที่อยู่ในแต่ละโซน (วินาที) ต่อ (tag, bucket, zone)
+    """
+
+    def __init__(self, db, max_dwell: float = 10.0, zone_index: Optional[ZoneIndex] = None):
+        """
+        เริ่มต้น PositionRollup และลงทะเบียนเป็น position hook ของ Database
+
+        Args:
+            db: Database instance
+            max_dwell: เวลาสูงสุด (วินาที) ที่นับให้ fix หนึ่งจุด (กันช่วงที่ Tag หายไปนาน)
+            zone_index: ZoneIndex (optional, ไม่ระบุจะสร้างใหม่)
+        """
+        self.db = db
+        self.max_dwell = max_dwell
+
+        # เวลาของ fix ล่าสุดต่อ Tag (สำหรับคำนวณเวลาที่อยู่ในโซน)
+        self._last_seen: Dict[str, float] = {}
+
+        # Spatial index ของโซน (ใช้ร่วมกับ GeofenceEngine ได้)
+        self.zone_index = zone_index if zone_index is not None else ZoneIndex(db)
+
+        self.init_tables()
+        db.add_position_hook(self.apply)
+
+    def init_tables(self):
+        """สร้าง rollup tables"""
+        with self.db.connection() as conn:
+            for name, _ in RESOLUTIONS:
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS position_rollup_{name} (
+                        tag_mac TEXT NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        floor INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        sum_x REAL NOT NULL,
+                        sum_y REAL NOT NULL,
+                        min_x REAL NOT NULL,
+                        max_x REAL NOT NULL,
+                        min_y REAL NOT NULL,
+                        max_y REAL NOT NULL,
+                        first_ts REAL NOT NULL,
+                        last_ts REAL NOT NULL,
+                        PRIMARY KEY (tag_mac, bucket, floor)
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS zone_rollup_{name} (
+                        tag_mac TEXT NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        zone_id INTEGER NOT NULL,
+                        seconds REAL NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (tag_mac, bucket, zone_id)
+                    ) WITHOUT ROWID
+                ''')
+            conn.commit()
+
+    def apply(self, conn, records: List[Tuple]):
+        """
+        อัปเดต rollups ด้วย records ใหม่ (เรียกโดย Database ภายใน transaction)
+
+        Args:
+            conn: sqlite3 connection ของ transaction ปัจจุบัน
+            records: list ของ (tag_mac, floor, x, y, timestamp epoch)
+        """
+        self._apply(conn, records, self._last_seen)
+
+    def _apply(self, conn, records: List[Tuple], last_seen: Dict[str, float]):
+        """
+        อัปเดต rollups ด้วย records
+
+        Args:
+            conn: sqlite3 connection ของ transaction ปัจจุบัน
+            records: list ของ (tag_mac, floor, x, y, timestamp epoch)
+            last_seen: เวลาของ fix ล่าสุดต่อ Tag (ถูกอัปเดต)
+        """
+        if not records:
+            return
+
+        # เวลาที่นับให้แต่ละ fix = ระยะห่างจาก fix ก่อนหน้าของ Tag เดียวกัน (ไม่เกิน max_dwell)
+        dwell = []
+        for tag_mac, _, _, _, ts in records:
+            prev = last_seen.get(tag_mac)
+            dwell.append(min(max(ts - prev, 0.0), self.max_dwell) if prev is not None else 0.0)
+            if prev is None or ts > prev:
+                last_seen[tag_mac] = ts
+
+        floors = np.array([r[1] for r in records], dtype=np.int64)
+        xy = np.array([(r[2], r[3]) for r in records], dtype=np.float64)
+        zone_hits = self.zone_index.hits(floors, xy)
+
+        for name, seconds in RESOLUTIONS:
+            agg: Dict[tuple, list] = {}
+            for tag_mac, floor, x, y, ts in records:
+                key = (tag_mac, int(ts // seconds) * seconds, floor)
+                a = agg.get(key)
+                if a is None:
+                    agg[key] = [1, x, y, x, x, y, y, ts, ts]
+                else:
+                    a[0] += 1
+                    a[1] += x
+                    a[2] += y
+                    a[3] = min(a[3], x)
+                    a[4] = max(a[4], x)
+                    a[5] = min(a[5], y)
+                    a[6] = max(a[6], y)
+                    a[7] = min(a[7], ts)
+                    a[8] = max(a[8], ts)
+
+            conn.executemany(f'''
+                INSERT INTO position_rollup_{name}
+                (tag_mac, bucket, floor, count, sum_x, sum_y, min_x, max_x, min_y, max_y, first_ts, last_ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (tag_mac, bucket, floor) DO UPDATE SET
+                    count = count + excluded.count,
+                    sum_x = sum_x + excluded.sum_x,
+                    sum_y = sum_y + excluded.sum_y,
+                    min_x = MIN(min_x, excluded.min_x),
+                    max_x = MAX(max_x, excluded.max_x),
+                    min_y = MIN(min_y, excluded.min_y),
+                    max_y = MAX(max_y, excluded.max_y),
+                    first_ts = MIN(first_ts, excluded.first_ts),
+                    last_ts = MAX(last_ts, excluded.last_ts)
+            ''', [key + tuple(values) for key, values in agg.items()])
+
+            if not zone_hits:
+                continue
+
+            zone_agg: Dict[tuple, list] = {}
+            for i, zone_id in zone_hits:
+                tag_mac, _, _, _, ts = records[i]
+                key = (tag_mac, int(ts // seconds) * seconds, zone_id)
+                a = zone_agg.setdefault(key, [0.0, 0])
+                a[0] += dwell[i]
+                a[1] += 1
+
+            conn.executemany(f'''
+                INSERT INTO zone_rollup_{name} (tag_mac, bucket, zone_id, seconds, count)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (tag_mac, bucket, zone_id) DO UPDATE SET
+                    seconds = seconds + excluded.seconds,
+                    count = count + excluded.count
+            ''', [key + tuple(values) for key, values in zone_agg.items()])
+
+    def pick_source(self, resolution: int) -> Optional[Tuple[str, int]]:
+        """
+        เลือก rollup ที่หยาบที่สุดที่ยังตอบ resolution ที่ขอได้
+
+        Args:
+            resolution: ขนาด bucket ที่ต้องการ (วินาที)
+
+        Returns:
+            (ชื่อ rollup, ขนาด bucket) หรือ None ถ้าต้องใช้ position_history โดยตรง
+        """
+        for name, seconds in reversed(RESOLUTIONS):
+            if resolution >= seconds and resolution % seconds == 0:
+                return name, seconds
+        return None
+
+    def query(self, tag_mac: str, start_time: float, end_time: float,
+              resolution: int = 3600) -> Dict:
+        """
+        ดึงข้อมูลสรุปของ Tag ตามช่วงเวลาและความละเอียด
+
+        Args:
+            tag_mac: MAC Address ของ Tag
+            start_time: เวลาเริ่มต้น (Unix epoch)
+            end_time: เวลาสิ้นสุด (Unix epoch)
+            resolution: ขนาด bucket ที่ต้องการ (วินาที)
+
+        Returns:
+            dict ที่มี source, resolution, columns และ zone_time
+        """
+        tag_mac = tag_mac.replace(":", "").upper()
+        resolution = max(int(resolution), 1)
+        start_bucket = int(math.floor(start_time / resolution)) * resolution
+        source = self.pick_source(resolution)
+
+        with self.db.connection() as conn:
+            if source is not None:
+                rows = conn.execute(f'''
+                    SELECT (bucket / ?) * ? AS b, floor, SUM(count),
+                           SUM(sum_x), SUM(sum_y), MIN(min_x), MAX(max_x), MIN(min_y), MAX(max_y)
+                    FROM position_rollup_{source[0]}
+                    WHERE tag_mac = ? AND bucket >= ? AND bucket <= ?
+                    GROUP BY b, floor
+                    ORDER BY b, floor
+                ''', (resolution, resolution, tag_mac, start_bucket, end_time)).fetchall()
+            else:
+                rows = conn.execute('''
+                    SELECT CAST(((julianday(timestamp) - 2440587.5) * 86400.0) / ? AS INTEGER) * ? AS b,
+                           floor, COUNT(*), SUM(x), SUM(y), MIN(x), MAX(x), MIN(y), MAX(y)
+                    FROM position_history
+                    WHERE tag_mac = ?
+                      AND timestamp >= ?
+                      AND timestamp <= ?
+                    GROUP BY b, floor
+                    ORDER BY b, floor
+                ''', (resolution, resolution, tag_mac,
+                      format_timestamp(start_bucket), format_timestamp(end_time))).fetchall()
+
+            # เวลาในโซนมีเฉพาะใน rollup (ความละเอียดต่ำสุดคือรายนาที)
+            zone_table = f"zone_rollup_{source[0] if source else RESOLUTIONS[0][0]}"
+            zone_rows = conn.execute(f'''
+                SELECT (bucket / ?) * ? AS b, zone_id, SUM(seconds)
+                FROM {zone_table}
+                WHERE tag_mac = ? AND bucket >= ? AND bucket <= ?
+                GROUP BY b, zone_id
+                ORDER BY b, zone_id
+            ''', (resolution, resolution, tag_mac, start_bucket, end_time)).fetchall()
+
+        columns = {name: [] for name in ('bucket', 'floor', 'count', 'mean_x', 'mean_y',
+                                         'min_x', 'max_x', 'min_y', 'max_y')}
+        for b, floor, count, sum_x, sum_y, min_x, max_x, min_y, max_y in rows:
+            columns['bucket'].append(b)
+            columns['floor'].append(floor)
+            columns['count'].append(count)
+            columns['mean_x'].append(sum_x / count)
+            columns['mean_y'].append(sum_y / count)
+            columns['min_x'].append(min_x)
+            columns['max_x'].append(max_x)
+            columns['min_y'].append(min_y)
+            columns['max_y'].append(max_y)
+
+        zone_time = {
+            'bucket': [row[0] for row in zone_rows],
+            'zone_id': [row[1] for row in zone_rows],
+            'seconds': [row[2] for row in zone_rows]
+        }
+
+        return {
+            'source': source[0] if source else 'raw',
+            'resolution': resolution,
+            'columns': columns,
+            'zone_time': zone_time
+        }
+
+    def rebuild(self, chunk_size: int = 10000) -> int:
+        """
+        สร้าง rollups ใหม่ทั้งหมดจาก position_history (ใช้ครั้งแรกหรือหลังแก้โซน)
+
+        รันได้ขณะ server ทำงาน: ลบ rollups และอ่าน max(id) ใน transaction เดียวกัน (ถือ write lock ตั้งแต่ DELETE)
+        แถวที่ id <= max(id) ถูกสร้างใหม่ที่นี่ ส่วนแถวหลังจากนั้นถูกนับโดย hook ของ server ตามปกติ
+        (จึงไม่มีแถวใดถูกนับซ้ำหรือตกหล่น) และใช้ last_seen แยกจาก hook
+
+        Args:
+            chunk_size: จำนวนแถวต่อ transaction
+
+        Returns:
+            จำนวนแถวที่ประมวลผล
+        """
+        with self.db.connection() as conn:
+            for name, _ in RESOLUTIONS:
+                conn.execute(f'DELETE FROM position_rollup_{name}')
+                conn.execute(f'DELETE FROM zone_rollup_{name}')
+            max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM position_history').fetchone()[0]
+            conn.commit()
+
+        last_seen: Dict[str, float] = {}
+        last_key = ('', 0)
+        total = 0
+
+        while True:
+            with self.db.connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, timestamp, tag_mac, floor, x, y,
+                           (julianday(timestamp) - 2440587.5) * 86400.0
+                    FROM position_history
+                    WHERE (timestamp, id) > (?, ?) AND id <= ?
+                    ORDER BY timestamp, id
+                    LIMIT ?
+                ''', (last_key[0], last_key[1], max_id, chunk_size)).fetchall()
+
+                if not rows:
+                    break
+
+                self._apply(conn, [(r[2], r[3], r[4], r[5], r[6]) for r in rows], last_seen)
+                conn.commit()
+
+            last_key = (rows[-1][1], rows[-1][0])
+            total += len(rows)
+
+        logger.info(f"Rebuilt position rollups from {total} rows")
+        return total
+
+
+if __name__ == "__main__":
+    from database import get_database
+
+    parser = argparse.ArgumentParser(description="จัดการ position rollups")
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--db', default="ble_trilateration.db", help="path ของฐานข้อมูล")
+    args = parser.parse_args()
+
+    rollup = PositionRollup(get_database(args.db))
+    if args.command == 'rebuild':
+        rollup.rebuild()
@@ -0,0 +1,255 @@
+"""
+Raw Reading Archive
+เก็บข้อมูล RSSI ดิบจาก Gateway แบบ append-only ใน SQLite
+แบ่งตารางตามวัน (หรือชั่วโมง) และเก็บ MAC เป็น integer id
+"""
+
+import logging
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+TABLE_PREFIX = "raw_readings_"
+
+# รูปแบบชื่อ partition ตามความละเอียด: (strftime format, จำนวนหลัก)
+PARTITION_FORMATS = {
+    'day': ('%Y%m%d', 8),
+    'hour': ('%Y%m%d%H', 10)
+}
+
+
+class ReadingArchive:
+    """
+    Archive ของ raw readings แบ่ง partition ตามเวลา
+
+    แต่ละ partition เป็นตาราง raw_readings_YYYYMMDD (หรือ YYYYMMDDHH)
+    ค่าทั้งหมดเก็บเป็น integer เพื่อให้ SQLite ใช้ varint ขนาดเล็ก:
+    เวลาเป็น millisecond, ระยะทางเป็น cm, sensor เป็นหน่วย x10
+    """
+
+    def __init__(self, db, partition: str = "day"):
+        """
+        เริ่มต้น ReadingArchive
+
+        Args:
+            db: Database instance (ใช้ connection pool ร่วมกัน)
+            partition: ความละเอียดของ partition ('day' หรือ 'hour')
+        """
+        if partition not in PARTITION_FORMATS:
+            raise ValueError(f"partition ต้องเป็น {list(PARTITION_FORMATS)} แต่ได้รับ '{partition}'")
+
+        self.db = db
+        self.partition = partition
+        self.partition_format, digits = PARTITION_FORMATS[partition]
+        self.partition_pattern = re.compile(rf"^{TABLE_PREFIX}\d{{{digits}}}$")
+
+        # Cache ของ MAC -> id และ partition ที่สร้างแล้ว
+        self._mac_ids: Dict[str, int] = {}
+        self._partitions = set()
+        self._lock = threading.Lock()
+
+        self.init_tables()
+
+    def init_tables(self):
+        """สร้างตาราง MAC dictionary และโหลด partition ที่มีอยู่"""
+        with self.db.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS mac_ids (
+                    id INTEGER PRIMARY KEY,
+                    mac TEXT UNIQUE NOT NULL
+                )
+            ''')
+            conn.commit()
+
+            for mac_id, mac in conn.execute('SELECT id, mac FROM mac_ids'):
+                self._mac_ids[mac] = mac_id
+
+        self._partitions.update(self.list_partitions())
+        logger.info(f"Reading archive ready ({len(self._partitions)} partitions, "
+                    f"{len(self._mac_ids)} MAC ids)")
+
+    def partition_name(self, epoch: float) -> str:
+        """
+        ชื่อตาราง partition ของเวลาที่ระบุ
+
+        Args:
+            epoch: เวลาแบบ Unix epoch
+
+        Returns:
+            ชื่อตาราง
+        """
+        return TABLE_PREFIX + datetime.fromtimestamp(epoch, timezone.utc).strftime(self.partition_format)
+
+    def list_partitions(self) -> List[str]:
+        """
+        รายชื่อ partition ทั้งหมดที่มีในฐานข้อมูล (เรียงตามเวลา)
+
+        Returns:
+            รายชื่อตาราง
+        """
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+                (TABLE_PREFIX + '%',)
+            ).fetchall()
+
+        return sorted(row[0] for row in rows if self.partition_pattern.match(row[0]))
+
+    def _ensure_partition(self, conn, name: str):
+        """สร้างตาราง partition ถ้ายังไม่มี"""
+        if name in self._partitions:
+            return
+
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name} (
+                ts_ms INTEGER NOT NULL,
+                gateway_id INTEGER NOT NULL,
+                tag_id INTEGER NOT NULL,
+                rssi INTEGER NOT NULL,
+                distance_cm INTEGER,
+                battery_x10 INTEGER,
+                temperature_x10 INTEGER,
+                humidity_x10 INTEGER
+            )
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_tag ON {name}(tag_id, ts_ms)')
+        self._partitions.add(name)
+
+    def _mac_id(self, conn, mac: str) -> int:
+        """แปลง MAC เป็น integer id (สร้างใหม่ถ้ายังไม่มี)"""
+        mac_id = self._mac_ids.get(mac)
+        if mac_id is not None:
+            return mac_id
+
+        conn.execute('INSERT OR IGNORE INTO mac_ids (mac) VALUES (?)', (mac,))
+        mac_id = conn.execute('SELECT id FROM mac_ids WHERE mac = ?', (mac,)).fetchone()[0]
+        self._mac_ids[mac] = mac_id
+        return mac_id
+
+    def insert_readings(self, readings: List[Dict]) -> int:
+        """
+        บันทึก readings หลายรายการใน transaction เดียว (ใช้เป็น flush_func ของ WriteBehindWriter)
+
+        Args:
+            readings: รายการ reading จาก BLEWebSocketServer (ต้องมี received_at)
+
+        Returns:
+            จำนวน records ที่บันทึก
+        """
+        with self._lock, self.db.connection() as conn:
+            try:
+                by_partition: Dict[str, list] = {}
+
+                for reading in readings:
+                    received_at = reading['received_at']
+                    by_partition.setdefault(self.partition_name(received_at), []).append((
+                        int(received_at * 1000),
+                        self._mac_id(conn, reading['gateway_mac']),
+                        self._mac_id(conn, reading['tag_mac']),
+                        int(round(reading['rssi'])),
+                        int(round(reading.get('distance', 0) * 100)),
+                        int(round(reading.get('battery', 0) * 10)),
+                        int(round(reading.get('temperature', 0) * 10)),
+                        int(round(reading.get('humidity', 0) * 10))
+                    ))
+
+                for name, rows in by_partition.items():
+                    self._ensure_partition(conn, name)
+                    conn.executemany(f'''
+                        INSERT INTO {name}
+                        (ts_ms, gateway_id, tag_id, rssi, distance_cm, battery_x10, temperature_x10, humidity_x10)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+
+                conn.commit()
+
+            except Exception:
+                # transaction ถูก rollback: cache ที่เพิ่งเพิ่มอาจไม่มีอยู่จริงในฐานข้อมูล
+                self._mac_ids.clear()
+                self._partitions.clear()
+                raise
+
+        return len(readings)
+
+    def get_readings(self, tag_mac: str, start_time: float, end_time: float) -> Dict[str, list]:
+        """
+        ดึง raw readings ของ Tag ตามช่วงเวลา (อ่านเฉพาะ partition ที่ครอบคลุม)
+
+        Args:
+            tag_mac: MAC Address ของ Tag
+            start_time: เวลาเริ่มต้น (Unix epoch)
+            end_time: เวลาสิ้นสุด (Unix epoch)
+
+        Returns:
+            dict ของคอลัมน์ timestamp, gateway_mac, rssi, distance
+        """
+        tag_mac = tag_mac.replace(":", "").upper()
+        columns = {'timestamp': [], 'gateway_mac': [], 'rssi': [], 'distance': []}
+
+        first = self.partition_name(start_time)
+        last = self.partition_name(end_time)
+        partitions = [name for name in self.list_partitions() if first <= name <= last]
+
+        with self.db.connection() as conn:
+            mac_by_id = dict(conn.execute('SELECT id, mac FROM mac_ids').fetchall())
+            row = conn.execute('SELECT id FROM mac_ids WHERE mac = ?', (tag_mac,)).fetchone()
+            if row is None:
+                return columns
+            tag_id = row[0]
+
+            for name in partitions:
+                rows = conn.execute(f'''
+                    SELECT ts_ms, gateway_id, rssi, distance_cm FROM {name}
+                    WHERE tag_id = ? AND ts_ms BETWEEN ? AND ?
+                    ORDER BY ts_ms
+                ''', (tag_id, int(start_time * 1000), int(end_time * 1000))).fetchall()
+
+                for ts_ms, gateway_id, rssi, distance_cm in rows:
+                    columns['timestamp'].append(ts_ms / 1000.0)
+                    columns['gateway_mac'].append(mac_by_id.get(gateway_id))
+                    columns['rssi'].append(rssi)
+                    columns['distance'].append(distance_cm / 100.0)
+
+        return columns
+
+    def drop_partitions_before(self, cutoff: float) -> List[str]:
+        """
+        ลบ partition ทั้งตารางที่เก่ากว่าเวลาที่กำหนด (แทนการ DELETE ทีละแถว)
+
+        Args:
+            cutoff: เวลา (Unix epoch) partition ที่สิ้นสุดก่อนเวลานี้จะถูกลบ
+
+        Returns:
+            รายชื่อตารางที่ลบ
+        """
+        # partition ที่ชื่อน้อยกว่า partition ของ cutoff จะสิ้นสุดก่อน cutoff ทั้งหมด
+        boundary = self.partition_name(cutoff)
+        expired = [name for name in self.list_partitions() if name < boundary]
+        dropped = []
+
+        with self._lock, self.db.connection() as conn:
+            for name in expired:
+                conn.execute(f'DROP TABLE IF EXISTS {name}')
+                self._partitions.discard(name)
+                dropped.append(name)
+            conn.commit()
+
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} reading partitions: {', '.join(dropped)}")
+
+        return dropped
+
+    def apply_retention(self, days: int = 30) -> List[str]:
+        """
+        ลบ partition ที่เก่ากว่าจำนวนวันที่กำหนด
+
+        Args:
+            days: จำนวนวันที่เก็บไว้
+
+        Returns:
+            รายชื่อตารางที่ลบ
+        """
+        return self.drop_partitions_before(datetime.now(timezone.utc).timestamp() - days * 86400)
@@ -0,0 +1,492 @@
+"""
+Reading Ring
+Ring buffer ของ readings ใน multiprocessing.shared_memory สำหรับแยก ingest process ออกจาก API process
+
+โครงสร้างของ segment:
+    header (64 bytes): magic, capacity, head (จำนวน records ที่เขียนแล้ว), epoch, heartbeat
+    records: capacity ช่องของ RECORD_DTYPE (ขนาดคงที่)
+
+Record ลำดับที่ n (เริ่มที่ 1) อยู่ในช่อง (n - 1) % capacity
+Writer (หนึ่งตัว): ตั้ง seq ของช่องเป็น 0, เขียนข้อมูล, ตั้ง seq = n แล้วจึงเลื่อน head
+Reader: อ่านช่องเป็น NumPy view (ไม่ copy) แล้วตรวจ seq ของแต่ละช่องหลังอ่าน
+ถ้า seq ไม่ตรงแปลว่า writer เขียนทับไปแล้ว (reader ช้ากว่า capacity) records นั้นถูกนับเป็น dropped
+
+Usage (benchmark):
+    python reading_ring.py bench --records 2000000 --capacity 65536
+"""
+
+import argparse
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x424C4552494E4731  # "BLERING1"
+
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u8'),
+    ('capacity', '<u8'),
+    ('head', '<u8'),
+    ('epoch', '<u8'),
+    ('heartbeat', '<f8'),
+    ('reserved', '<u8', (3,))
+])
+
+RECORD_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('received_at', '<f8'),
+    ('timestamp', '<f8'),
+    ('gateway_mac', 'S12'),
+    ('tag_mac', 'S12'),
+    ('rssi', '<f4'),
+    ('distance', '<f4'),
+    ('battery', '<f4'),
+    ('temperature', '<f4'),
+    ('humidity', '<f4')
+])
+
+# ลำดับของฟิลด์ข้อมูล (ไม่รวม seq) ตรงกับ reading dict ของ BLEWebSocketServer
+FIELDS = RECORD_DTYPE.names[1:]
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    เปิด segment ที่มีอยู่แล้วโดยไม่ให้ process นี้เป็นผู้ลบ segment (ผู้สร้างเป็นผู้ unlink)
+
+    Python < 3.13 ไม่มี track: process ลูกที่ start จากผู้สร้างใช้ resource tracker ตัวเดียวกัน
+    การ register ซ้ำจึงไม่ทำให้ segment ถูกลบตอน process ลูกจบ
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class ReadingRing:
+    """
+    Segment ของ ring buffer (ใช้ร่วมกันระหว่าง writer และ reader)
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf, offset=0)
+        if int(self.header['magic']) != MAGIC:
+            raise ValueError(f"Shared memory {shm.name} is not a reading ring")
+        self.capacity = int(self.header['capacity'])
+        self.records = np.ndarray((self.capacity,), dtype=RECORD_DTYPE, buffer=shm.buf,
+                                  offset=HEADER_DTYPE.itemsize)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, capacity: int = 65536, name: Optional[str] = None) -> "ReadingRing":
+        """
+        สร้าง segment ใหม่ (process ที่สร้างเป็นผู้ unlink)
+
+        Args:
+            capacity: จำนวน records
+            name: ชื่อ segment (None = สุ่ม)
+
+        Returns:
+            ReadingRing
+        """
+        size = HEADER_DTYPE.itemsize + capacity * RECORD_DTYPE.itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf, offset=0)
+        header[()] = (0, capacity, 0, 0, 0.0, (0, 0, 0))
+        np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=shm.buf, offset=HEADER_DTYPE.itemsize)['seq'] = 0
+        header['magic'] = MAGIC
+        del header
+        logger.info(f"Created reading ring {shm.name} ({capacity} records, {size} bytes)")
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "ReadingRing":
+        """
+        เปิด segment ที่สร้างไว้แล้ว
+
+        Args:
+            name: ชื่อ segment
+
+        Returns:
+            ReadingRing
+        """
+        return cls(_attach(name), owner=False)
+
+    def close(self):
+        """
+        ปิด segment (และ unlink ถ้าเป็นผู้สร้าง)
+        """
+        # ต้องปล่อย NumPy views ก่อนปิด buffer
+        del self.header
+        del self.records
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingWriter:
+    """
+    Writer ของ ring (ต้องมีเพียงหนึ่งตัวต่อ segment)
+
+    เริ่มเขียนต่อจาก head ที่อยู่ใน segment: ถ้า ingest process ตายแล้วเริ่มใหม่ ลำดับยังต่อเนื่อง
+    """
+
+    def __init__(self, ring: ReadingRing):
+        """
+        เริ่มต้น RingWriter (เพิ่ม epoch ของ segment)
+
+        Args:
+            ring: ReadingRing
+        """
+        self.ring = ring
+        self.capacity = ring.capacity
+        self.head = int(ring.header['head'])
+        ring.header['epoch'] = int(ring.header['epoch']) + 1
+        ring.header['heartbeat'] = time.time()
+
+    def write(self, reading: Dict):
+        """
+        เขียน reading หนึ่งรายการ
+
+        Args:
+            reading: reading dict (gateway_mac, tag_mac, rssi, distance, ..., received_at)
+        """
+        seq = self.head + 1
+        slot = self.head % self.capacity
+        records = self.ring.records
+        records['seq'][slot] = 0
+        records[slot] = (0, reading['received_at'], reading['timestamp'],
+                         reading['gateway_mac'].encode(), reading['tag_mac'].encode(),
+                         reading['rssi'], reading['distance'], reading['battery'],
+                         reading['temperature'], reading['humidity'])
+        records['seq'][slot] = seq
+        self.head = seq
+        self.ring.header['head'] = seq
+
+    def write_batch(self, batch: np.ndarray):
+        """
+        เขียน records หลายรายการ (structured array ของ RECORD_DTYPE, ฟิลด์ seq ถูกแทนที่)
+
+        Args:
+            batch: records
+        """
+        count = len(batch)
+        if count > self.capacity:
+            batch = batch[-self.capacity:]
+            self.head += count - self.capacity
+            count = self.capacity
+
+        written = 0
+        while written < count:
+            slot = (self.head + written) % self.capacity
+            n = min(count - written, self.capacity - slot)
+            part = self.ring.records[slot:slot + n]
+            part['seq'] = 0
+            part[:] = batch[written:written + n]
+            part['seq'] = np.arange(self.head + written + 1, self.head + written + n + 1, dtype=np.uint64)
+            written += n
+
+        self.head += count
+        self.ring.header['head'] = self.head
+
+    def beat(self):
+        """
+        อัปเดต heartbeat (ให้ reader รู้ว่า writer ยังทำงานอยู่)
+        """
+        self.ring.header['heartbeat'] = time.time()
+
+
+class RingReader:
+    """
+    Reader ของ ring (หลาย reader อ่าน segment เดียวกันได้ แต่ละตัวมี cursor ของตัวเอง)
+    """
+
+    def __init__(self, ring: ReadingRing, from_start: bool = False):
+        """
+        เริ่มต้น RingReader
+
+        Args:
+            ring: ReadingRing
+            from_start: True = อ่าน records ที่ยังอยู่ใน ring ทั้งหมด, False = เริ่มจาก head ปัจจุบัน
+        """
+        self.ring = ring
+        self.capacity = ring.capacity
+        head = int(ring.header['head'])
+        self.cursor = max(0, head - self.capacity) if from_start else head
+        self.epoch = int(ring.header['epoch'])
+
+        # Statistics
+        self.consumed = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    def _resync(self, head: int):
+        """ปรับ cursor เมื่อ writer เริ่มใหม่หรือ reader ช้าเกินกว่า capacity"""
+        if head < self.cursor:
+            # segment ถูก reset (head ลดลง): เริ่มอ่านจาก records ที่มีอยู่
+            logger.warning(f"Reading ring head moved back ({self.cursor} -> {head}), resyncing")
+            self.cursor = max(0, head - self.capacity)
+            self.resyncs += 1
+        elif head - self.cursor > self.capacity:
+            lost = head - self.capacity - self.cursor
+            self.dropped += lost
+            self.cursor = head - self.capacity
+            self.resyncs += 1
+
+    def poll(self, max_records: int = 4096) -> Tuple[np.ndarray, int]:
+        """
+        ดึง records ถัดไปเป็น view ของ shared memory (ไม่ copy)
+
+        ผู้เรียกต้องอ่านข้อมูลที่ต้องการออกจาก view แล้วเรียก validate ก่อนใช้
+
+        Args:
+            max_records: จำนวน records สูงสุด
+
+        Returns:
+            (view, seq ของ record แรก) view ว่างถ้าไม่มี record ใหม่
+        """
+        epoch = int(self.ring.header['epoch'])
+        if epoch != self.epoch:
+            logger.info(f"Reading ring writer restarted (epoch {self.epoch} -> {epoch})")
+            self.epoch = epoch
+
+        head = int(self.ring.header['head'])
+        self._resync(head)
+
+        count = min(head - self.cursor, max_records)
+        slot = self.cursor % self.capacity
+        count = min(count, self.capacity - slot)
+        first_seq = self.cursor + 1
+        self.cursor += count
+        return self.ring.records[slot:slot + count], first_seq
+
+    def validate(self, view: np.ndarray, first_seq: int) -> np.ndarray:
+        """
+        ตรวจว่า records ใน view ยังเป็นลำดับที่คาดไว้ (ไม่ถูกเขียนทับระหว่างอ่าน)
+
+        Args:
+            view: view จาก poll
+            first_seq: seq ของ record แรก
+
+        Returns:
+            boolean mask ของ records ที่ใช้ได้
+        """
+        expected = np.arange(first_seq, first_seq + len(view), dtype=np.uint64)
+        ok = view['seq'] == expected
+        valid = int(ok.sum())
+        self.consumed += valid
+        self.dropped += len(view) - valid
+        return ok
+
+    @property
+    def lag(self) -> int:
+        """จำนวน records ที่ยังไม่ได้อ่าน"""
+        return int(self.ring.header['head']) - self.cursor
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ reader
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        return {
+            'ring': self.ring.name,
+            'capacity': self.capacity,
+            'head': int(self.ring.header['head']),
+            'cursor': self.cursor,
+            'lag': self.lag,
+            'epoch': int(self.ring.header['epoch']),
+            'writer_heartbeat_age': round(time.time() - float(self.ring.header['heartbeat']), 3),
+            'consumed': self.consumed,
+            'dropped': self.dropped,
+            'resyncs': self.resyncs
+        }
+
+
+def records_to_readings(view: np.ndarray) -> List[Dict]:
+    """
+    แปลง records เป็น reading dicts แบบเดียวกับ BLEWebSocketServer
+
+    Args:
+        view: records
+
+    Returns:
+        รายการ readings
+    """
+    readings = []
+    for row in view[list(FIELDS)].tolist():
+        received_at, timestamp, gateway_mac, tag_mac, rssi, distance, battery, temperature, humidity = row
+        readings.append({
+            'gateway_mac': gateway_mac.decode(),
+            'tag_mac': tag_mac.decode(),
+            'rssi': rssi,
+            'distance': distance,
+            'battery': battery,
+            'temperature': temperature,
+            'humidity': humidity,
+            'timestamp': timestamp,
+            'received_at': received_at
+        })
+    return readings
+
+
+class RingConsumer:
+    """
+    Thread ที่อ่าน ring และส่ง readings ให้ apply ทีละรายการ (เช่น BLEWebSocketServer.store_reading)
+    """
+
+    def __init__(self, ring: ReadingRing, apply: Callable[[Dict], None], batch_size: int = 4096,
+                 idle_sleep: float = 0.001):
+        """
+        เริ่มต้น RingConsumer
+
+        Args:
+            ring: ReadingRing
+            apply: ฟังก์ชันที่รับ reading หนึ่งรายการ
+            batch_size: จำนวน records สูงสุดต่อรอบ
+            idle_sleep: เวลารอ (วินาที) เมื่อไม่มี record ใหม่
+        """
+        self.reader = RingReader(ring)
+        self.apply = apply
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        เริ่ม consumer thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ring-consumer", daemon=True)
+        self._thread.start()
+        logger.info(f"Ring consumer started on {self.reader.ring.name}")
+
+    def stop(self, timeout: float = 5.0):
+        """
+        หยุด consumer thread
+
+        Args:
+            timeout: เวลาสูงสุดที่รอ thread หยุด
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Loop ของ consumer thread"""
+        while not self._stop_event.is_set():
+            try:
+                view, first_seq = self.reader.poll(self.batch_size)
+                if not len(view):
+                    self._stop_event.wait(self.idle_sleep)
+                    continue
+
+                # อ่านออกจาก shared memory ก่อน แล้วจึงตรวจว่าไม่ถูกเขียนทับระหว่างอ่าน
+                readings = records_to_readings(view)
+                mask = self.reader.validate(view, first_seq)
+                del view
+                for reading, ok in zip(readings, mask.tolist()):
+                    if ok:
+                        self.apply(reading)
+            except Exception as e:
+                logger.error(f"Ring consumer error: {e}", exc_info=True)
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ consumer
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        return self.reader.get_statistics()
+
+
+# ==================== Benchmark ====================
+
+def _bench_writer(name: str, records: int, batch: int):
+    """Process ของ writer ใน benchmark: เขียน records ที่สร้างไว้ล่วงหน้าเป็น batch"""
+    ring = ReadingRing.attach(name)
+    writer = RingWriter(ring)
+    template = np.zeros(batch, dtype=RECORD_DTYPE)
+    template['gateway_mac'] = b'AABBCCDDEEFF'
+    template['tag_mac'] = b'112233445566'
+    template['rssi'] = -60.0
+    written = 0
+    while written < records:
+        n = min(batch, records - written)
+        template['received_at'][:n] = time.time()
+        writer.write_batch(template[:n])
+        written += n
+    ring.close()
+
+
+def bench(records: int, capacity: int, batch: int, read_batch: int):
+    """
+    วัด throughput ของ ring: writer process หนึ่งตัว, reader ใน process นี้
+
+    Args:
+        records: จำนวน records ที่เขียน
+        capacity: ขนาดของ ring
+        batch: จำนวน records ต่อการเขียนหนึ่งครั้ง
+        read_batch: จำนวน records สูงสุดต่อการอ่านหนึ่งครั้ง
+    """
+    ring = ReadingRing.create(capacity)
+    reader = RingReader(ring)
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=_bench_writer, args=(ring.name, records, batch))
+
+    started = time.perf_counter()
+    process.start()
+    latencies = []
+    while True:
+        view, first_seq = reader.poll(read_batch)
+        if len(view):
+            received = view['received_at'][-1]
+            mask = reader.validate(view, first_seq)
+            if mask[-1]:
+                latencies.append(time.time() - received)
+        elif not process.is_alive() and reader.lag == 0:
+            break
+    elapsed = time.perf_counter() - started
+    process.join()
+
+    stats = reader.get_statistics()
+    print(f"records: {records}, capacity: {capacity}, write batch: {batch}")
+    print(f"elapsed: {elapsed:.3f}s ({records / elapsed:,.0f} records/s, "
+          f"{records * RECORD_DTYPE.itemsize / elapsed / 1e6:.1f} MB/s)")
+    print(f"consumed: {stats['consumed']}, dropped: {stats['dropped']}, resyncs: {stats['resyncs']}")
+    if latencies:
+        print(f"read latency p50: {np.percentile(latencies, 50) * 1e6:.0f} us, "
+              f"p99: {np.percentile(latencies, 99) * 1e6:.0f} us")
+    del view
+    ring.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Shared-memory reading ring")
+    parser.add_argument('command', choices=['bench'])
+    parser.add_argument('--records', type=int, default=2000000, help="จำนวน records ที่เขียน")
+    parser.add_argument('--capacity', type=int, default=65536, help="ขนาดของ ring (records)")
+    parser.add_argument('--batch', type=int, default=256, help="records ต่อการเขียนหนึ่งครั้ง")
+    parser.add_argument('--read-batch', type=int, default=4096, help="records สูงสุดต่อการอ่านหนึ่งครั้ง")
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.records, args.capacity, args.batch, args.read_batch)
@@ -0,0 +1,249 @@
+"""
+Retention Worker
+ลบ position_history ที่เก่าเกินกำหนดทีละช่วง rowid เล็กๆ ใน background
+เพื่อไม่ให้ถือ write lock นานจนการบันทึกตำแหน่งสะดุด
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from database import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionWorker:
+    """
+    Background thread ที่ทำ retention ตามรอบเวลา
+
+    แต่ละ chunk เป็น DELETE ในช่วง rowid [lo, lo + chunk) หนึ่ง transaction
+    ขนาด chunk ปรับอัตโนมัติให้แต่ละ chunk ใช้เวลาไม่เกิน max_chunk_seconds
+    และพัก pause วินาทีระหว่าง chunk เพื่อให้ writer อื่นได้ lock
+    """
+
+    def __init__(self, db, days: int = 7, interval: float = 3600.0,
+                 chunk_rows: int = 2000, min_chunk_rows: int = 100, max_chunk_rows: int = 20000,
+                 max_chunk_seconds: float = 0.05, pause: float = 0.05,
+                 archive=None, archive_days: int = 30):
+        """
+        เริ่มต้น RetentionWorker
+
+        Args:
+            db: Database instance
+            days: จำนวนวันที่เก็บ position_history ไว้
+            interval: ระยะห่างระหว่างรอบ (วินาที)
+            chunk_rows: ขนาด chunk เริ่มต้น (จำนวน rowid ต่อ DELETE)
+            min_chunk_rows: ขนาด chunk ต่ำสุด
+            max_chunk_rows: ขนาด chunk สูงสุด
+            max_chunk_seconds: เวลาสูงสุดที่ยอมให้แต่ละ chunk ถือ write lock
+            pause: เวลาพักระหว่าง chunk (วินาที)
+            archive: ReadingArchive (optional) สำหรับลบ partition เก่าในรอบเดียวกัน
+            archive_days: จำนวนวันที่เก็บ raw readings ไว้
+        """
+        self.db = db
+        self.days = days
+        self.interval = interval
+        self.chunk_rows = chunk_rows
+        self.min_chunk_rows = min_chunk_rows
+        self.max_chunk_rows = max_chunk_rows
+        self.max_chunk_seconds = max_chunk_seconds
+        self.pause = pause
+        self.archive = archive
+        self.archive_days = archive_days
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # ฟังก์ชันที่รัน SQL นอก event loop (เช่น eventlet.tpool.execute), None = เรียกตรง
+        self.offload: Optional[Callable] = None
+
+        # Progress / statistics
+        self.running = False
+        self.progress = 0.0
+        self.runs = 0
+        self.total_deleted = 0
+        self.last_deleted = 0
+        self.last_chunks = 0
+        self.last_started = None
+        self.last_finished = None
+        self.last_duration = 0.0
+        self.max_chunk_ms = 0.0
+        self.last_error = None
+
+    def start(self):
+        """
+        เริ่ม background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="retention-worker", daemon=True)
+        self._thread.start()
+        logger.info(f"Retention worker started (keep {self.days} days, every {self.interval}s)")
+
+    def stop(self, timeout: float = 5.0):
+        """
+        หยุด background thread (chunk ที่กำลังทำจะทำจนเสร็จ)
+
+        Args:
+            timeout: เวลาสูงสุดที่รอ thread หยุด
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Loop ของ retention thread"""
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}", exc_info=True)
+                self.last_error = str(e)
+                self.running = False
+
+            self._stop_event.wait(self.interval)
+
+    def run_once(self) -> int:
+        """
+        ทำ retention หนึ่งรอบ
+
+        Returns:
+            จำนวน records ที่ลบ
+        """
+        with self._lock:
+            started = time.time()
+            cutoff = format_timestamp(started - self.days * 86400)
+
+            self.running = True
+            self.progress = 0.0
+            self.last_started = started
+            self.last_error = None
+
+            deleted = 0
+            chunks = 0
+
+            first_id, end_id = self._call(self._find_range, cutoff)
+
+            if first_id is not None and end_id is not None:
+                lo = first_id
+                while lo < end_id and not self._stop_event.is_set():
+                    hi = min(lo + self.chunk_rows, end_id)
+                    count = self._delete_chunk(
+                        'DELETE FROM position_history WHERE id >= ? AND id < ? AND timestamp < ?',
+                        (lo, hi, cutoff)
+                    )
+                    deleted += count
+                    chunks += 1
+                    lo = hi
+                    self.progress = (lo - first_id) / max(end_id - first_id, 1)
+                    self.total_deleted += count
+                    self._stop_event.wait(self.pause)
+
+                # แถวที่ timestamp เก่าแต่ id อยู่หลัง end_id (บันทึกย้อนเวลา) มีน้อย ลบผ่าน index
+                while not self._stop_event.is_set():
+                    count = self._delete_chunk('''
+                        DELETE FROM position_history WHERE id IN (
+                            SELECT id FROM position_history WHERE timestamp < ? LIMIT ?
+                        )
+                    ''', (cutoff, self.chunk_rows))
+                    deleted += count
+                    chunks += 1
+                    self.total_deleted += count
+                    if count == 0:
+                        break
+                    self._stop_event.wait(self.pause)
+
+            if self.archive is not None:
+                self._call(self.archive.apply_retention, self.archive_days)
+
+            self.running = False
+            self.progress = 1.0
+            self.runs += 1
+            self.last_deleted = deleted
+            self.last_chunks = chunks
+            self.last_finished = time.time()
+            self.last_duration = self.last_finished - started
+
+        logger.info(f"Retention removed {deleted} position records in {chunks} chunks "
+                    f"({self.last_duration:.1f}s)")
+        return deleted
+
+    def _call(self, func: Callable, *args):
+        """เรียก func ผ่าน offload (ถ้ามี)"""
+        if self.offload is not None:
+            return self.offload(func, *args)
+        return func(*args)
+
+    def _find_range(self, cutoff: str):
+        """
+        หาช่วง id ที่อาจหมดอายุ
+
+        Returns:
+            (id แรก, id แรกที่ยังไม่หมดอายุ) ของ position_history
+        """
+        with self.db.connection() as conn:
+            first_id = conn.execute('SELECT MIN(id) FROM position_history').fetchone()[0]
+            # id แรกที่ยังไม่หมดอายุ (seek ผ่าน idx_position_timestamp)
+            row = conn.execute('''
+                SELECT id FROM position_history WHERE timestamp >= ?
+                ORDER BY timestamp LIMIT 1
+            ''', (cutoff,)).fetchone()
+            end_id = row[0] if row else conn.execute('SELECT MAX(id) + 1 FROM position_history').fetchone()[0]
+        return first_id, end_id
+
+    def _execute(self, query: str, params: tuple) -> int:
+        """รัน DELETE หนึ่งครั้งใน transaction ของตัวเอง"""
+        with self.db.connection() as conn:
+            count = conn.execute(query, params).rowcount
+            conn.commit()
+        return count
+
+    def _delete_chunk(self, query: str, params: tuple) -> int:
+        """
+        ลบหนึ่ง chunk ใน transaction สั้นๆ แล้วปรับขนาด chunk ตามเวลาที่ใช้
+
+        Returns:
+            จำนวนแถวที่ลบ
+        """
+        chunk_started = time.perf_counter()
+
+        count = self._call(self._execute, query, params)
+
+        elapsed = time.perf_counter() - chunk_started
+        self.max_chunk_ms = max(self.max_chunk_ms, elapsed * 1000.0)
+
+        if elapsed > self.max_chunk_seconds:
+            self.chunk_rows = max(self.min_chunk_rows, self.chunk_rows // 2)
+        elif elapsed < self.max_chunk_seconds / 4:
+            self.chunk_rows = min(self.max_chunk_rows, self.chunk_rows * 2)
+
+        return count
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถานะและสถิติของ retention worker
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        return {
+            'days': self.days,
+            'interval': self.interval,
+            'running': self.running,
+            'progress': round(self.progress, 4),
+            'runs': self.runs,
+            'total_deleted': self.total_deleted,
+            'last_deleted': self.last_deleted,
+            'last_chunks': self.last_chunks,
+            'last_started': self.last_started,
+            'last_finished': self.last_finished,
+            'last_duration': round(self.last_duration, 3),
+            'chunk_rows': self.chunk_rows,
+            'max_chunk_ms': round(self.max_chunk_ms, 3),
+            'last_error': self.last_error
+        }
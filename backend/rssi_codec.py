@@ -0,0 +1,211 @@
+"""
+RSSI Codec
+เข้ารหัส position_history.rssi_data เป็น BLOB ขนาดเล็กแทน JSON string
+
+รูปแบบ BLOB (version 1):
+    byte 0            : FORMAT_VERSION
+    n x uint16 (LE)   : gateways.id
+    n x int8          : RSSI (dBm, ปัดเป็นจำนวนเต็ม)
+
+ข้อมูลที่เข้ารหัสไม่ได้ (Gateway ที่ไม่ได้ลงทะเบียน, ค่าที่ไม่ใช่ตัวเลข)
+ยังคงเก็บเป็น JSON string เหมือนเดิม ตัว decode รองรับทั้งสองแบบ
+"""
+
+import argparse
+import json
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAX_GATEWAY_ID = 0xFFFF
+
+
+def encode_rssi(rssi_data: Optional[Dict], gateway_ids: Dict[str, int]) -> Union[bytes, str, None]:
+    """
+    เข้ารหัส rssi_data สำหรับบันทึกลงฐานข้อมูล
+
+    Args:
+        rssi_data: dict ของ MAC Address ของ Gateway -> RSSI
+        gateway_ids: dict ของ MAC Address (normalized) -> gateways.id
+
+    Returns:
+        bytes (BLOB), JSON string (ถ้าเข้ารหัสแบบ binary ไม่ได้) หรือ None
+    """
+    if not rssi_data:
+        return None
+
+    ids = []
+    values = []
+    for mac, rssi in rssi_data.items():
+        gateway_id = gateway_ids.get(str(mac).replace(":", "").upper())
+        if gateway_id is None or gateway_id > MAX_GATEWAY_ID or not isinstance(rssi, (int, float)):
+            return json.dumps(rssi_data)
+        ids.append(gateway_id)
+        values.append(min(max(int(round(rssi)), -128), 127))
+
+    return (bytes([FORMAT_VERSION])
+            + np.array(ids, dtype='<u2').tobytes()
+            + np.array(values, dtype=np.int8).tobytes())
+
+
+def decode_rssi(raw: Union[bytes, str, None], gateway_macs: Dict[int, str]) -> Optional[Dict]:
+    """
+    ถอดรหัส rssi_data หนึ่งแถว
+
+    Args:
+        raw: ค่าจากคอลัมน์ rssi_data (BLOB, JSON string หรือ None)
+        gateway_macs: dict ของ gateways.id -> MAC Address
+
+    Returns:
+        dict ของ MAC Address -> RSSI (Gateway ที่ถูกลบไปแล้วใช้ id เป็น key) หรือ None
+    """
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        return json.loads(raw)
+
+    raw = bytes(raw)
+    if raw[0] != FORMAT_VERSION:
+        raise ValueError(f"Unknown rssi_data format {raw[0]}")
+
+    n = (len(raw) - 1) // 3
+    ids = np.frombuffer(raw, dtype='<u2', count=n, offset=1).tolist()
+    values = np.frombuffer(raw, dtype=np.int8, count=n, offset=1 + 2 * n).tolist()
+    return {gateway_macs.get(i, str(i)): v for i, v in zip(ids, values)}
+
+
+def decode_rssi_matrix(raw_values: List[Union[bytes, str, None]],
+                       gateway_ids: Optional[Dict[str, int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ถอดรหัส rssi_data หลายแถวพร้อมกันเป็น matrix
+
+    แถวที่เป็น BLOB ถูกถอดรหัสแบบ vectorized ครั้งเดียว
+    แถวที่เป็น JSON ต้องใช้ gateway_ids แปลง MAC เป็น id (ถ้าไม่ระบุจะถูกข้าม)
+
+    Args:
+        raw_values: รายการค่าจากคอลัมน์ rssi_data
+        gateway_ids: dict ของ MAC Address (normalized) -> gateways.id (optional)
+
+    Returns:
+        (gateway ids เรียงจากน้อยไปมาก shape (m,),
+         RSSI matrix float32 shape (len(raw_values), m) โดยช่องที่ไม่มีข้อมูลเป็น NaN)
+    """
+    rows = []
+    blobs = []
+    json_entries = []
+
+    for row, raw in enumerate(raw_values):
+        if not raw:
+            continue
+        if isinstance(raw, str):
+            if gateway_ids is None:
+                continue
+            for mac, rssi in json.loads(raw).items():
+                gateway_id = gateway_ids.get(str(mac).replace(":", "").upper())
+                if gateway_id is not None and isinstance(rssi, (int, float)):
+                    json_entries.append((row, gateway_id, rssi))
+        else:
+            rows.append(row)
+            blobs.append(bytes(raw))
+
+    if blobs:
+        buf = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+        lengths = np.fromiter((len(b) for b in blobs), dtype=np.int64, count=len(blobs))
+        starts = np.cumsum(lengths) - lengths
+        if (buf[starts] != FORMAT_VERSION).any():
+            raise ValueError("Unknown rssi_data format")
+
+        counts = (lengths - 1) // 3
+        total = int(counts.sum())
+        entry_row = np.repeat(np.array(rows, dtype=np.int64), counts)
+        k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        id_pos = np.repeat(starts + 1, counts) + 2 * k
+        rssi_pos = np.repeat(starts + 1 + 2 * counts, counts) + k
+
+        entry_id = buf[id_pos].astype(np.int64) | (buf[id_pos + 1].astype(np.int64) << 8)
+        entry_rssi = buf[rssi_pos].view(np.int8).astype(np.float32)
+    else:
+        entry_row = np.empty(0, dtype=np.int64)
+        entry_id = np.empty(0, dtype=np.int64)
+        entry_rssi = np.empty(0, dtype=np.float32)
+
+    if json_entries:
+        extra_row, extra_id, extra_rssi = zip(*json_entries)
+        entry_row = np.concatenate([entry_row, np.array(extra_row, dtype=np.int64)])
+        entry_id = np.concatenate([entry_id, np.array(extra_id, dtype=np.int64)])
+        entry_rssi = np.concatenate([entry_rssi, np.array(extra_rssi, dtype=np.float32)])
+
+    gateway_columns, column = np.unique(entry_id, return_inverse=True)
+    matrix = np.full((len(raw_values), len(gateway_columns)), np.nan, dtype=np.float32)
+    matrix[entry_row, column] = entry_rssi
+    return gateway_columns, matrix
+
+
+def migrate(db, batch_size: int = 5000) -> Dict[str, int]:
+    """
+    แปลง rssi_data ที่เป็น JSON string ใน position_history เป็น BLOB
+    ทำทีละช่วง id (transaction สั้นๆ) จึงรันระหว่างระบบทำงานได้
+
+    Args:
+        db: Database instance
+        batch_size: จำนวน id ต่อ transaction
+
+    Returns:
+        dict ของ scanned, converted, skipped
+    """
+    gateway_ids, _ = db.get_gateway_id_maps()
+    stats = {'scanned': 0, 'converted': 0, 'skipped': 0}
+
+    with db.connection() as conn:
+        first_id, last_id = conn.execute('SELECT MIN(id), MAX(id) FROM position_history').fetchone()
+
+    if first_id is None:
+        return stats
+
+    for lo in range(first_id, last_id + 1, batch_size):
+        with db.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, rssi_data FROM position_history
+                WHERE id >= ? AND id < ? AND typeof(rssi_data) = 'text'
+            ''', (lo, lo + batch_size)).fetchall()
+
+            updates = []
+            for position_id, raw in rows:
+                encoded = encode_rssi(json.loads(raw), gateway_ids)
+                if isinstance(encoded, bytes):
+                    updates.append((encoded, position_id))
+
+            conn.executemany('UPDATE position_history SET rssi_data = ? WHERE id = ?', updates)
+            conn.commit()
+
+        stats['scanned'] += len(rows)
+        stats['converted'] += len(updates)
+        stats['skipped'] += len(rows) - len(updates)
+
+    logger.info(f"rssi_data migration: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    from database import get_database
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="แปลง position_history.rssi_data จาก JSON เป็น BLOB")
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--db', default="ble_trilateration.db", help="path ของฐานข้อมูล")
+    parser.add_argument('--batch', type=int, default=5000, help="จำนวน id ต่อ transaction")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM หลังแปลงเสร็จเพื่อคืนพื้นที่")
+    args = parser.parse_args()
+
+    database = get_database(args.db)
+    if args.command == 'migrate':
+        print(migrate(database, args.batch))
+        if args.vacuum:
+            with database.connection() as conn:
+                conn.execute('VACUUM')
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
@@ -0,0 +1,604 @@
+"""
+Sharded Tracking Engine
+กระจายการคำนวณตำแหน่งไปยัง positioning worker processes หลายตัว
+Tag แต่ละตัวมีเจ้าของเป็น worker เดียวตาม consistent hashing บน tag_mac
+ทำให้ Kalman filter ของ Tag อยู่ที่ worker เดียวเสมอ และเมื่อเพิ่ม/ลด worker มีเพียง Tags ส่วนน้อยที่ย้ายเจ้าของ
+(พร้อมสถานะของ tracker)
+
+Worker เป็น process แยกที่รันไฟล์นี้โดยตรง (ไม่ import main module ของ server ซ้ำแบบ multiprocessing spawn):
+    python sharded_tracking.py worker
+"""
+
+import bisect
+import hashlib
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+from gateway_registry import GatewayRegistry
+from tracking_engine import TrackingEngine
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key: str) -> int:
+    """hash 64-bit ที่เหมือนกันทุก process (ไม่ใช้ hash() ที่ถูก randomize)"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring: แต่ละ worker มีหลายจุด (virtual nodes) บนวง
+    เจ้าของของ key คือจุดแรกที่อยู่ถัดจาก hash ของ key ตามเข็มนาฬิกา
+    """
+
+    def __init__(self, vnodes: int = 64):
+        """
+        เริ่มต้น HashRing
+
+        Args:
+            vnodes: จำนวนจุดต่อ worker (มากขึ้น = กระจาย Tags สม่ำเสมอขึ้น)
+        """
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.members = set()
+
+    def add(self, member: str):
+        """
+        เพิ่ม worker
+
+        Args:
+            member: ชื่อ worker
+        """
+        if member in self.members:
+            return
+        self.members.add(member)
+        for i in range(self.vnodes):
+            point = _hash(f"{member}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, member)
+
+    def remove(self, member: str):
+        """
+        ลบ worker
+
+        Args:
+            member: ชื่อ worker
+        """
+        if member not in self.members:
+            return
+        self.members.discard(member)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != member]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def owner(self, key: str) -> Optional[str]:
+        """
+        หาเจ้าของของ key
+
+        Args:
+            key: key (เช่น tag_mac)
+
+        Returns:
+            ชื่อ worker หรือ None ถ้าไม่มี worker
+        """
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+# ==================== Worker Process ====================
+
+class _GatewaySource:
+    """แหล่งข้อมูลของ GatewayRegistry ใน worker (แทน Database: coordinator ส่ง gateways มาให้)"""
+
+    def __init__(self):
+        self.gateway_version = -1
+        self.gateways: List[Dict] = []
+
+    def get_all_gateways(self) -> List[Dict]:
+        return self.gateways
+
+
+class _ShardReadings:
+    """แหล่ง readings ของ TrackingEngine ใน worker: readings ของ Tags ที่ worker เป็นเจ้าของในรอบนี้"""
+
+    def __init__(self):
+        self.readings: Dict[str, List[Dict]] = {}
+
+    def snapshot_tag_readings(self, max_age: float) -> Dict[str, List[Dict]]:
+        return self.readings
+
+
+def worker_main():
+    """
+    Entry point ของ positioning worker process
+
+    เปิด Listener แล้วพิมพ์ address หนึ่งบรรทัดทาง stdout ให้ coordinator เชื่อมต่อ (authkey จาก BLE_WORKER_AUTHKEY)
+    ใช้ TrackingEngine ตัวเดิมทั้งหมด ต่างเพียงแหล่ง readings และ gateways ที่ coordinator ส่งมาทาง connection
+
+    Messages (tuple ที่ขึ้นต้นด้วยชื่อคำสั่ง):
+        ('init', name, config)          -> ไม่ตอบ (message แรกเสมอ, config = keyword arguments ของ TrackingEngine)
+        ('gateways', version, gateways) -> ไม่ตอบ
+        ('cycle', readings)             -> (positions, statistics)
+        ('export', ring)                -> {tag_mac: (track, position)} ของ Tags ที่ ring ให้ worker อื่นเป็นเจ้าของ
+        ('import', states)              -> ไม่ตอบ
+        ('stop',)                       -> จบ process
+    """
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    with Listener(authkey=bytes.fromhex(os.environ['BLE_WORKER_AUTHKEY'])) as listener:
+        print(listener.address, flush=True)
+        conn = listener.accept()
+
+    _, name, config = conn.recv()
+    source = _GatewaySource()
+    store = _ShardReadings()
+    engine = TrackingEngine(store, GatewayRegistry(source), **config)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            # coordinator ปิด connection (หรือตาย)
+            break
+        command = message[0]
+
+        if command == 'cycle':
+            store.readings = message[1]
+            try:
+                positions = engine.run_once()
+            except Exception as e:
+                # ตอบรอบว่างแทนการจบ process: tracks ของ Tags ใน worker นี้ยังอยู่ครบ
+                logger.error(f"Tracking cycle failed in {name}: {e}", exc_info=True)
+                positions = []
+            store.readings = {}
+            conn.send((positions, {
+                'tags': engine.last_tags,
+                'tracked': len(engine._tracks),
+                'unsolved': engine.unsolved,
+                'last_cycle_ms': engine.last_cycle_ms
+            }))
+
+        elif command == 'gateways':
+            source.gateways = message[2]
+            source.gateway_version = message[1]
+
+        elif command == 'export':
+            ring = message[1]
+            states = {}
+            for tag_mac in [t for t in engine._tracks if ring.owner(t) != name]:
+                states[tag_mac] = (engine._tracks.pop(tag_mac), engine._latest.pop(tag_mac, None))
+            conn.send(states)
+
+        elif command == 'import':
+            for tag_mac, (track, position) in message[1].items():
+                engine._tracks[tag_mac] = track
+                if position is not None:
+                    engine._latest[tag_mac] = position
+
+        elif command == 'stop':
+            break
+
+
+class _Worker:
+    """handle ของ worker process ฝั่ง coordinator"""
+
+    __slots__ = ('name', 'process', 'conn', 'statistics', 'gateway_version')
+
+    # process คือ subprocess.Popen
+
+    def __init__(self, name: str, process, conn):
+        self.name = name
+        self.process = process
+        self.conn = conn
+        self.statistics: Dict = {}
+        # gateway_version ล่าสุดที่ส่งให้ worker นี้สำเร็จ
+        self.gateway_version = None
+
+
+# ==================== Coordinator ====================
+
+class ShardedTrackingEngine(TrackingEngine):
+    """
+    TrackingEngine ที่แบ่ง Tags ให้ positioning workers ตาม consistent hashing บน tag_mac
+
+    ในแต่ละรอบ coordinator แบ่ง snapshot ของ readings ตามเจ้าของของ Tag แล้วส่งให้ทุก worker พร้อมกัน
+    workers คำนวณแบบขนาน (คนละ process) และส่งตำแหน่งกลับมา
+    Subscriptions, ตำแหน่งล่าสุด และ on_positions อยู่ที่ coordinator เหมือน TrackingEngine เดิม
+    """
+
+    def __init__(self, ws_server, gateway_registry, workers: int = 2, vnodes: int = 64,
+                 max_workers: Optional[int] = None, **kwargs):
+        """
+        เริ่มต้น ShardedTrackingEngine
+
+        Args:
+            ws_server: BLEWebSocketServer (แหล่ง readings)
+            gateway_registry: GatewayRegistry
+            workers: จำนวน worker processes ตอนเริ่ม
+            vnodes: จำนวน virtual nodes ต่อ worker บน hash ring
+            max_workers: จำนวน workers สูงสุด (None = จำนวน CPU)
+            **kwargs: พารามิเตอร์อื่นของ TrackingEngine
+        """
+        super().__init__(ws_server, gateway_registry, **kwargs)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        if workers > self.max_workers:
+            logger.warning(f"Requested {workers} positioning workers, limited to {self.max_workers}")
+        # จำนวน workers ที่ต้องการ (worker ที่ตายจะถูกแทนจนครบจำนวนนี้)
+        self.target_workers = max(1, min(workers, self.max_workers))
+        self.ring = HashRing(vnodes)
+
+        self._config = {
+            'interval': self.interval,
+            'max_age': self.max_age,
+            'reset_after': self.reset_after,
+            'calculator': self.calculator,
+            'process_variance': self.process_variance,
+            'measurement_variance': self.measurement_variance
+        }
+        self._authkey = os.urandom(16)
+        self._workers: Dict[str, _Worker] = {}
+        self._names = itertools.count(1)
+        self._owner_cache: Dict[str, str] = {}
+        # ชื่อ workers ที่ส่ง/รับข้อมูลไม่สำเร็จ (ถูกลบออกใน _prune)
+        self._failed = set()
+        # กันไม่ให้รอบคำนวณกับการเพิ่ม/ลด worker ทำงานพร้อมกัน
+        self._cycle_lock = threading.Lock()
+
+        # Statistics
+        self.migrated = 0
+        self.worker_failures = 0
+
+    # ==================== Workers ====================
+
+    def start(self):
+        """
+        เริ่ม worker processes และ coordinator thread
+        """
+        while len(self._workers) < self.target_workers:
+            self.add_worker()
+        super().start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        หยุด coordinator thread และ worker processes
+
+        Args:
+            timeout: เวลาสูงสุดที่รอแต่ละส่วนหยุด
+        """
+        super().stop(timeout)
+        with self._cycle_lock:
+            for worker in list(self._workers.values()):
+                self._stop_worker(worker, timeout)
+            self._workers.clear()
+            self.ring = HashRing(self.ring.vnodes)
+            self._owner_cache.clear()
+
+    def _spawn(self) -> _Worker:
+        """เริ่ม worker process ใหม่ (ยังไม่อยู่บน ring)"""
+        name = f"worker-{next(self._names)}"
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker'],
+                                   stdout=subprocess.PIPE, text=True,
+                                   env=dict(os.environ, BLE_WORKER_AUTHKEY=self._authkey.hex()))
+        address = process.stdout.readline().strip()
+        process.stdout.close()
+        if not address:
+            process.wait()
+            raise RuntimeError(f"Positioning worker {name} failed to start (exit code {process.returncode})")
+
+        try:
+            worker = _Worker(name, process, Client(address, authkey=self._authkey))
+            version = self.gateway_registry.version
+            worker.conn.send(('init', name, self._config))
+            worker.conn.send(('gateways', version, self.gateway_registry.get_all_gateways()))
+            worker.gateway_version = version
+        except (EOFError, OSError) as e:
+            process.kill()
+            process.wait()
+            raise RuntimeError(f"Positioning worker {name} failed to start: {e}")
+        return worker
+
+    def _stop_worker(self, worker: _Worker, timeout: float = 5.0):
+        """หยุด worker process"""
+        try:
+            worker.conn.send(('stop',))
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            worker.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            worker.process.terminate()
+            worker.process.wait()
+        worker.conn.close()
+
+    def _send(self, worker: _Worker, message) -> bool:
+        """
+        ส่ง message ให้ worker (ถ้าไม่สำเร็จ worker ถูกทำเครื่องหมายว่าล้มเหลว)
+
+        Returns:
+            True ถ้าส่งสำเร็จ
+        """
+        if worker.name in self._failed:
+            return False
+        try:
+            worker.conn.send(message)
+            return True
+        except OSError:
+            self._failed.add(worker.name)
+            return False
+
+    def _recv(self, worker: _Worker):
+        """
+        รับคำตอบจาก worker (ถ้าไม่สำเร็จ worker ถูกทำเครื่องหมายว่าล้มเหลว)
+
+        Returns:
+            คำตอบ หรือ None ถ้ารับไม่สำเร็จ
+        """
+        if worker.name in self._failed:
+            return None
+        try:
+            return worker.conn.recv()
+        except (EOFError, OSError):
+            self._failed.add(worker.name)
+            return None
+
+    def _prune(self):
+        """
+        ลบ workers ที่ล้มเหลวออกจาก ring (ต้องถือ _cycle_lock)
+
+        สถานะของ Tags ใน worker ที่ล้มเหลวหายไป: Tags ย้ายไปเจ้าของใหม่และเริ่ม filter ใหม่
+        """
+        for name in list(self._failed):
+            worker = self._workers.pop(name, None)
+            if worker is None:
+                continue
+            logger.error(f"Positioning worker {name} failed (exit code {worker.process.poll()}), removing it")
+            self.worker_failures += 1
+            self.ring.remove(name)
+            worker.conn.close()
+            if worker.process.poll() is None:
+                worker.process.kill()
+            worker.process.wait()
+        self._failed.clear()
+        self._owner_cache.clear()
+
+    def _replace_failed(self):
+        """เริ่ม workers ใหม่แทนตัวที่ล้มเหลวจนครบ target_workers"""
+        while len(self._workers) < self.target_workers:
+            try:
+                self.add_worker()
+            except RuntimeError as e:
+                logger.error(f"Could not replace positioning worker: {e}")
+                break
+
+    def _rebalance(self, sources: List[_Worker]):
+        """
+        ย้ายสถานะของ Tags ที่เปลี่ยนเจ้าของตาม ring ปัจจุบัน (ต้องถือ _cycle_lock)
+
+        Args:
+            sources: workers ที่อาจถือ Tags ที่ไม่ใช่ของตัวเองแล้ว
+        """
+        self._owner_cache.clear()
+
+        exporting = [worker for worker in sources if self._send(worker, ('export', self.ring))]
+        moved: Dict[str, Dict] = {}
+        for worker in exporting:
+            states = self._recv(worker)
+            if states is None:
+                logger.error(f"Positioning worker {worker.name} did not export its tag tracks")
+                continue
+            for tag_mac, state in states.items():
+                moved.setdefault(self.ring.owner(tag_mac), {})[tag_mac] = state
+
+        for name, states in moved.items():
+            if self._send(self._workers[name], ('import', states)):
+                self.migrated += len(states)
+            else:
+                logger.error(f"Positioning worker {name} did not accept {len(states)} migrated tag tracks")
+
+        if moved:
+            logger.info(f"Migrated {sum(len(s) for s in moved.values())} tag tracks "
+                        f"across {len(self._workers)} positioning workers")
+
+    def add_worker(self) -> str:
+        """
+        เพิ่ม worker process หนึ่งตัว และย้าย Tags ที่ ring ให้ worker ใหม่เป็นเจ้าของมาให้
+
+        Returns:
+            ชื่อ worker
+        """
+        worker = self._spawn()
+        with self._cycle_lock:
+            sources = list(self._workers.values())
+            self._workers[worker.name] = worker
+            self.ring.add(worker.name)
+            self._rebalance(sources)
+            self._prune()
+        logger.info(f"Positioning worker {worker.name} started (pid {worker.process.pid})")
+        return worker.name
+
+    def remove_worker(self, name: Optional[str] = None) -> Optional[str]:
+        """
+        ลบ worker process หนึ่งตัว โดยย้าย Tags ทั้งหมดของมันไปยังเจ้าของใหม่ก่อน
+
+        Args:
+            name: ชื่อ worker (None = ตัวที่เพิ่มล่าสุด)
+
+        Returns:
+            ชื่อ worker ที่ถูกลบ หรือ None ถ้าลบไม่ได้ (เหลือ worker ตัวเดียว)
+        """
+        with self._cycle_lock:
+            if len(self._workers) <= 1:
+                return None
+            name = name or list(self._workers)[-1]
+            worker = self._workers.get(name)
+            if worker is None:
+                return None
+
+            self.ring.remove(name)
+            self._rebalance([worker])
+            del self._workers[name]
+            self._failed.discard(name)
+            self._stop_worker(worker)
+            self._prune()
+
+        logger.info(f"Positioning worker {name} removed")
+        return name
+
+    def resize(self, count: int) -> List[str]:
+        """
+        ปรับจำนวน workers
+
+        Args:
+            count: จำนวน workers ที่ต้องการ (1 ถึง max_workers)
+
+        Returns:
+            รายชื่อ workers หลังปรับ
+
+        Raises:
+            ValueError: ถ้า count อยู่นอกช่วง 1 ถึง max_workers
+        """
+        if not 1 <= count <= self.max_workers:
+            raise ValueError(f"workers must be between 1 and {self.max_workers}")
+        self.target_workers = count
+        while len(self._workers) < count:
+            self.add_worker()
+        while len(self._workers) > count:
+            self.remove_worker()
+        return list(self._workers)
+
+    def _owner(self, tag_mac: str) -> str:
+        """เจ้าของของ Tag (cache จนกว่า ring จะเปลี่ยน)"""
+        owner = self._owner_cache.get(tag_mac)
+        if owner is None:
+            owner = self._owner_cache[tag_mac] = self.ring.owner(tag_mac)
+        return owner
+
+    # ==================== Cycle ====================
+
+    def _dispatch(self, parts: Dict[str, Dict]) -> List:
+        """ส่ง readings ให้ทุก worker แล้วรอผลของทุกตัว (workers คำนวณพร้อมกัน)"""
+        sent = [self._workers[name] for name, readings in parts.items()
+                if self._send(self._workers[name], ('cycle', readings))]
+        return [(worker, self._recv(worker)) for worker in sent]
+
+    def run_once(self) -> List[Dict]:
+        """
+        คำนวณตำแหน่งของทุก Tag หนึ่งรอบผ่าน workers
+
+        Returns:
+            รายการตำแหน่งที่คำนวณได้
+        """
+        started = time.perf_counter()
+        now = time.time()
+
+        if not self._workers:
+            # workers ล้มเหลวหมด (เช่นระหว่าง add_worker/remove_worker): เริ่มใหม่ก่อนคำนวณ
+            self._replace_failed()
+
+        snapshot = self.ws_server.snapshot_tag_readings(self.max_age)
+
+        with self._cycle_lock:
+            if not self._workers:
+                return []
+
+            version = self.gateway_registry.version
+            gateways = None
+            for worker in self._workers.values():
+                if worker.gateway_version != version:
+                    if gateways is None:
+                        gateways = self.gateway_registry.get_all_gateways()
+                    if self._send(worker, ('gateways', version, gateways)):
+                        worker.gateway_version = version
+
+            parts: Dict[str, Dict] = {name: {} for name in self._workers}
+            for tag_mac, readings in snapshot.items():
+                parts[self._owner(tag_mac)][tag_mac] = readings
+
+            if self.offload is not None:
+                results = self.offload(self._dispatch, parts)
+            else:
+                results = self._dispatch(parts)
+
+            positions = []
+            for worker, result in results:
+                if result is not None:
+                    worker_positions, worker.statistics = result
+                    positions.extend(worker_positions)
+            if self.latency is not None:
+                self.latency.on_solved(positions)
+
+            self._prune()
+
+        with self._lock:
+            for pos in positions:
+                self._latest[pos['tag_mac']] = pos
+            for tag_mac in [t for t, pos in self._latest.items() if now - pos['timestamp'] > self.reset_after]:
+                del self._latest[tag_mac]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.cycles += 1
+        self.positions += len(positions)
+        self.last_tags = len(snapshot)
+        self.last_cycle_ms = elapsed_ms
+        self.max_cycle_ms = max(self.max_cycle_ms, elapsed_ms)
+
+        self._replace_failed()
+
+        if positions and self.on_positions is not None:
+            self.on_positions(positions)
+            if self.latency is not None:
+                self.latency.on_emit(positions)
+
+        return positions
+
+    # ==================== Queries ====================
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ tracking engine รวมสถิติของแต่ละ worker
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        statistics = super().get_statistics()
+        with self._cycle_lock:
+            workers = {
+                name: {
+                    'pid': worker.process.pid,
+                    'alive': worker.process.poll() is None,
+                    'tags': worker.statistics.get('tags', 0),
+                    'tracked': worker.statistics.get('tracked', 0),
+                    'last_cycle_ms': round(worker.statistics.get('last_cycle_ms', 0.0), 3)
+                }
+                for name, worker in self._workers.items()
+            }
+            unsolved = sum(worker.statistics.get('unsolved', 0) for worker in self._workers.values())
+        statistics.update({
+            'tracked_tags': sum(w['tracked'] for w in workers.values()),
+            'unsolved': self.unsolved + unsolved,
+            'workers': workers,
+            'target_workers': self.target_workers,
+            'max_workers': self.max_workers,
+            'migrated': self.migrated,
+            'worker_failures': self.worker_failures
+        })
+        return statistics
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['worker']:
+        worker_main()
+    else:
+        print("Usage: python sharded_tracking.py worker (started by ShardedTrackingEngine)")
@@ -0,0 +1,118 @@
+"""
+Snapshot Cache
+Cache ของ response ที่ serialize แล้ว สำหรับ endpoints ที่ถูก poll ถี่
+สร้างใหม่เมื่อ generation ของข้อมูลต้นทางเปลี่ยน แต่ไม่บ่อยกว่าหนึ่งครั้งต่อ ttl
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable
+
+
+class _Snapshot:
+    """response หนึ่งชุดที่ serialize แล้ว"""
+
+    __slots__ = ('generation', 'built_at', 'body')
+
+    def __init__(self, generation: int, built_at: float, body: bytes):
+        self.generation = generation
+        self.built_at = built_at
+        self.body = body
+
+
+class SnapshotCache:
+    """
+    Cache ของ snapshot ต่อ key (เช่น endpoint + query parameters)
+
+    - generation ไม่เปลี่ยน: ใช้ snapshot เดิมเสมอ
+    - generation เปลี่ยน: สร้างใหม่เมื่อ snapshot เดิมมีอายุเกิน ttl_ms
+    - requests ที่มาพร้อมกันระหว่างสร้าง snapshot รอผลเดียวกัน (สร้างครั้งเดียว)
+    - เก็บไม่เกิน max_keys keys (key ที่สร้างนานที่สุดถูกลบก่อน)
+    """
+
+    def __init__(self, ttl_ms: float = 250.0, max_keys: int = 64):
+        """
+        เริ่มต้น SnapshotCache
+
+        Args:
+            ttl_ms: อายุต่ำสุด (มิลลิวินาที) ของ snapshot ก่อนสร้างใหม่เมื่อข้อมูลเปลี่ยน
+            max_keys: จำนวน keys สูงสุดที่เก็บ snapshot ไว้
+        """
+        self.ttl = ttl_ms / 1000.0
+        self.max_keys = max_keys
+        self._snapshots: Dict[Hashable, _Snapshot] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def _fresh(self, snapshot: _Snapshot, generation: int, now: float) -> bool:
+        """snapshot ยังใช้ได้หรือไม่"""
+        return snapshot is not None and (snapshot.generation == generation or now - snapshot.built_at < self.ttl)
+
+    def get(self, key: Hashable, generation: int, build: Callable[[], bytes]) -> bytes:
+        """
+        ดึง snapshot ของ key (สร้างด้วย build ถ้าหมดอายุ)
+
+        Args:
+            key: key ของ snapshot
+            generation: generation ปัจจุบันของข้อมูลต้นทาง
+            build: ฟังก์ชันที่สร้าง body (bytes) ใหม่
+
+        Returns:
+            body ที่ serialize แล้ว
+        """
+        snapshot = self._snapshots.get(key)
+        if self._fresh(snapshot, generation, time.monotonic()):
+            self.hits += 1
+            return snapshot.body
+
+        with self._locks_lock:
+            if key not in self._locks and len(self._locks) >= self.max_keys:
+                # ลบ locks ของ keys ที่ไม่มี snapshot แล้ว (ถูกลบออก หรือ build ล้มเหลว)
+                for stale in [k for k in self._locks if k not in self._snapshots]:
+                    del self._locks[stale]
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            # อาจมี request อื่นสร้างเสร็จระหว่างรอ lock
+            snapshot = self._snapshots.get(key)
+            if self._fresh(snapshot, generation, time.monotonic()):
+                self.hits += 1
+                return snapshot.body
+
+            body = build()
+            self._store(key, _Snapshot(generation, time.monotonic(), body))
+            self.builds += 1
+            return body
+
+    def _store(self, key: Hashable, snapshot: _Snapshot):
+        """เก็บ snapshot ไว้ท้ายลำดับ และลบ keys ที่สร้างนานที่สุดเมื่อเกิน max_keys"""
+        with self._locks_lock:
+            self._snapshots.pop(key, None)
+            self._snapshots[key] = snapshot
+            while len(self._snapshots) > self.max_keys:
+                oldest = next(iter(self._snapshots))
+                del self._snapshots[oldest]
+                self._locks.pop(oldest, None)
+                self.evictions += 1
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ cache
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        requests = self.hits + self.builds
+        return {
+            'keys': len(self._snapshots),
+            'hits': self.hits,
+            'builds': self.builds,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / requests, 4) if requests else 0.0,
+            'ttl_ms': self.ttl * 1000.0
+        }
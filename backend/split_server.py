@@ -0,0 +1,185 @@
+"""
+Split Server
+Deployment mode ที่แยก WebSocket ingest ไปไว้ใน process ของตัวเอง
+Ingest process เขียน readings ลง reading ring (shared memory) และบันทึกลง raw reading archive ก่อนตอบ ack
+API process (Flask, Socket.IO, Tracking Engine) อ่าน readings จาก ring โดยไม่ต้องผ่าน socket หรือ pickle
+
+ถ้า ingest process ตาย supervisor จะเริ่มใหม่ และ writer ตัวใหม่เขียนต่อจาก head เดิมใน ring
+
+Usage:
+    python split_server.py [--host 0.0.0.0] [--port 5000] [--ingest-port 8012] [--ring-capacity 262144]
+"""
+
+import argparse
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+
+from flask import jsonify
+
+from reading_ring import ReadingRing, RingConsumer, RingWriter
+
+logger = logging.getLogger(__name__)
+
+
+def run_ingest(ring_name: str, host: str, port: int, db_path: str = None):
+    """
+    Entry point ของ ingest process
+
+    Args:
+        ring_name: ชื่อ shared memory ของ reading ring
+        host: IP address to bind
+        port: Port ของ WebSocket ingest
+        db_path: path ของฐานข้อมูล (None = BLE_DB_PATH หรือค่าเริ่มต้น)
+    """
+    from async_database import AsyncDatabase
+    from database import get_database
+    from reading_archive import ReadingArchive
+    from websocket_server import BLEWebSocketServer, SECRET_KEY
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - ingest - %(name)s - %(levelname)s - %(message)s')
+
+    ring = ReadingRing.attach(ring_name)
+    writer = RingWriter(ring)
+
+    db = get_database(db_path)
+    archive = ReadingArchive(db, partition="day")
+    async_db = AsyncDatabase(db, name="ingest-db")
+    async_db.start()
+
+    ws_server = BLEWebSocketServer(host=host, port=port, secret_key=SECRET_KEY)
+    ws_server.on_reading_callback = writer.write
+    ws_server.persist_reading = lambda reading: async_db.write(archive.insert_readings, reading)
+
+    async def heartbeat():
+        while True:
+            writer.beat()
+            await asyncio.sleep(1.0)
+
+    async def main():
+        asyncio.ensure_future(heartbeat())
+        await ws_server.start()
+
+    logger.info(f"Ingest process writing to reading ring {ring_name} (head={writer.head})")
+    asyncio.run(main())
+
+
+class IngestSupervisor:
+    """
+    เริ่ม ingest process และเริ่มใหม่เมื่อ process จบโดยไม่ได้สั่ง
+    """
+
+    def __init__(self, ring_name: str, host: str, port: int, db_path: str, restart_delay: float = 1.0):
+        """
+        เริ่มต้น IngestSupervisor
+
+        Args:
+            ring_name: ชื่อ shared memory ของ reading ring
+            host: IP address to bind
+            port: Port ของ WebSocket ingest
+            db_path: path ของฐานข้อมูล
+            restart_delay: เวลารอ (วินาที) ก่อนเริ่ม process ใหม่
+        """
+        self.args = (ring_name, host, port, db_path)
+        self.restart_delay = restart_delay
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        เริ่ม supervisor thread
+        """
+        self._thread = threading.Thread(target=self._run, name="ingest-supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        หยุด ingest process
+        """
+        self._stop_event.set()
+        if self._process is not None and self._process.is_alive():
+            self._process.terminate()
+            self._process.join(5)
+
+    def _run(self):
+        """Loop ของ supervisor thread"""
+        while not self._stop_event.is_set():
+            self._process = self._context.Process(target=run_ingest, args=self.args, name="ble-ingest")
+            self._process.start()
+            self._process.join()
+            if self._stop_event.is_set():
+                break
+            self.restarts += 1
+            logger.warning(f"Ingest process exited with code {self._process.exitcode}, "
+                           f"restarting in {self.restart_delay}s")
+            self._stop_event.wait(self.restart_delay)
+
+    def get_statistics(self):
+        """
+        ดึงสถานะของ ingest process
+
+        Returns:
+            Dictionary ของสถานะ
+        """
+        return {
+            'alive': self._process is not None and self._process.is_alive(),
+            'pid': self._process.pid if self._process is not None else None,
+            'restarts': self.restarts
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="รัน ingest และ API แยก process เชื่อมด้วย reading ring")
+    parser.add_argument("--host", default="0.0.0.0", help="IP address to bind")
+    parser.add_argument("--port", type=int, default=5000, help="Port ของ Flask/Socket.IO")
+    parser.add_argument("--ingest-port", type=int, default=8012, help="Port ของ WebSocket ingest")
+    parser.add_argument("--ring-capacity", type=int, default=262144, help="จำนวน readings ใน ring")
+    parser.add_argument("--db", default=None, help="path ของฐานข้อมูล (ค่าเริ่มต้น: BLE_DB_PATH หรือ ble_trilateration.db)")
+    args = parser.parse_args()
+
+    # ทั้ง ingest process และ app_integrated (get_database()) ต้องใช้ฐานข้อมูลเดียวกัน
+    if args.db:
+        os.environ['BLE_DB_PATH'] = args.db
+
+    ring = ReadingRing.create(args.ring_capacity)
+    atexit.register(ring.close)
+
+    supervisor = IngestSupervisor(ring.name, args.host, args.ingest_port, args.db)
+    supervisor.start()
+    atexit.register(supervisor.stop)
+
+    import app_integrated as server
+
+    def apply_reading(reading):
+        server.ws_server.store_reading(reading)
+        # ingest process ไม่มี latency tracker: บันทึก stage receive และ clock drift ของ Gateway ที่นี่
+        server.latency_tracker.on_receive(reading)
+
+    consumer = RingConsumer(ring, apply_reading)
+    consumer.start()
+    atexit.register(consumer.stop)
+
+    @server.app.route('/api/metrics/ingest', methods=['GET'])
+    def get_ingest_metrics():
+        """ดึงสถานะของ ingest process และ reading ring"""
+        return jsonify({
+            'success': True,
+            'ingest': supervisor.get_statistics(),
+            'ring': consumer.get_statistics()
+        })
+
+    server.start_background()
+
+    logger.info(f"Starting Flask Server on port {args.port} (ingest in separate process)")
+    server.socketio.run(server.app, host=args.host, port=args.port, debug=False, allow_unsafe_werkzeug=True)
+
+
+if __name__ == "__main__":
+    main()
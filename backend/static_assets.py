@@ -0,0 +1,136 @@
+"""
+Static Assets
+โหลดไฟล์ของ frontend เข้าหน่วยความจำครั้งเดียวตอนเริ่ม server พร้อม ETag จาก hash ของเนื้อหา
+และเวอร์ชันที่บีบอัดไว้ล่วงหน้า (gzip และ brotli ถ้ามี library)
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# ไฟล์ที่บีบอัดแล้วต้องเล็กกว่าต้นฉบับอย่างน้อยเท่านี้จึงจะเก็บไว้ (PNG บีบอัดซ้ำไม่ได้ผล)
+MIN_COMPRESSION_RATIO = 0.9
+
+
+class StaticAsset:
+    """
+    ไฟล์หนึ่งไฟล์พร้อมเวอร์ชันที่บีบอัดแล้ว (encoding -> bytes)
+    """
+
+    __slots__ = ('body', 'mimetype', 'etag', 'variants')
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:20]
+        self.variants: Dict[str, bytes] = {}
+
+
+class StaticAssets:
+    """
+    ไฟล์ทั้งหมดภายใต้ root ที่โหลดไว้ในหน่วยความจำ
+
+    - ETag: hash ของเนื้อหา (แต่ละ encoding มี ETag ของตัวเอง)
+    - HTML: Cache-Control no-cache (ตรวจ ETag ทุกครั้ง จึงเห็นไฟล์ใหม่หลัง deploy ทันที)
+    - ไฟล์อื่น: Cache-Control public, max-age
+    """
+
+    def __init__(self, root: str, max_age: int = 3600):
+        """
+        เริ่มต้น StaticAssets และโหลดไฟล์ทั้งหมด
+
+        Args:
+            root: โฟลเดอร์ของไฟล์ static
+            max_age: อายุ cache ของไฟล์ที่ไม่ใช่ HTML (วินาที)
+        """
+        self.root = os.path.abspath(root)
+        self.max_age = max_age
+        self.assets: Dict[str, StaticAsset] = {}
+        self.load()
+
+    def load(self):
+        """
+        โหลดไฟล์ทั้งหมดภายใต้ root และบีบอัดไว้ล่วงหน้า
+        """
+        assets = {}
+        raw_bytes = stored_bytes = 0
+
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                asset = StaticAsset(body, mimetype)
+
+                limit = len(body) * MIN_COMPRESSION_RATIO
+                compressed = gzip.compress(body, compresslevel=9, mtime=0)
+                if len(compressed) < limit:
+                    asset.variants['gzip'] = compressed
+                if brotli is not None:
+                    compressed = brotli.compress(body, quality=11)
+                    if len(compressed) < limit:
+                        asset.variants['br'] = compressed
+
+                assets[key] = asset
+                raw_bytes += len(body)
+                stored_bytes += len(body) + sum(len(v) for v in asset.variants.values())
+
+        self.assets = assets
+        logger.info(f"Loaded {len(assets)} static files from {self.root} "
+                    f"({raw_bytes} bytes, {stored_bytes} bytes with compressed variants, "
+                    f"brotli={'yes' if brotli is not None else 'no'})")
+
+    def response(self, filename: str, request) -> Optional[Response]:
+        """
+        สร้าง response ของไฟล์ตาม Accept-Encoding และ If-None-Match ของ request
+
+        Args:
+            filename: path ของไฟล์ (relative กับ root)
+            request: Flask request
+
+        Returns:
+            Response (200 หรือ 304) หรือ None ถ้าไม่มีไฟล์นี้ในหน่วยความจำ
+        """
+        asset = self.assets.get(filename)
+        if asset is None:
+            return None
+
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and candidate in request.accept_encodings:
+                encoding = candidate
+                break
+
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding] if encoding else asset.body,
+                                mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        if asset.mimetype == 'text/html':
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+        return response
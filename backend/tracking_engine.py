@@ -0,0 +1,419 @@
+"""
+Tracking Engine
+คำนวณตำแหน่งของทุก Tag ที่ active บนทุกชั้นในแต่ละรอบด้วย thread เดียว
+ใช้ snapshot ของ readings ทั้งหมดครั้งเดียวต่อรอบ และแก้ least squares ของทุก Tag ในชั้นเดียวกันพร้อมกัน
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from kalman_filter import KalmanFilter
+from trilateration_algorithm import TrilaterationCalculator
+
+logger = logging.getLogger(__name__)
+
+
+class _TagTrack:
+    """สถานะของ Tag หนึ่งตัว: Kalman filter แกน x/y และชั้นล่าสุด"""
+
+    __slots__ = ('floor', 'kf_x', 'kf_y', 'last_update')
+
+    def __init__(self, floor: int, process_variance: float, measurement_variance: float):
+        self.floor = floor
+        self.kf_x = KalmanFilter(process_variance, measurement_variance)
+        self.kf_y = KalmanFilter(process_variance, measurement_variance)
+        self.last_update = 0.0
+
+
+def solve_batch(coords: np.ndarray, distances: np.ndarray, mask: np.ndarray):
+    """
+    แก้ตำแหน่งของหลาย Tag พร้อมกันด้วย weighted linear least squares
+
+    ใช้รูปเชิงเส้น -2*xi*x - 2*yi*y + c = ri^2 - xi^2 - yi^2 (c = x^2 + y^2)
+    ซึ่งแต่ละ Gateway เป็นหนึ่งสมการอิสระ จึง pad จำนวน Gateway ต่อ Tag ได้ด้วย mask
+    น้ำหนัก 1/r^2 เพราะความคลาดเคลื่อนของ r^2 โตตามระยะ
+
+    Args:
+        coords: พิกัด Gateway shape (T, K, 2)
+        distances: ระยะทาง shape (T, K)
+        mask: True ถ้าช่องนั้นมีข้อมูล shape (T, K)
+
+    Returns:
+        (positions shape (T, 2), valid shape (T,)) โดย Tag ที่แก้ไม่ได้ (เช่น Gateway อยู่ในแนวเดียวกัน)
+        มี valid เป็น False
+    """
+    gx = coords[..., 0]
+    gy = coords[..., 1]
+
+    A = np.stack([-2.0 * gx, -2.0 * gy, np.ones_like(gx)], axis=-1)
+    b = distances ** 2 - gx ** 2 - gy ** 2
+    w = np.where(mask, 1.0 / np.maximum(distances, 1.0) ** 2, 0.0)
+
+    M = np.einsum('tki,tk,tkj->tij', A, w, A)
+    v = np.einsum('tki,tk,tk->ti', A, w, b)
+
+    positions = np.full((len(M), 2), np.nan)
+    valid = mask.sum(axis=1) >= 3
+    if valid.any():
+        valid[valid] = np.linalg.cond(M[valid]) < 1e12
+    if valid.any():
+        positions[valid] = np.linalg.solve(M[valid], v[valid][..., None])[:, :2, 0]
+    return positions, valid
+
+
+class TrackingEngine:
+    """
+    Engine ที่คำนวณตำแหน่งของทุก Tag ในทุกรอบ (background thread เดียว)
+
+    Frontend ไม่สร้าง thread: start_tracking/stop_tracking เพียงเพิ่ม/ลบ subscription
+    ผลของแต่ละรอบถูกส่งให้ on_positions (เช่น บันทึก, geofence, ส่งไปยัง subscribers)
+    """
+
+    def __init__(self, ws_server, gateway_registry, interval: float = 1.0, max_age: float = 5.0,
+                 reset_after: float = 30.0, calculator: Optional[TrilaterationCalculator] = None,
+                 process_variance: float = 0.05, measurement_variance: float = 1.0):
+        """
+        เริ่มต้น TrackingEngine
+
+        Args:
+            ws_server: BLEWebSocketServer (แหล่ง readings)
+            gateway_registry: GatewayRegistry
+            interval: ระยะห่างระหว่างรอบ (วินาที)
+            max_age: อายุสูงสุดของ reading ที่ใช้คำนวณ (วินาที)
+            reset_after: รีเซ็ต Kalman filter ถ้า Tag หายไปนานกว่านี้ (วินาที)
+            calculator: TrilaterationCalculator (ใช้แปลง RSSI เป็นระยะทางเมื่อไม่มี distance)
+            process_variance: Q ของ Kalman filter ต่อแกน
+            measurement_variance: R ของ Kalman filter ต่อแกน
+        """
+        self.ws_server = ws_server
+        self.gateway_registry = gateway_registry
+        self.interval = interval
+        self.max_age = max_age
+        self.reset_after = reset_after
+        self.calculator = calculator or TrilaterationCalculator()
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+
+        # Callback ที่รับรายการตำแหน่งของแต่ละรอบ
+        self.on_positions: Optional[Callable[[List[Dict]], None]] = None
+
+        # ฟังก์ชันที่รัน solve_batch นอก event loop (เช่น eventlet.tpool.execute), None = เรียกตรง
+        self.offload: Optional[Callable] = None
+
+        # LatencyTracker (optional): บันทึก stage queue, solve, emit และ end_to_end ของแต่ละรอบ
+        self.latency = None
+
+        self._tracks: Dict[str, _TagTrack] = {}
+        self._latest: Dict[str, Dict] = {}
+        self._subscriptions: Dict[str, Tuple[frozenset, frozenset]] = {}
+        self._floor_subscribers = Counter()
+        self._tag_subscribers = Counter()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.cycles = 0
+        self.positions = 0
+        self.unsolved = 0
+        self.last_cycle_ms = 0.0
+        self.max_cycle_ms = 0.0
+        self.last_tags = 0
+
+    # ==================== Subscriptions ====================
+
+    def subscribe(self, client_id: str, floors=(), tag_macs=()) -> Tuple[frozenset, frozenset]:
+        """
+        ตั้ง subscription ของ client (แทนที่ของเดิม)
+
+        Args:
+            client_id: ID ของ client (Socket.IO sid)
+            floors: ชั้นที่ต้องการรับตำแหน่งของทุก Tag
+            tag_macs: Tags ที่ต้องการรับตำแหน่ง (ไม่ว่าอยู่ชั้นใด)
+
+        Returns:
+            subscription เดิม (floors, tag_macs) สำหรับออกจาก rooms เดิม
+        """
+        subscription = (frozenset(floors),
+                        frozenset(mac.replace(":", "").upper() for mac in tag_macs))
+        with self._lock:
+            previous = self._remove_subscription(client_id)
+            self._subscriptions[client_id] = subscription
+            self._floor_subscribers.update(subscription[0])
+            self._tag_subscribers.update(subscription[1])
+        return previous
+
+    def unsubscribe(self, client_id: str) -> Tuple[frozenset, frozenset]:
+        """
+        ยกเลิก subscription ของ client
+
+        Args:
+            client_id: ID ของ client
+
+        Returns:
+            subscription เดิม (floors, tag_macs)
+        """
+        with self._lock:
+            return self._remove_subscription(client_id)
+
+    def _remove_subscription(self, client_id: str) -> Tuple[frozenset, frozenset]:
+        """ลบ subscription และลดตัวนับต่อ floor/tag (ต้องถือ lock)"""
+        previous = self._subscriptions.pop(client_id, (frozenset(), frozenset()))
+        self._floor_subscribers.subtract(previous[0])
+        self._tag_subscribers.subtract(previous[1])
+        for counter, keys in ((self._floor_subscribers, previous[0]), (self._tag_subscribers, previous[1])):
+            for key in keys:
+                if counter[key] <= 0:
+                    del counter[key]
+        return previous
+
+    def get_subscription(self, client_id: str) -> Tuple[frozenset, frozenset]:
+        """
+        ดึง subscription ของ client
+
+        Args:
+            client_id: ID ของ client
+
+        Returns:
+            (floors, tag_macs)
+        """
+        with self._lock:
+            return self._subscriptions.get(client_id, (frozenset(), frozenset()))
+
+    def get_subscribed(self) -> Tuple[set, set]:
+        """
+        ชั้นและ Tags ที่มี subscriber อย่างน้อยหนึ่งราย
+
+        Returns:
+            (set ของชั้น, set ของ tag_mac)
+        """
+        with self._lock:
+            return set(self._floor_subscribers), set(self._tag_subscribers)
+
+    # ==================== Engine Thread ====================
+
+    def start(self):
+        """
+        เริ่ม background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="tracking-engine", daemon=True)
+        self._thread.start()
+        logger.info(f"Tracking engine started (interval={self.interval}s, max_age={self.max_age}s)")
+
+    def stop(self, timeout: float = 5.0):
+        """
+        หยุด background thread
+
+        Args:
+            timeout: เวลาสูงสุดที่รอ thread หยุด
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Loop ของ engine thread (รักษาจังหวะรอบให้คงที่)"""
+        next_cycle = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Tracking cycle failed: {e}", exc_info=True)
+
+            next_cycle += self.interval
+            delay = next_cycle - time.monotonic()
+            if delay < 0:
+                # รอบนี้ช้ากว่า interval: เริ่มรอบถัดไปทันทีแต่ไม่สะสมรอบที่ค้าง
+                next_cycle = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def run_once(self) -> List[Dict]:
+        """
+        คำนวณตำแหน่งของทุก Tag หนึ่งรอบ
+
+        Returns:
+            รายการตำแหน่งที่คำนวณได้
+        """
+        started = time.perf_counter()
+        now = time.time()
+
+        snapshot = self.ws_server.snapshot_tag_readings(self.max_age)
+
+        # จัดกลุ่ม Tag ตามชั้น: ชั้นของ Gateway ที่ได้ RSSI แรงที่สุด
+        by_floor: Dict[int, List] = {}
+        for tag_mac, readings in snapshot.items():
+            best = None
+            for reading in readings:
+                gateway = self.gateway_registry.get_gateway(reading['gateway_mac'])
+                if gateway is not None and (best is None or reading['rssi'] > best[0]):
+                    best = (reading['rssi'], gateway['floor'])
+            if best is not None:
+                by_floor.setdefault(best[1], []).append((tag_mac, readings))
+
+        positions = []
+        for floor, tags in by_floor.items():
+            positions.extend(self._solve_floor(floor, tags, now))
+        if self.latency is not None:
+            self.latency.on_solved(positions)
+
+        with self._lock:
+            for pos in positions:
+                self._latest[pos['tag_mac']] = pos
+            for tag_mac in [t for t, track in self._tracks.items() if now - track.last_update > self.reset_after]:
+                del self._tracks[tag_mac]
+                self._latest.pop(tag_mac, None)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.cycles += 1
+        self.positions += len(positions)
+        self.last_tags = len(snapshot)
+        self.last_cycle_ms = elapsed_ms
+        self.max_cycle_ms = max(self.max_cycle_ms, elapsed_ms)
+
+        if positions and self.on_positions is not None:
+            self.on_positions(positions)
+            if self.latency is not None:
+                self.latency.on_emit(positions)
+
+        return positions
+
+    def _solve_floor(self, floor: int, tags: List, now: float) -> List[Dict]:
+        """
+        แก้ตำแหน่งของทุก Tag ในชั้นเดียวพร้อมกัน แล้วผ่าน Kalman filter ของแต่ละ Tag
+
+        Args:
+            floor: ชั้น
+            tags: รายการ (tag_mac, readings)
+            now: เวลาของรอบนี้
+
+        Returns:
+            รายการตำแหน่ง
+        """
+        layout = self.gateway_registry.get_floor(floor)
+        if len(layout) < 3:
+            self.unsolved += len(tags)
+            return []
+
+        matched = []
+        for tag_mac, readings in tags:
+            indices = layout.lookup([r['gateway_mac'] for r in readings])
+            ok = indices >= 0
+            matched.append((tag_mac, [r for r, m in zip(readings, ok) if m], indices[ok]))
+
+        width = max(len(idx) for _, _, idx in matched)
+        count = len(matched)
+        index = np.zeros((count, width), dtype=np.int64)
+        rssi = np.zeros((count, width))
+        distance = np.zeros((count, width))
+        mask = np.zeros((count, width), dtype=bool)
+
+        for t, (_, readings, idx) in enumerate(matched):
+            n = len(idx)
+            index[t, :n] = idx
+            rssi[t, :n] = [r['rssi'] for r in readings]
+            distance[t, :n] = [r['distance'] for r in readings]
+            mask[t, :n] = True
+
+        # ใช้ distance จาก Gateway ถ้ามี ไม่เช่นนั้นแปลงจาก RSSI (log-distance path loss)
+        c = self.calculator
+        from_rssi = np.power(10.0, (c.measured_power - rssi) / (10.0 * c.n_factor))
+        distance = np.where(distance > 0, distance, from_rssi)
+
+        if self.offload is not None:
+            raw, valid = self.offload(solve_batch, layout.coords[index], distance, mask)
+        else:
+            raw, valid = solve_batch(layout.coords[index], distance, mask)
+
+        positions = []
+        for t, (tag_mac, readings, idx) in enumerate(matched):
+            if not valid[t]:
+                self.unsolved += 1
+                continue
+
+            raw_x, raw_y = float(raw[t, 0]), float(raw[t, 1])
+            track = self._tracks.get(tag_mac)
+            if track is None or track.floor != floor:
+                track = _TagTrack(floor, self.process_variance, self.measurement_variance)
+                self._tracks[tag_mac] = track
+            track.last_update = now
+
+            positions.append({
+                'tag_mac': tag_mac,
+                'floor': floor,
+                'x': track.kf_x.update(raw_x),
+                'y': track.kf_y.update(raw_y),
+                'raw_x': raw_x,
+                'raw_y': raw_y,
+                'gateway_count': len(idx),
+                'confidence': min(len(idx) / 10.0, 1.0),
+                'timestamp': now,
+                'gateways': readings
+            })
+
+        return positions
+
+    # ==================== Queries ====================
+
+    def get_position(self, tag_mac: str) -> Optional[Dict]:
+        """
+        ดึงตำแหน่งล่าสุดของ Tag
+
+        Args:
+            tag_mac: MAC Address ของ Tag
+
+        Returns:
+            ตำแหน่งล่าสุด หรือ None
+        """
+        with self._lock:
+            return self._latest.get(tag_mac.replace(":", "").upper())
+
+    def get_positions(self, floor: int = None) -> List[Dict]:
+        """
+        ดึงตำแหน่งล่าสุดของทุก Tag
+
+        Args:
+            floor: ชั้น (optional)
+
+        Returns:
+            รายการตำแหน่ง
+        """
+        with self._lock:
+            return [pos for pos in self._latest.values() if floor is None or pos['floor'] == floor]
+
+    def get_statistics(self) -> Dict:
+        """
+        ดึงสถิติของ tracking engine
+
+        Returns:
+            Dictionary ของสถิติ
+        """
+        with self._lock:
+            subscribers = len(self._subscriptions)
+            subscribed_floors = len(self._floor_subscribers)
+            subscribed_tags = len(self._tag_subscribers)
+            tracked = len(self._tracks)
+
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'cycles': self.cycles,
+            'positions': self.positions,
+            'unsolved': self.unsolved,
+            'active_tags': self.last_tags,
+            'tracked_tags': tracked,
+            'subscribers': subscribers,
+            'subscribed_floors': subscribed_floors,
+            'subscribed_tags': subscribed_tags,
+            'last_cycle_ms': round(self.last_cycle_ms, 3),
+            'max_cycle_ms': round(self.max_cycle_ms, 3)
+        }
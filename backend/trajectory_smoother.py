@@ -0,0 +1,226 @@
+"""
+Offline Trajectory Smoother
+ปรับเส้นทางย้อนหลังของ Tag ด้วย Rauch-Tung-Striebel (RTS) smoothing
+ใช้สำหรับรายงานย้อนหลัง (position_history เก็บเฉพาะค่าจาก forward filter)
+"""
+
+import argparse
+import csv
+import logging
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from scipy.linalg import solveh_banded
+
+logger = logging.getLogger(__name__)
+
+
+class TrajectorySmoother:
+    """
+    RTS Smoother แบบ batch สำหรับโมเดล constant velocity (แกน x และ y แยกกัน)
+
+    ค่าที่ได้เท่ากับ RTS smoother (fixed-interval smoothing) ทุกประการ
+    แต่แทนที่จะวน loop Python ทีละจุด จะประกอบระบบสมการ block-tridiagonal
+    ของทั้งเส้นทางด้วย NumPy แล้วแก้ด้วย banded Cholesky ของ scipy
+    (forward elimination + back substitution ทั้งหมดอยู่ใน LAPACK)
+    """
+
+    def __init__(self, process_noise: float = 0.5, measurement_noise: float = 4.0,
+                 max_gap: float = 30.0, min_dt: float = 0.05,
+                 initial_velocity_std: float = 2.0):
+        """
+        เริ่มต้น TrajectorySmoother
+
+        Args:
+            process_noise: spectral density ของความเร่ง (m^2/s^3)
+            measurement_noise: ความแปรปรวนของตำแหน่งที่วัดได้ (m^2)
+            max_gap: ช่วงห่างสูงสุด (วินาที) ก่อนตัดเป็นเส้นทางใหม่
+            min_dt: ช่วงเวลาต่ำสุดระหว่างจุด (กันกรณี timestamp ซ้ำกัน)
+            initial_velocity_std: ส่วนเบี่ยงเบนของความเร็วตอนเริ่มแต่ละช่วง (m/s)
+        """
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_gap = max_gap
+        self.min_dt = min_dt
+        self.initial_velocity_std = initial_velocity_std
+
+        # precision ของตำแหน่งเริ่มต้น (diffuse prior)
+        self.initial_position_precision = 1e-6
+
+    def smooth(self, timestamps, xs, ys, floors=None, confidences=None) -> Dict[str, np.ndarray]:
+        """
+        ปรับเส้นทางทั้งชุดในครั้งเดียว
+
+        Args:
+            timestamps: เวลาของแต่ละจุด (วินาที เรียงจากน้อยไปมาก)
+            xs: พิกัด X ที่ผ่าน forward filter แล้ว
+            ys: พิกัด Y ที่ผ่าน forward filter แล้ว
+            floors: ชั้นของแต่ละจุด (optional, เปลี่ยนชั้นจะตัดเป็นช่วงใหม่)
+            confidences: ความมั่นใจ 0-1 ใช้ถ่วงน้ำหนักการวัด (optional)
+
+        Returns:
+            dict ของ timestamp, x, y, vx, vy, segment (numpy arrays)
+        """
+        t = np.asarray(timestamps, dtype=np.float64)
+        z = np.column_stack((np.asarray(xs, dtype=np.float64),
+                             np.asarray(ys, dtype=np.float64)))
+        n = len(t)
+
+        if n == 0:
+            empty = np.empty(0)
+            return {'timestamp': empty, 'x': empty, 'y': empty,
+                    'vx': empty, 'vy': empty, 'segment': np.empty(0, dtype=np.int64)}
+
+        # ความแปรปรวนของการวัดแต่ละจุด
+        r = np.full(n, self.measurement_noise)
+        if confidences is not None:
+            conf = np.asarray(confidences, dtype=np.float64)
+            conf = np.where(np.isnan(conf), 1.0, np.clip(conf, 0.05, 1.0))
+            r = r / conf
+
+        # จุดเชื่อมระหว่าง k กับ k+1 (ตัดเมื่อห่างเกิน max_gap หรือเปลี่ยนชั้น)
+        raw_dt = np.diff(t)
+        link = raw_dt <= self.max_gap
+        if floors is not None:
+            f = np.asarray(floors)
+            link &= f[1:] == f[:-1]
+        dt = np.maximum(raw_dt, self.min_dt)
+
+        # Q^-1 ของโมเดล white-noise acceleration: (1/q) [[12/dt^3, -6/dt^2], [-6/dt^2, 4/dt]]
+        weight = link / self.process_noise
+        qa = weight * 12.0 / dt**3
+        qb = weight * -6.0 / dt**2
+        qc = weight * 4.0 / dt
+
+        # Diagonal blocks D_k (symmetric 2x2: d00, d01, d11)
+        d00 = 1.0 / r
+        d01 = np.zeros(n)
+        d11 = np.zeros(n)
+
+        # เทอมจาก transition ขาเข้า (k-1 -> k): Q^-1
+        d00[1:] += qa
+        d01[1:] += qb
+        d11[1:] += qc
+
+        # เทอมจาก transition ขาออก (k -> k+1): F^T Q^-1 F
+        a_dt_b = qa * dt + qb
+        d00[:-1] += qa
+        d01[:-1] += a_dt_b
+        d11[:-1] += dt * a_dt_b + qb * dt + qc
+
+        # Prior ที่จุดเริ่มต้นของแต่ละช่วง
+        starts = np.concatenate(([True], ~link))
+        d00[starts] += self.initial_position_precision
+        d11[starts] += 1.0 / self.initial_velocity_std**2
+
+        rhs = np.zeros((2 * n, 2))
+        rhs[0::2] = z / r[:, None]
+        rhs[0::2][starts] += self.initial_position_precision * z[starts]
+
+        # Banded storage แบบ lower: ab[i - j, j] = A[i, j] ตัวแปรเรียงเป็น [p0, v0, p1, v1, ...]
+        ab = np.zeros((4, 2 * n))
+        ab[0, 0::2] = d00
+        ab[0, 1::2] = d11
+        ab[1, 0::2] = d01
+
+        # Off-diagonal blocks A_{k+1,k} = -Q^-1 F
+        ab[2, 0:-2:2] = -qa
+        ab[1, 1:-2:2] = -a_dt_b
+        ab[3, 0:-2:2] = -qb
+        ab[2, 1:-2:2] = -(qb * dt + qc)
+
+        solution = solveh_banded(ab, rhs, lower=True, check_finite=False)
+
+        return {
+            'timestamp': t,
+            'x': solution[0::2, 0],
+            'y': solution[0::2, 1],
+            'vx': solution[1::2, 0],
+            'vy': solution[1::2, 1],
+            'segment': np.cumsum(starts) - 1
+        }
+
+    def smooth_tag(self, db, tag_mac: str, start_time: float = None,
+                   end_time: float = None, floor: int = None) -> Dict[str, np.ndarray]:
+        """
+        ดึงเส้นทางของ Tag จาก Database แล้วปรับให้เรียบ
+
+        Args:
+            db: Database instance
+            tag_mac: MAC Address ของ Tag
+            start_time: เวลาเริ่มต้น (Unix epoch, optional)
+            end_time: เวลาสิ้นสุด (Unix epoch, optional)
+            floor: ชั้น (optional)
+
+        Returns:
+            dict ของคอลัมน์ที่ปรับแล้ว พร้อม floor และ raw_x, raw_y
+        """
+        track = db.get_position_track(tag_mac, start_time, end_time, floor)
+
+        confidences = np.array([np.nan if c is None else c for c in track['confidence']],
+                               dtype=np.float64)
+        result = self.smooth(track['timestamp'], track['x'], track['y'],
+                             floors=track['floor'], confidences=confidences)
+
+        result['floor'] = np.asarray(track['floor'], dtype=np.int64)
+        result['raw_x'] = np.asarray(track['x'], dtype=np.float64)
+        result['raw_y'] = np.asarray(track['y'], dtype=np.float64)
+
+        return result
+
+
+def write_csv(result: Dict[str, np.ndarray], output) -> None:
+    """
+    เขียนผลลัพธ์เป็น CSV
+
+    Args:
+        result: ผลลัพธ์จาก TrajectorySmoother.smooth_tag
+        output: file object
+    """
+    columns = ['timestamp', 'floor', 'x', 'y', 'vx', 'vy', 'raw_x', 'raw_y', 'segment']
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    writer.writerows(zip(*(result[name].tolist() for name in columns)))
+
+
+def main(argv: Optional[list] = None):
+    """
+    CLI สำหรับปรับเส้นทางย้อนหลัง
+    """
+    from database import get_database
+
+    parser = argparse.ArgumentParser(description="RTS smoothing ของ position_history")
+    parser.add_argument('tag_mac', help="MAC Address ของ Tag")
+    parser.add_argument('--db', default="ble_trilateration.db", help="path ของฐานข้อมูล")
+    parser.add_argument('--from', dest='start_time', type=float, help="เวลาเริ่มต้น (Unix epoch)")
+    parser.add_argument('--to', dest='end_time', type=float, help="เวลาสิ้นสุด (Unix epoch)")
+    parser.add_argument('--floor', type=int, help="ชั้น")
+    parser.add_argument('--process-noise', type=float, default=0.5)
+    parser.add_argument('--measurement-noise', type=float, default=4.0)
+    parser.add_argument('--output', '-o', help="ไฟล์ CSV ผลลัพธ์ (default: stdout)")
+    args = parser.parse_args(argv)
+
+    db = get_database(args.db)
+    smoother = TrajectorySmoother(process_noise=args.process_noise,
+                                  measurement_noise=args.measurement_noise)
+
+    started = time.perf_counter()
+    result = smoother.smooth_tag(db, args.tag_mac, args.start_time, args.end_time, args.floor)
+    elapsed = time.perf_counter() - started
+
+    logger.info(f"Smoothed {len(result['x'])} positions "
+                f"({int(result['segment'][-1]) + 1 if len(result['segment']) else 0} segments) "
+                f"in {elapsed * 1000:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_csv(result, f)
+    else:
+        write_csv(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
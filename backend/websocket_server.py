@@ -9,13 +9,18 @@ import websockets
 import json
 import jwt
 import logging
+import os
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set, Tuple
 import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Secret key ของ JWT ที่ Gateway ใช้ (ใช้ร่วมกันทุก process ที่รับหรือสร้าง token)
+SECRET_KEY = os.environ.get('BLE_WS_SECRET_KEY', "ble-kku-secret-key-2025")
+
 
 class BLEWebSocketServer:
     """
@@ -42,9 +47,25 @@ class BLEWebSocketServer:
         self.latest_data = {}
         self.total_messages = 0
         
+        # เพิ่มทุกครั้งที่ latest_data เปลี่ยน (ใช้ตรวจว่า snapshot ของ API ยังใช้ได้หรือไม่)
+        self.generation = 0
+        
+        # Reading ล่าสุดแยกตาม Tag: tag_mac -> {gateway_mac: reading} (อ่านจาก thread อื่นผ่าน snapshot)
+        self.tag_readings: Dict[str, Dict[str, Dict]] = {}
+        self._readings_lock = threading.Lock()
+        
         # Callback for data processing
         self.on_data_callback = None
         
+        # Callback ต่อ reading (เช่น ส่งเข้า raw reading archive)
+        self.on_reading_callback = None
+        
+        # Coroutine function สำหรับบันทึก reading ก่อนตอบ ack (เช่น ผ่าน AsyncDatabase)
+        self.persist_reading = None
+        
+        # LatencyTracker (optional): บันทึก stage receive และ persist ของแต่ละ reading
+        self.latency = None
+        
         logger.info(f"Initialized WebSocket Server")
         logger.info(f"Host: {host}, Port: {port}")
     
@@ -89,13 +110,13 @@ class BLEWebSocketServer:
             logger.warning(f"Invalid token: {e}")
             return False
     
-    async def handle_client(self, websocket, path):
+    async def handle_client(self, websocket, path=None):
         """
         จัดการ client connection
         
         Args:
             websocket: WebSocket connection
-            path: Request path
+            path: Request path (websockets < 13 เท่านั้น)
         """
         client_id = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
         logger.info(f"New connection from {client_id}")
@@ -105,50 +126,19 @@ class BLEWebSocketServer:
         
         try:
             async for message in websocket:
-                try:
-                    # Parse JSON
-                    data = json.loads(message)
-                    
-                    # ตรวจสอบ JWT Token
-                    token = data.get('token', '')
-                    
-                    if not self.verify_jwt_token(token):
-                        await websocket.send(json.dumps({
-                            'status': 'error',
-                            'message': 'Invalid or expired token'
-                        }))
-                        continue
-                    
-                    # ประมวลผลข้อมูล
-                    success = self.process_ble_data(data)
-                    
-                    if success:
-                        # ส่ง acknowledgment
-                        await websocket.send(json.dumps({
-                            'status': 'success',
-                            'message': 'Data received'
-                        }))
-                        
-                        self.total_messages += 1
-                    else:
-                        await websocket.send(json.dumps({
-                            'status': 'error',
-                            'message': 'Failed to process data'
-                        }))
+                response, reading = self.handle_message(message, client_id)
                 
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid JSON from {client_id}: {e}")
-                    await websocket.send(json.dumps({
-                        'status': 'error',
-                        'message': 'Invalid JSON format'
-                    }))
+                # บันทึกผ่าน DB thread (ไม่ block event loop) แล้วค่อยตอบ ack
+                if reading and self.persist_reading:
+                    try:
+                        await self.persist_reading(reading)
+                        if self.latency is not None:
+                            self.latency.on_persist(reading)
+                    except Exception as e:
+                        logger.error(f"Error persisting reading from {client_id}: {e}", exc_info=True)
+                        response = {'status': 'error', 'message': str(e)}
                 
-                except Exception as e:
-                    logger.error(f"Error processing message from {client_id}: {e}", exc_info=True)
-                    await websocket.send(json.dumps({
-                        'status': 'error',
-                        'message': str(e)
-                    }))
+                await websocket.send(json.dumps(response))
         
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"Connection closed: {client_id}")
@@ -158,7 +148,60 @@ class BLEWebSocketServer:
             self.clients.discard(websocket)
             logger.info(f"Client disconnected: {client_id}")
     
-    def process_ble_data(self, data: dict) -> bool:
+    def handle_message(self, message, client_id: str = "") -> Tuple[Dict, Optional[Dict]]:
+        """
+        ประมวลผลข้อความหนึ่งข้อความจาก Gateway (ไม่ขึ้นกับ WebSocket library ที่ใช้รับ)
+        
+        Args:
+            message: ข้อความ JSON
+            client_id: ID ของ connection (ใช้ใน log)
+            
+        Returns:
+            (response ที่จะตอบกลับ, reading ที่ต้องบันทึกก่อนตอบ หรือ None)
+        """
+        try:
+            # Parse JSON
+            data = json.loads(message)
+            
+            # ตรวจสอบ JWT Token
+            token = data.get('token', '')
+            
+            if not self.verify_jwt_token(token):
+                return {
+                    'status': 'error',
+                    'message': 'Invalid or expired token'
+                }, None
+            
+            # ประมวลผลข้อมูล
+            reading = self.process_ble_data(data)
+            
+            if not reading:
+                return {
+                    'status': 'error',
+                    'message': 'Failed to process data'
+                }, None
+            
+            self.total_messages += 1
+            return {
+                'status': 'success',
+                'message': 'Data received'
+            }, reading
+        
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON from {client_id}: {e}")
+            return {
+                'status': 'error',
+                'message': 'Invalid JSON format'
+            }, None
+        
+        except Exception as e:
+            logger.error(f"Error processing message from {client_id}: {e}", exc_info=True)
+            return {
+                'status': 'error',
+                'message': str(e)
+            }, None
+    
+    def process_ble_data(self, data: dict) -> Optional[Dict]:
         """
         ประมวลผลข้อมูล BLE
         
@@ -166,7 +209,7 @@ class BLEWebSocketServer:
             data: ข้อมูล BLE
             
         Returns:
-            True ถ้าประมวลผลสำเร็จ
+            reading ที่ประมวลผลแล้ว หรือ None ถ้าไม่สำเร็จ
         """
         try:
             # ตรวจสอบ required fields
@@ -174,14 +217,14 @@ class BLEWebSocketServer:
             for field in required_fields:
                 if field not in data:
                     logger.warning(f"Missing required field: {field}")
-                    return False
+                    return None
             
             # แปลง MAC Address
             gateway_mac = data.get('gateway_mac', '').replace(":", "").upper()
             tag_mac = data.get('tag_mac', '').replace(":", "").upper()
             
             # เก็บข้อมูล
-            self.latest_data[gateway_mac] = {
+            reading = {
                 'gateway_mac': gateway_mac,
                 'tag_mac': tag_mac,
                 'rssi': float(data.get('rssi', 0)),
@@ -189,20 +232,39 @@ class BLEWebSocketServer:
                 'battery': float(data.get('battery', 0)),
                 'temperature': float(data.get('temperature', 0)),
                 'humidity': float(data.get('humidity', 0)),
-                'timestamp': data.get('timestamp', time.time())
+                'timestamp': data.get('timestamp', time.time()),
+                'received_at': time.time()
             }
+            self.store_reading(reading)
+            if self.latency is not None:
+                self.latency.on_receive(reading)
             
             logger.info(f"Received data from Gateway {gateway_mac}: RSSI={data.get('rssi')} dBm")
             
-            # เรียก callback (ถ้ามี)
-            if self.on_data_callback:
-                self.on_data_callback(self.latest_data)
-            
-            return True
+            return reading
             
         except Exception as e:
             logger.error(f"Error processing BLE data: {e}", exc_info=True)
-            return False
+            return None
+    
+    def store_reading(self, reading: Dict):
+        """
+        เก็บ reading ที่ประมวลผลแล้ว (จาก process_ble_data หรือจาก ingest process ผ่าน reading ring)
+        
+        Args:
+            reading: reading dict
+        """
+        self.latest_data[reading['gateway_mac']] = reading
+        self.generation += 1
+        with self._readings_lock:
+            self.tag_readings.setdefault(reading['tag_mac'], {})[reading['gateway_mac']] = reading
+        
+        # เรียก callback (ถ้ามี)
+        if self.on_reading_callback:
+            self.on_reading_callback(reading)
+        
+        if self.on_data_callback:
+            self.on_data_callback(self.latest_data)
     
     def get_latest_data(self) -> Dict:
         """
@@ -213,6 +275,31 @@ class BLEWebSocketServer:
         """
         return self.latest_data
     
+    def snapshot_tag_readings(self, max_age: float) -> Dict[str, List[Dict]]:
+        """
+        ดึง readings ล่าสุดของทุก Tag ในครั้งเดียว (ลบ reading ที่เก่ากว่า max_age ทิ้ง)
+        
+        Args:
+            max_age: อายุสูงสุดของ reading (วินาที นับจาก received_at)
+            
+        Returns:
+            Dictionary ของ tag_mac -> รายการ readings (หนึ่งรายการต่อ Gateway)
+        """
+        cutoff = time.time() - max_age
+        snapshot = {}
+        
+        with self._readings_lock:
+            for tag_mac in list(self.tag_readings):
+                readings = self.tag_readings[tag_mac]
+                for gateway_mac in [mac for mac, r in readings.items() if r['received_at'] < cutoff]:
+                    del readings[gateway_mac]
+                if readings:
+                    snapshot[tag_mac] = list(readings.values())
+                else:
+                    del self.tag_readings[tag_mac]
+        
+        return snapshot
+    
     def get_statistics(self) -> Dict:
         """
         ดึงสถิติ
@@ -223,6 +310,7 @@ class BLEWebSocketServer:
         return {
             'total_messages': self.total_messages,
             'active_gateways': len(self.latest_data),
+            'active_tags': len(self.tag_readings),
             'connected_clients': len(self.clients)
         }
     
@@ -244,7 +332,7 @@ if __name__ == "__main__":
     server = BLEWebSocketServer(
         host="0.0.0.0",
         port=8012,
-        secret_key="ble-kku-secret-key-2025"
+        secret_key=SECRET_KEY
     )
     
     # สร้าง JWT Token
@@ -0,0 +1,299 @@
+"""
+Write-behind Writer
+รับข้อมูลจาก producer แบบไม่ block แล้วให้ background thread
+เขียนลงฐานข้อมูลเป็น batch (หนึ่ง transaction ต่อ batch)
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sentinel สำหรับบอก writer thread ให้ flush แล้วหยุด
+_STOP = object()
+
+# ข้อผิดพลาดที่เกิดจากข้อมูลของบาง item (แบ่ง batch เพื่อแยก item ที่เสียออกได้)
+# ข้อผิดพลาดอื่น เช่น sqlite3.OperationalError (database is locked, disk full) เป็นของทั้ง batch
+ITEM_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, ValueError, TypeError)
+
+
+class WriteBehindWriter:
+    """
+    Queue แบบจำกัดขนาด + background thread ที่ flush เมื่อครบ batch_size
+    หรือเมื่อรอครบ flush_interval วินาที
+    """
+
+    def __init__(self, flush_func: Callable[[List], None], name: str = "write-behind",
+                 max_queue: int = 100000, batch_size: int = 1000,
+                 flush_interval: float = 0.5, max_retries: int = 3, retry_delay: float = 0.1,
+                 item_errors: Tuple = ITEM_ERRORS):
+        """
+        เริ่มต้น WriteBehindWriter
+
+        Args:
+            flush_func: ฟังก์ชันที่รับ list ของ items แล้วเขียนลงฐานข้อมูลในครั้งเดียว
+            name: ชื่อ writer (ใช้เป็นชื่อ thread และใน log)
+            max_queue: จำนวน items สูงสุดที่รอเขียน (เกินนี้จะ drop)
+            batch_size: จำนวน items สูงสุดต่อ batch
+            flush_interval: เวลาสูงสุด (วินาที) ที่ item แรกของ batch จะรอ
+            max_retries: จำนวนครั้งที่ลอง flush batch ซ้ำเมื่อ flush_func ล้มเหลว (เช่น database locked)
+            retry_delay: เวลารอก่อนลองซ้ำครั้งแรก (วินาที, เพิ่มเป็นสองเท่าทุกครั้ง)
+            item_errors: ประเภทข้อผิดพลาดของ item (ทำให้แบ่ง batch แทนการลองซ้ำ)
+        """
+        self.flush_func = flush_func
+        self.name = name
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.item_errors = item_errors
+
+        # ฟังก์ชันที่รัน flush_func นอก event loop (เช่น eventlet.tpool.execute), None = เรียกตรง
+        self.offload: Optional[Callable] = None
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._metrics_lock = threading.Lock()
+
+        # Metrics
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        """
+        เริ่ม background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"{self.name} started (batch_size={self.batch_size}, "
+                    f"flush_interval={self.flush_interval}s, max_queue={self.max_queue})")
+
+    def submit(self, item) -> bool:
+        """
+        ส่ง item เข้าคิว (ไม่ block)
+
+        Args:
+            item: ข้อมูลที่จะส่งให้ flush_func
+
+        Returns:
+            True ถ้าเข้าคิวได้, False ถ้าคิวเต็ม (item ถูก drop)
+        """
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            with self._metrics_lock:
+                self.dropped += 1
+            return False
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Flush ข้อมูลที่ค้างอยู่ทั้งหมดแล้วหยุด thread
+
+        Args:
+            timeout: เวลาสูงสุด (วินาที) ที่รอให้ flush เสร็จ
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+
+        self._stop_event.set()
+        try:
+            # ปลุก thread ที่รออยู่ใน get (ถ้าคิวเต็ม thread ไม่ได้รออยู่แล้ว และจะเห็น _stop_event เอง)
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        logger.info(f"{self.name} stopped ({self.written} written, {self.dropped} dropped)")
+
+    def _run(self):
+        """
+        Loop ของ writer thread
+        """
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = self.flush_interval if not batch else max(0.0, deadline - time.monotonic())
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stopping = item is _STOP or self._stop_event.is_set()
+            if item is not None and item is not _STOP:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+                # ดึงที่เหลือในคิวมารวม batch โดยไม่ต้องรอ
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+            if stopping:
+                # เขียนส่วนที่เหลือในคิว (ถ้ามี) ก่อนหยุด
+                remaining = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        remaining.append(item)
+                for start in range(0, len(remaining), self.batch_size):
+                    self._flush(remaining[start:start + self.batch_size])
+                break
+
+    def _flush(self, batch: List):
+        """
+        เขียน batch ลงฐานข้อมูลและอัปเดต metrics
+
+        ถ้า flush_func ล้มเหลวด้วยข้อผิดพลาดของทั้ง batch (เช่น database locked): ลองซ้ำแบบ backoff
+        แล้วนับทั้ง batch เป็น failed ถ้าล้มเหลวด้วยข้อผิดพลาดของ item (item_errors): แบ่ง batch
+        ครึ่งหนึ่งไปเรื่อย ๆ เพื่อให้ items ที่ไม่มีปัญหาถูกเขียน ทั้งสองกรณี log ครั้งเดียวต่อ batch
+
+        Args:
+            batch: รายการ items
+        """
+        error = self._write(batch, self.max_retries)
+        if error is None:
+            return
+
+        failed = len(batch)
+        if isinstance(error, self.item_errors) and len(batch) > 1:
+            failed, error = self._bisect(batch)
+
+        logger.error(f"{self.name} failed to flush {failed} of {len(batch)} items: {error}",
+                     exc_info=(type(error), error, error.__traceback__))
+        with self._metrics_lock:
+            self.failed += failed
+
+    def _bisect(self, batch: List) -> Tuple[int, Exception]:
+        """
+        แบ่ง batch ที่ล้มเหลวด้วย item_errors ครึ่งหนึ่งไปเรื่อย ๆ จนเหลือเฉพาะ items ที่เขียนไม่ได้
+
+        ถ้าระหว่างแบ่งเจอข้อผิดพลาดของทั้ง batch จะหยุดแบ่งและนับส่วนที่เหลือทั้งหมดเป็น failed
+
+        Args:
+            batch: รายการ items (มากกว่า 1 item)
+
+        Returns:
+            (จำนวน items ที่เขียนไม่ได้, ข้อผิดพลาดล่าสุด)
+        """
+        failed = 0
+        error = None
+        middle = len(batch) // 2
+        pending = [batch[middle:], batch[:middle]]
+
+        while pending:
+            part = pending.pop()
+            part_error = self._write(part, 0)
+            if part_error is None:
+                continue
+            error = part_error
+            if not isinstance(error, self.item_errors):
+                failed += len(part) + sum(len(rest) for rest in pending)
+                break
+            if len(part) == 1:
+                failed += 1
+            else:
+                middle = len(part) // 2
+                pending.extend([part[middle:], part[:middle]])
+
+        return failed, error
+
+    def _write(self, batch: List, retries: int) -> Optional[Exception]:
+        """
+        เรียก flush_func หนึ่งครั้ง (ลองซ้ำได้ retries ครั้งสำหรับข้อผิดพลาดของทั้ง batch)
+
+        Args:
+            batch: รายการ items
+            retries: จำนวนครั้งที่ลองซ้ำได้
+
+        Returns:
+            None ถ้าเขียนสำเร็จ หรือข้อผิดพลาดครั้งสุดท้าย
+        """
+        started = time.perf_counter()
+
+        for attempt in range(retries + 1):
+            try:
+                if self.offload is not None:
+                    self.offload(self.flush_func, batch)
+                else:
+                    self.flush_func(batch)
+                error = None
+                break
+            except Exception as e:
+                error = e
+            if isinstance(error, self.item_errors) or attempt == retries:
+                return error
+            logger.warning(f"{self.name} failed to flush {len(batch)} items ({error}), retrying")
+            with self._metrics_lock:
+                self.retries += 1
+            time.sleep(self.retry_delay * (2 ** attempt))
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+        with self._metrics_lock:
+            self.written += len(batch)
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+        return None
+
+    def get_metrics(self) -> Dict:
+        """
+        ดึง metrics ของ writer
+
+        Returns:
+            Dictionary ของ metrics
+        """
+        with self._metrics_lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'queued': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'retries': self.retries,
+                'batches': self.batches,
+                'last_batch_size': self.last_batch_size,
+                'max_batch_size': self.max_batch_size,
+                'avg_batch_size': self.written / self.batches if self.batches else 0.0,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.batches, 3) if self.batches else 0.0
+            }